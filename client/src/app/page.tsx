@@ -1,12 +1,13 @@
 "use client";
 
 import dynamic from 'next/dynamic';
-import React, { useEffect } from "react";
+import React, { useEffect, useRef } from "react";
 import { motion } from "motion/react";
 import type { Position } from "@/components/ui/globe";
 import { useState, useMemo, useCallback } from 'react';
 import { Input } from "@/components/ui/input"
 import { Button } from "@/components/ui/button"
+import type { TracerouteErrorEvent, TracerouteGeolocationPatch, TracerouteHop } from "@/types/traceroute";
 
 // Move dynamic import completely outside (no hooks here)
 const World = dynamic(() => import("@/components/ui/globe").then(mod => ({ default: mod.World })), {
@@ -31,6 +32,7 @@ export default function Home() {
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [userLocation, setUserLocation] = useState({ lat: 45.4871, lng: -122.8033 }); // Default
+  const eventSourceRef = useRef<EventSource | null>(null);
 
   // Memoize the globe configuration to prevent unnecessary re-renders
   const memoizedGlobeConfig = useMemo(() => ({}), []);
@@ -62,7 +64,7 @@ export default function Home() {
 
 
 
-  const handleSubmit = useCallback(async (inputValue?: string) => {
+  const handleSubmit = useCallback((inputValue?: string) => {
     // Use provided input value or fall back to target state
     const currentTarget = inputValue || target;
     
@@ -72,112 +74,106 @@ export default function Home() {
       return;
     }
 
+    // Drop any trace that is still streaming
+    eventSourceRef.current?.close();
+
     // Set loading state
     setIsLoading(true);
     setError(null);
-
-    try {
-      // Make API request to backend
-      const response = await fetch("http://localhost:8000/api/v1/traceroute/", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ target: currentTarget.trim() }),
-      });
-
-      // Check if response is ok
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.detail || `HTTP ${response.status}: ${response.statusText}`);
-      }
-
-      // Parse the JSON response
-      const data = await response.json();
-      console.log("Raw API response:", data); // Debug log
-
-      // Validate the response structure
-      if (!data.hops || !Array.isArray(data.hops)) {
-        throw new Error("Invalid response format: missing or invalid hops array");
-      }
-
-      // Parse and filter hops with valid coordinates
-      const validHops = data.hops.filter((hop: any) => {
-        // Check if hop has valid coordinates
-        const hasValidCoords = hop.lat !== null && hop.lng !== null && 
-                             !isNaN(hop.lat) && !isNaN(hop.lng);
-        
-        if (!hasValidCoords) {
-          console.log(`Skipping hop ${hop.hop}: ${hop.ip} - no valid coordinates`);
+    setTracerouteData([]);
+
+    // Hops arrive one at a time (and geolocation patches after them), keyed by hop number
+    const hops = new Map<number, TracerouteHop>();
+    const hopColors = new Map<number, string>();
+    const colors = ["#E4DBA0", "#E5BB63", "#E07432"];
+
+    // Rebuild the globe arcs from every hop with valid coordinates seen so far
+    const renderHops = () => {
+      const validHops = [...hops.values()]
+        .sort((a, b) => a.hop - b.hop)
+        .filter((hop) => hop.lat !== null && hop.lng !== null && !isNaN(hop.lat) && !isNaN(hop.lng));
+
+      // Create arcs connecting all points in sequence, starting from your location
+      const positions: Position[] = validHops.map((hop, i) => {
+        const previous = i === 0 ? userLocation : { lat: validHops[i - 1].lat!, lng: validHops[i - 1].lng! };
+        if (!hopColors.has(hop.hop)) {
+          hopColors.set(hop.hop, colors[Math.floor(Math.random() * (colors.length - 1))]);
         }
-        
-        return hasValidCoords;
+        return {
+          order: i,
+          startLat: previous.lat,
+          startLng: previous.lng,
+          endLat: hop.lat!,
+          endLng: hop.lng!,
+          arcAlt: 0.1,
+          color: hopColors.get(hop.hop)!,
+        };
       });
 
-      console.log(`Found ${validHops.length} hops with valid coordinates out of ${data.hops.length} total hops`);
-
-      // Format data for the globe with connected path and different colors
-      const positions: Position[] = [];
-      
-      // Add your starting location (customize this to your location)
-      const startLocation = userLocation;
-      
-      // Create arcs connecting all points in sequence
-      for (let i = 0; i < validHops.length; i++) {
-        const hop = validHops[i];
-        const colors = ["#E4DBA0", "#E5BB63", "#E07432"];
-        
-        if (i === 0) {
-          // First arc: from start location to first hop
-          positions.push({
-            order: i,
-            startLat: startLocation.lat,
-            startLng: startLocation.lng,
-            endLat: hop.lat,
-            endLng: hop.lng,
-            arcAlt: 0.1,
-            color: colors[Math.floor(Math.random() * (colors.length - 1))],
+      setTracerouteData(positions);
+      return validHops.length;
+    };
 
-          });
-        } else {
-          // Subsequent arcs: from previous hop to current hop
-          const previousHop = validHops[i - 1];
-          positions.push({
-            order: i,
-            startLat: previousHop.lat,
-            startLng: previousHop.lng,
-            endLat: hop.lat,
-            endLng: hop.lng,
-            arcAlt: 0.1,
-            color: colors[Math.floor(Math.random() * (colors.length - 1))],
+    const params = new URLSearchParams({ target: currentTarget.trim() });
+    const source = new EventSource(`http://localhost:8000/api/v1/traceroute/stream?${params}`);
+    eventSourceRef.current = source;
 
-          });
-        }
+    const finish = () => {
+      source.close();
+      if (eventSourceRef.current === source) {
+        eventSourceRef.current = null;
       }
+      setIsLoading(false);
+    };
+
+    source.addEventListener("hop", (e) => {
+      const hop: TracerouteHop = JSON.parse((e as MessageEvent).data);
+      hops.set(hop.hop, hop);
+      renderHops();
+    });
+
+    source.addEventListener("geolocation", (e) => {
+      const patch: TracerouteGeolocationPatch = JSON.parse((e as MessageEvent).data);
+      const hop = hops.get(patch.hop);
+      if (hop) {
+        hops.set(patch.hop, { ...hop, ...patch });
+        renderHops();
+      }
+    });
 
-      console.log("Formatted positions for globe:", positions); // Debug log
+    source.addEventListener("done", () => {
+      const validHopCount = renderHops();
+      console.log(`Found ${validHopCount} hops with valid coordinates out of ${hops.size} total hops`);
 
-      // Update state
-      setTracerouteData(positions);
-      
       // Clear the input field after successful submission
       setTarget("");
-      
-      // Show success message
-      if (validHops.length === 0) {
+
+      if (validHopCount === 0) {
         setError("No hops with valid coordinates found. Try a different target.");
-      } else {
-        setError(null);
       }
+      finish();
+    });
 
-    } catch (err) {
-      console.error("Error parsing traceroute response:", err);
-      setError(err instanceof Error ? err.message : 'An error occurred');
+    source.addEventListener("trace_error", (e) => {
+      const data: TracerouteErrorEvent = JSON.parse((e as MessageEvent).data);
+      setError(data.error);
       setTracerouteData([]);
-    } finally {
-      setIsLoading(false);
-    }
-  }, [userLocation]);
+      finish();
+    });
+
+    // Connection-level failure (server down, CORS, ...); EventSource would otherwise retry forever
+    source.onerror = () => {
+      if (eventSourceRef.current === source) {
+        setError("Lost connection to the traceroute server");
+        finish();
+      }
+    };
+  }, [target, userLocation]);
+
+  // Close any open stream when the page unmounts
+  useEffect(() => {
+    return () => eventSourceRef.current?.close();
+  }, []);
 
   // Memoize the input change handler
   const handleInputChange = useCallback((e: React.ChangeEvent<HTMLInputElement>) => {
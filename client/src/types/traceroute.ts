@@ -25,3 +25,27 @@ export interface TracerouteResponse {
   target: string;
   hops: TracerouteHop[];
 }
+
+// Events sent by /api/v1/traceroute/stream (SSE) and /api/v1/traceroute/ws
+export interface TracerouteGeolocationPatch {
+  hop: number;
+  ip: string;
+  geolocation: GeolocationData;
+  lat: number | null;
+  lng: number | null;
+}
+
+export interface TracerouteDoneEvent {
+  target: string;
+  hops: number;
+}
+
+export interface TracerouteErrorEvent {
+  error: string;
+}
+
+export type TracerouteStreamEvent =
+  | { event: "hop"; data: TracerouteHop }
+  | { event: "geolocation"; data: TracerouteGeolocationPatch }
+  | { event: "done"; data: TracerouteDoneEvent }
+  | { event: "trace_error"; data: TracerouteErrorEvent };
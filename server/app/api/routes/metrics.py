@@ -0,0 +1,48 @@
+import asyncio
+import time
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Dict, Optional
+from app.services.hop_metrics_service import HopMetricsService
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+class HopSeriesResponse(BaseModel):
+    target: str
+    start: float
+    end: float
+    resolution: str  # "raw", "1m" or "1h"
+    series: List[Dict]  # Per (hop, ip): raw {time, rtt} points or {time, count, min, avg, p95} buckets
+
+def _require_store():
+    if not HopMetricsService.enabled():
+        raise HTTPException(status_code=503, detail="Hop metrics are disabled (set HOP_METRICS_ENABLED)")
+
+@router.get("/hops", response_model=HopSeriesResponse)
+async def get_hop_series(target: str, start: Optional[float] = None, end: Optional[float] = None,
+                         resolution: str = "auto", ttl: Optional[int] = None):
+    """
+    RTT history of a target's hops between start and end (Unix seconds, default: the last hour).
+    resolution is raw, 1m, 1h or auto (raw up to two hours, 1m up to three days, 1h beyond)
+    """
+    _require_store()
+    if not target:
+        raise HTTPException(status_code=400, detail="Target is required")
+
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 3600
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    result = await asyncio.to_thread(HopMetricsService.query, target, start, end, resolution, ttl)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/targets")
+async def list_metric_targets():
+    """
+    Targets with recorded hop samples and how many (hop, ip) series each has
+    """
+    _require_store()
+    return {"targets": await asyncio.to_thread(HopMetricsService.targets)}
@@ -0,0 +1,128 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Dict, Optional
+from app.core.config import settings
+from app.services.monitor_service import MonitorService
+from app.api.routes.traceroute import _sse
+
+router = APIRouter(prefix="/monitors", tags=["monitors"])
+
+class MonitorRequest(BaseModel):
+    target: str
+    interval: Optional[float] = None  # Seconds; defaults to monitor_default_interval
+    incremental: bool = True  # Re-probe only the hops likely to change between full traces
+
+class BulkMonitorRequest(BaseModel):
+    targets: List[str]
+    interval: Optional[float] = None
+    incremental: bool = True
+
+class MonitorResponse(BaseModel):
+    monitor_id: str
+    target: str
+    destination: Optional[str] = None
+    interval: float
+    incremental: bool
+    created_at: float
+    last_run_at: Optional[float] = None
+    next_run_in: Optional[float] = None  # Seconds until the next run
+    running: bool = False
+    path_length: int = 0
+    reached: bool = False
+    runs: int = 0
+    full_traces: int = 0
+    incremental_runs: int = 0
+    ttls_probed: int = 0
+    events: int = 0
+    last_error: Optional[str] = None
+    path: List[Dict] = []  # Stored path with RTT baselines, on single-monitor requests only
+
+class MonitorListResponse(BaseModel):
+    total: int
+    monitors: List[MonitorResponse]
+    next_offset: int = 0
+
+class MonitorEventsResponse(BaseModel):
+    events: List[Dict]
+    next_since: int = 0
+
+def _check_capacity(count: int, interval: Optional[float]):
+    if interval is not None and interval < settings.monitor_min_interval:
+        raise HTTPException(
+            status_code=400,
+            detail=f"interval must be at least {settings.monitor_min_interval} seconds"
+        )
+    if MonitorService.count() + count > settings.monitor_max_targets:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.monitor_max_targets} monitored targets"
+        )
+
+@router.post("/", response_model=MonitorResponse)
+async def add_monitor(request: MonitorRequest):
+    """
+    Start monitoring a target: it is traced every interval and compared against its last path
+    """
+    target = request.target.strip()
+    if not target:
+        raise HTTPException(status_code=400, detail="Target is required")
+    _check_capacity(1, request.interval)
+
+    return MonitorService.add(target, request.interval, request.incremental).summary()
+
+@router.post("/bulk", response_model=MonitorListResponse)
+async def add_monitors(request: BulkMonitorRequest):
+    """
+    Start monitoring many targets with the same interval; their first runs are spread over it
+    """
+    # Blank entries are dropped and duplicates registered once
+    targets = list(dict.fromkeys(target.strip() for target in request.targets if target.strip()))
+    if not targets:
+        raise HTTPException(status_code=400, detail="At least one target is required")
+    _check_capacity(len(targets), request.interval)
+
+    monitors = [MonitorService.add(target, request.interval, request.incremental).summary() for target in targets]
+    return MonitorListResponse(total=MonitorService.count(), monitors=monitors, next_offset=0)
+
+@router.get("/", response_model=MonitorListResponse)
+async def list_monitors(offset: int = 0, limit: int = 50):
+    """
+    Registered targets in registration order, offset..offset+limit
+    """
+    return MonitorService.page(max(0, offset), max(0, min(limit, 500)))
+
+@router.get("/events", response_model=MonitorEventsResponse)
+async def get_monitor_events(since: int = 0, limit: int = 100, monitor_id: Optional[str] = None):
+    """
+    Path-change events (hop_changed, hop_silent, rtt_shift, path_length) with an id above since;
+    poll with next_since
+    """
+    return MonitorService.events(max(0, since), max(0, min(limit, 1000)), monitor_id)
+
+@router.get("/events/stream")
+async def stream_monitor_events(since: Optional[int] = None, monitor_id: Optional[str] = None):
+    """
+    Stream path-change events as Server-Sent Events as they are detected, one per event type name
+    """
+    return _sse(MonitorService.stream(since, monitor_id))
+
+@router.get("/{monitor_id}", response_model=MonitorResponse)
+async def get_monitor(monitor_id: str):
+    """
+    A monitored target's state and its last stored path
+    """
+    monitor = MonitorService.get(monitor_id)
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="Unknown monitor")
+
+    return monitor.detail()
+
+@router.delete("/{monitor_id}")
+async def delete_monitor(monitor_id: str):
+    """
+    Stop monitoring a target
+    """
+    if not MonitorService.remove(monitor_id):
+        raise HTTPException(status_code=404, detail="Unknown monitor")
+
+    return {"monitor_id": monitor_id, "deleted": True}
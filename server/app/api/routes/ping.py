@@ -0,0 +1,71 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Dict, Optional
+from app.core.config import settings
+from app.services.ping_service import PingService
+from app.api.routes.traceroute import _sse
+
+router = APIRouter(prefix="/ping", tags=["ping"])
+
+class PingSweepRequest(BaseModel):
+    targets: List[str]
+    count: Optional[int] = None  # Echo requests per host; defaults to ping_default_count
+    pps: Optional[float] = None  # Packets per second for the whole sweep; defaults to ping_default_pps
+
+class PingSweepResponse(BaseModel):
+    sweep_id: str
+    total: int
+    completed: int
+    reachable: int
+    count: int
+    pps: float
+    probes_sent: int
+    done: bool
+    elapsed: float
+    results: List[Dict] = []  # Per host: sent, received, loss (%), min/avg/max/stddev (ms) or an error
+    next_offset: int = 0
+
+@router.post("/", response_model=PingSweepResponse)
+async def start_ping_sweep(request: PingSweepRequest):
+    """
+    Ping many hosts at a paced rate over the shared probe socket. Returns at once with a sweep_id; fetch
+    per-host summaries from GET /ping/{sweep_id} or as hosts finish from GET /ping/{sweep_id}/stream
+    """
+    # Blank entries are dropped and duplicates pinged once
+    targets = list(dict.fromkeys(target.strip() for target in request.targets if target.strip()))
+    if not targets:
+        raise HTTPException(status_code=400, detail="At least one target is required")
+    if len(targets) > settings.ping_max_targets:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ping_max_targets} targets per sweep")
+    if request.count is not None and not 1 <= request.count <= settings.ping_max_count:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {settings.ping_max_count}")
+    if request.pps is not None and request.pps <= 0:
+        raise HTTPException(status_code=400, detail="pps must be positive")
+
+    try:
+        sweep = PingService.start_sweep(targets, count=request.count, pps=request.pps)
+    except PermissionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return PingService.page(sweep, 0, 0)
+
+@router.get("/{sweep_id}", response_model=PingSweepResponse)
+async def get_ping_sweep(sweep_id: str, offset: int = 0, limit: int = 100):
+    """
+    Finished hosts of a sweep in completion order, offset..offset+limit; poll with next_offset
+    """
+    sweep = PingService.get_sweep(sweep_id)
+    if sweep is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired sweep")
+
+    return PingService.page(sweep, max(0, offset), max(0, min(limit, 1000)))
+
+@router.get("/{sweep_id}/stream")
+async def stream_ping_sweep(sweep_id: str):
+    """
+    Stream a sweep as Server-Sent Events: a "result" event per finished host, then "done"
+    """
+    sweep = PingService.get_sweep(sweep_id)
+    if sweep is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired sweep")
+
+    return _sse(PingService.stream(sweep))
@@ -1,7 +1,19 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict
+import json
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Optional
+from app.core.config import settings
+from app.services.address_resolver import AddressResolver
+from app.services.batch_traceroute_service import BatchTracerouteService
+from app.services.hop_metrics_service import HopMetricsService
+from app.services.local_topology import LocalTopology
+from app.services.monitor_service import MonitorService
+from app.services.multipath_traceroute_service import MultipathTracerouteService
+from app.services.ping_service import PingService
+from app.services.rtt_estimator import RttEstimator
 from app.services.traceroute_service import TracerouteService
+from app.services.geolocation_service import GeolocationService
 
 router = APIRouter(prefix="/traceroute", tags=["traceroute"])
 
@@ -14,6 +26,56 @@ class TracerouteResponse(BaseModel):
     hops: List[Dict]
     success: bool
     error: str = None
+    cached: bool = False  # Served from a trace that finished earlier
+    age: float = 0.0  # Seconds since that trace finished
+
+class BatchTracerouteRequest(BaseModel):
+    targets: List[str]
+    include_geolocation: bool = True
+
+class BatchTracerouteResult(BaseModel):
+    target: str
+    hops: List[Dict]
+    success: bool
+    error: Optional[str] = None
+    cached: bool = False
+    age: float = 0.0
+
+class BatchTracerouteResponse(BaseModel):
+    batch_id: str
+    total: int
+    completed: int
+    succeeded: int
+    done: bool
+    elapsed: float
+    results: List[BatchTracerouteResult] = []
+    next_offset: int = 0
+
+class MultipathTracerouteRequest(BaseModel):
+    target: str
+    include_geolocation: bool = True
+    max_probes_per_hop: Optional[int] = None  # Defaults to multipath_max_probes_per_hop
+
+class MultipathTracerouteResponse(BaseModel):
+    target: str
+    destination: Optional[str] = None
+    hops: List[Dict]  # Per TTL: the set of interfaces answering it
+    edges: List[Dict]  # Path graph: links between interfaces seen on the same flow
+    probes_sent: int = 0
+    success: bool
+    error: Optional[str] = None
+
+def _sse(events):
+    """Wrap an async iterator of {"event", "data"} dicts as a Server-Sent Events response"""
+    async def event_source():
+        async for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/", response_model=TracerouteResponse)
 async def run_traceroute(request: TracerouteRequest):
@@ -25,9 +87,9 @@ async def run_traceroute(request: TracerouteRequest):
         if not request.target:
             raise HTTPException(status_code=400, detail="Target is required")
         
-        # Run traceroute with geolocation
-        hops = TracerouteService.run_traceroute(
-            request.target, 
+        # Run traceroute with geolocation (or reuse a recent/running identical trace)
+        hops, cached, age = await TracerouteService.run_traceroute_cached(
+            request.target,
             include_geolocation=request.include_geolocation
         )
         
@@ -43,15 +105,134 @@ async def run_traceroute(request: TracerouteRequest):
         return TracerouteResponse(
             target=request.target,
             hops=hops,
-            success=True
+            success=True,
+            cached=cached,
+            age=age
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/stream")
+async def stream_traceroute(target: str, include_geolocation: bool = True):
+    """
+    Stream traceroute progress as Server-Sent Events: one "hop" event per hop as soon as it is
+    parsed, "geolocation" patches as locations resolve, then "done" or "trace_error"
+    """
+    if not target:
+        raise HTTPException(status_code=400, detail="Target is required")
+
+    return _sse(TracerouteService.stream_traceroute(target, include_geolocation=include_geolocation))
+
+@router.post("/batch", response_model=BatchTracerouteResponse)
+async def start_batch_traceroute(request: BatchTracerouteRequest):
+    """
+    Trace many targets through the shared scheduler. Returns at once with a batch_id; fetch results
+    page by page from GET /batch/{batch_id} or as they finish from GET /batch/{batch_id}/stream
+    """
+    # Blank entries are dropped and duplicates traced once
+    targets = list(dict.fromkeys(target.strip() for target in request.targets if target.strip()))
+    if not targets:
+        raise HTTPException(status_code=400, detail="At least one target is required")
+    if len(targets) > settings.batch_max_targets:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.batch_max_targets} targets per batch"
+        )
+
+    job = BatchTracerouteService.start_batch(targets, include_geolocation=request.include_geolocation)
+    return BatchTracerouteService.page(job, 0, 0)
+
+@router.get("/batch/{batch_id}", response_model=BatchTracerouteResponse)
+async def get_batch_traceroute(batch_id: str, offset: int = 0, limit: int = 50):
+    """
+    Finished results of a batch in completion order, offset..offset+limit; poll with next_offset
+    """
+    job = BatchTracerouteService.get_batch(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired batch")
+
+    return BatchTracerouteService.page(job, max(0, offset), max(0, min(limit, 500)))
+
+@router.get("/batch/{batch_id}/stream")
+async def stream_batch_traceroute(batch_id: str):
+    """
+    Stream a batch as Server-Sent Events: a "result" event per finished target, then "done"
+    """
+    job = BatchTracerouteService.get_batch(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired batch")
+
+    return _sse(BatchTracerouteService.stream(job))
+
+@router.post("/multipath", response_model=MultipathTracerouteResponse)
+async def run_multipath_traceroute(request: MultipathTracerouteRequest):
+    """
+    Discover load-balanced (ECMP) paths: every interface answering each TTL plus the graph linking them.
+    Needs the native ICMP engine (raw sockets)
+    """
+    if not request.target:
+        raise HTTPException(status_code=400, detail="Target is required")
+    if request.max_probes_per_hop is not None and request.max_probes_per_hop < 1:
+        raise HTTPException(status_code=400, detail="max_probes_per_hop must be positive")
+
+    try:
+        result = await MultipathTracerouteService.run_multipath(
+            request.target,
+            include_geolocation=request.include_geolocation,
+            max_probes_per_hop=request.max_probes_per_hop
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if "error" in result:
+        return MultipathTracerouteResponse(target=request.target, hops=[], edges=[], success=False,
+                                           error=result["error"])
+
+    return MultipathTracerouteResponse(target=request.target, success=True, **result)
+
+@router.websocket("/ws")
+async def traceroute_websocket(websocket: WebSocket):
+    """
+    WebSocket variant of /stream. Each JSON message shaped like TracerouteRequest starts a trace
+    whose events are sent back as {"event": ..., "data": ...} objects
+    """
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                request = TracerouteRequest.model_validate(await websocket.receive_json())
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"event": "trace_error", "data": {"error": f"Invalid request: {e}"}})
+                continue
+
+            if not request.target:
+                await websocket.send_json({"event": "trace_error", "data": {"error": "Target is required"}})
+                continue
+
+            async for event in TracerouteService.stream_traceroute(
+                request.target,
+                include_geolocation=request.include_geolocation
+            ):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+
 @router.get("/health")
 async def health_check():
     """
     Health check endpoint
     """
-    return {"status": "healthy", "service": "traceroute"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "service": "traceroute",
+        "geolocation_cache": GeolocationService.cache_stats(),
+        "trace_cache": TracerouteService.cache_stats(),
+        "batch_scheduler": BatchTracerouteService.stats(),
+        "rtt_estimates": RttEstimator.get_instance().stats(),
+        "doubletree": LocalTopology.get_instance().stats(),
+        "dns_cache": AddressResolver.stats(),
+        "monitors": MonitorService.stats(),
+        "hop_metrics": HopMetricsService.stats(),
+        "ping": PingService.stats()
+    }
\ No newline at end of file
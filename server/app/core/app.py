@@ -1,11 +1,27 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.services.geolocation_service import GeolocationService
+from app.services.hop_metrics_service import HopMetricsService
+from app.services.icmp_transport import IcmpTransport
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Pooled ip-api connections, the persistent store and the database are released on shutdown
+    await GeolocationService.aclose()
+    # Queued hop samples are written before the store closes
+    await asyncio.to_thread(HopMetricsService.close)
+    # Stop the probe reader thread and close the shared probe sockets (a no-op if they were never opened)
+    IcmpTransport.shutdown()
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title=settings.project_name,
-        openapi_url=f"{settings.api_v1_str}/openapi.json"
+        openapi_url=f"{settings.api_v1_str}/openapi.json",
+        lifespan=lifespan
     )
     
     # Add CORS middleware
@@ -1,5 +1,6 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # API Configuration
@@ -16,7 +17,116 @@ class Settings(BaseSettings):
     max_hops: int = 15  # Reduced from 20 to avoid too many * responses
     timeout: int = 2    # Increased from 1 to give more time for responses
     command_timeout: int = 20  # Reduced from 30 for faster overall response
-    
+    probes_per_hop: int = 1  # Probes per TTL, all in flight at once; above 1 every hop also reports "stats"
+    probe_percentiles: List[float] = []  # Percentiles added to those stats from a fixed-size sketch, e.g. [50, 95]
+
+    # Probe backend: "subprocess" forks the traceroute binary, "icmp" uses the native
+    # parallel-TTL engine (falls back to subprocess when no probe socket mode is available)
+    traceroute_backend: str = "subprocess"
+    icmp_receive_buffer: int = 4 * 1024 * 1024  # Shared ICMP socket receive buffer (bytes)
+    # Native engine sockets: "raw" (root/CAP_NET_RAW), "icmp-dgram" (ping sockets, net.ipv4.ping_group_range),
+    # "udp" (no privileges; UDP probes), or "auto" for the first of those this process may open
+    probe_socket_mode: str = "auto"
+    prefer_ipv6: bool = False  # Dual-stack targets: trace the IPv6 address instead of the IPv4 one
+    dns_cache_size: int = 4096  # Resolved hostnames kept for the probe engines
+    dns_cache_ttl: float = 300  # Seconds a resolved hostname is reused
+
+    # Stop conditions: a trace also ends at the destination or at the first unreachable reply
+    trace_max_silent_hops: int = 5  # Consecutive silent TTLs after which the path counts as dark (0 = never)
+    trace_time_budget: float = 15  # Seconds before a trace ends with the hops it has (0 = no budget)
+    trace_probe_window: int = 8  # Native engine: TTLs in flight at once (0 sends every TTL up front)
+
+    # Doubletree (native engine): skip the near-side hops every trace from this host shares
+    doubletree_enabled: bool = True
+    doubletree_max_start_ttl: int = 6  # Deepest TTL a trace may start probing at
+    doubletree_min_traces: int = 3  # Traces that must agree on a near hop before it is skipped
+    doubletree_ttl: float = 300  # Seconds a learned near hop stays in the stop set
+
+    # Adaptive probe deadlines (native engine): RTT estimates per destination and prefix replace the fixed
+    # timeout, which stays the ceiling; silent TTLs are given up once deeper TTLs have answered
+    adaptive_timeout: bool = True
+    adaptive_timeout_min: float = 0.5  # Floor for estimated deadlines (seconds)
+    rtt_estimator_size: int = 10000  # Destinations (and as many prefixes) remembered
+    rtt_estimator_ttl: float = 3600  # Seconds an estimate lives without new samples
+
+    # Trace result cache: identical traces within the TTL are served from memory, concurrent ones share a run
+    trace_cache_ttl: float = 30  # Seconds a finished trace is reused (0 disables caching and coalescing)
+    trace_cache_size: int = 256  # Max cached traces
+
+    # Batch traces: many targets per request, admitted by one process-wide scheduler
+    batch_max_targets: int = 500  # Targets accepted per batch request
+    batch_max_outstanding_probes: int = 256  # Global probe budget; each running trace holds window x probes_per_hop
+    batch_max_jobs: int = 100  # Batch jobs kept for paging/streaming
+    batch_result_ttl: float = 600  # Seconds a batch job's results stay readable
+
+    # Multipath discovery (native engine only): per-TTL ECMP next-hop enumeration
+    multipath_max_probes_per_hop: int = 96  # Probe cap per TTL (enough to rule out a 17th next hop at 95%)
+
+    # Path monitoring: registered targets re-traced on an interval, with path-change events
+    monitor_max_targets: int = 10000  # Targets one process monitors
+    monitor_min_interval: float = 10  # Shortest accepted interval (seconds)
+    monitor_default_interval: float = 300  # Interval for targets registered without one (seconds)
+    monitor_jitter: float = 0.1  # Every interval is stretched or shrunk by up to this fraction
+    monitor_incremental: bool = True  # Native engine: between full traces re-probe only the TTLs likely to change
+    monitor_full_trace_every: int = 10  # Incremental mode: every Nth run is a full trace anyway
+    monitor_sample_ttls: int = 2  # Incremental mode: stable TTLs re-checked per run, round robin
+    monitor_rtt_shift_ms: float = 20  # Smallest change from a hop's smoothed RTT that counts as a shift
+    monitor_rtt_shift_samples: int = 2  # Consecutive shifted samples before an rtt_shift event
+    monitor_event_history: int = 10000  # Path-change events kept for the events endpoints
+
+    # Ping sweeps: echo requests to many hosts over the shared probe socket, paced in packets per second
+    ping_max_targets: int = 10000  # Hosts accepted per sweep
+    ping_default_count: int = 4  # Echo requests per host
+    ping_max_count: int = 100
+    ping_default_pps: float = 500  # Sweep send rate when the request sets none
+    ping_max_pps: float = 5000  # Cap on every sweep, and on all sweeps together
+    ping_timeout: float = 2  # Seconds to wait for an echo reply (shortened by the RTT estimator)
+    ping_max_sweeps: int = 100  # Sweeps kept for paging/streaming
+    ping_result_ttl: float = 600  # Seconds a sweep's results stay readable
+
+    # Hop RTT history: every answered hop becomes a (target, ttl, ip) time-series sample
+    hop_metrics_enabled: bool = False
+    hop_metrics_path: Optional[str] = None  # Defaults to data/hop_metrics.sqlite3
+    hop_metrics_flush_interval: float = 5  # Seconds samples accumulate before one batched write
+    hop_metrics_queue_size: int = 100000  # Samples waiting for the writer; beyond this new ones are dropped
+    hop_metrics_raw_retention: float = 2 * 24 * 3600  # Seconds raw samples are kept
+    hop_metrics_minute_retention: float = 30 * 24 * 3600  # Seconds 1m rollups are kept
+    hop_metrics_hour_retention: float = 365 * 24 * 3600  # Seconds 1h rollups are kept
+
+    # Geolocation Configuration
+    # "api-first" asks ip-api.com before the local database; "local-first" answers from the database
+    # immediately and upgrades the record from ip-api.com in the background
+    geolocation_policy: str = "api-first"
+    geolocation_api_url: str = "http://ip-api.com"  # Point at a local stub for offline testing
+    geolocation_batch_window: float = 0.05  # Seconds streamed hops wait to share one batch lookup
+    geolocation_api_requests_per_minute: float = 45  # ip-api.com free tier limit for /json
+    geolocation_api_batch_requests_per_minute: float = 15  # ... and for /batch
+    geolocation_api_max_concurrency: int = 4  # API requests in flight per process
+    geolocation_cache_size: int = 50000  # Max cached IPs (LRU eviction beyond this)
+    geolocation_cache_ttl: float = 7 * 24 * 3600  # Seconds a resolved location stays cached
+    geolocation_negative_cache_ttl: float = 300  # Seconds before a failed lookup is retried
+    geolocation_store_enabled: bool = False  # Persistent SQLite tier shared by workers and restarts
+    geolocation_store_path: Optional[str] = None  # Defaults to data/geolocation_cache.sqlite3
+    geolocation_store_preload: int = 20000  # Most recent entries loaded into memory at startup
+    geolocation_index_enabled: bool = True  # Compile the IP2Location BIN into a memory-mapped range index
+    geolocation_index_path: Optional[str] = None  # Defaults to the BIN path with an .idx suffix
+
+    @field_validator("max_hops")
+    @classmethod
+    def _check_max_hops(cls, value: int) -> int:
+        # The IP TTL field is one byte, and the native engine keeps the TTL in the low byte of the sequence
+        if not 1 <= value <= 255:
+            raise ValueError("max_hops must be between 1 and 255")
+        return value
+
+    @field_validator("probes_per_hop")
+    @classmethod
+    def _check_probes_per_hop(cls, value: int) -> int:
+        # The native engine keeps the probe's index in the high byte of the 16-bit sequence number
+        if not 1 <= value <= 256:
+            raise ValueError("probes_per_hop must be between 1 and 256")
+        return value
+
     class Config:
         env_file = ".env"
 
@@ -9,7 +9,11 @@ import os
 from socket import *
 import struct
 import time
-import select
+from app.services.address_resolver import AddressResolver
+from app.services.icmp_packet_builder import internet_checksum
+from app.services.icmp_transport import IcmpTransport
+from app.services.probe_stats import ProbeStats
+from app.services.rtt_estimator import RttEstimator
 
 
 # #################################################################################################################### #
@@ -54,22 +58,38 @@ class IcmpHelperLibrary:
         #                                                                                                              #
         #                                                                                                              #
         # ############################################################################################################ #
-        __icmpTarget = ""               # Remote Host
-        __destinationIpAddress = ""     # Remote Host IP Address
-        __header = b''                  # Header after byte packing
-        __data = b''                    # Data after encoding
-        __dataRaw = ""                  # Raw string data before encoding
-        __icmpType = 0                  # Valid values are 0-255 (unsigned int, 8 bits)
-        __icmpCode = 0                  # Valid values are 0-255 (unsigned int, 8 bits)
-        __packetChecksum = 0            # Valid values are 0-65535 (unsigned short, 16 bits)
-        __packetIdentifier = 0          # Valid values are 0-65535 (unsigned short, 16 bits)
-        __packetSequenceNumber = 0      # Valid values are 0-65535 (unsigned short, 16 bits)
-        __ipTimeout = 10
-        __ttl = 255                     # Time to live
-        __rtt = 0
+        # Per-instance state lives in slots (no __dict__ per probe); defaults are set in __init__
+        __slots__ = ("__icmpTarget", "__destinationIpAddress", "__header", "__data", "__dataRaw", "__icmpType",
+                     "__icmpCode", "__packetChecksum", "__packetIdentifier", "__packetSequenceNumber",
+                     "__ipTimeout", "__ttl", "__rtt")
+
+        __HEADER_STRUCT = struct.Struct("!BBHHH")   # Type, Code, Checksum, Identifier, Sequence Number
+        __TIME_STRUCT = struct.Struct("d")          # Send timestamp at the start of the data
 
         __DEBUG_IcmpPacket = False      # Allows for debug output
 
+        # ############################################################################################################ #
+        # IcmpPacket Constructors                                                                                      #
+        #                                                                                                              #
+        #                                                                                                              #
+        #                                                                                                              #
+        #                                                                                                              #
+        # ############################################################################################################ #
+        def __init__(self):
+            self.__icmpTarget = ""              # Remote Host
+            self.__destinationIpAddress = ""    # Remote Host IP Address
+            self.__header = b''                 # Header after byte packing
+            self.__data = b''                   # Data after encoding
+            self.__dataRaw = ""                 # Raw string data before encoding
+            self.__icmpType = 0                 # Valid values are 0-255 (unsigned int, 8 bits)
+            self.__icmpCode = 0                 # Valid values are 0-255 (unsigned int, 8 bits)
+            self.__packetChecksum = 0           # Valid values are 0-65535 (unsigned short, 16 bits)
+            self.__packetIdentifier = 0         # Valid values are 0-65535 (unsigned short, 16 bits)
+            self.__packetSequenceNumber = 0     # Valid values are 0-65535 (unsigned short, 16 bits)
+            self.__ipTimeout = None             # Seconds to wait; None derives it from the RTT estimate (max 10)
+            self.__ttl = 255                    # Time to live
+            self.__rtt = 0
+
         # ############################################################################################################ #
         # IcmpPacket Class Getters                                                                                     #
         #                                                                                                              #
@@ -100,10 +120,19 @@ class IcmpHelperLibrary:
 
         def getTtl(self):
             return self.__ttl
+
+        def getIpTimeout(self):
+            return self.__ipTimeout
         
         def getRtt(self):
             return self.__rtt
 
+        def getDestinationIpAddress(self):
+            return self.__destinationIpAddress
+
+        def getPacketBytes(self):
+            return b''.join([self.__header, self.__data])
+
         # ############################################################################################################ #
         # IcmpPacket Class Setters                                                                                     #
         #                                                                                                              #
@@ -116,7 +145,7 @@ class IcmpHelperLibrary:
 
             # Only attempt to get destination address if it is not whitespace
             if len(self.__icmpTarget.strip()) > 0:
-                self.__destinationIpAddress = gethostbyname(self.__icmpTarget.strip())
+                self.__destinationIpAddress = AddressResolver.resolve(self.__icmpTarget)
 
         def setIcmpType(self, icmpType):
             self.__icmpType = icmpType
@@ -135,6 +164,9 @@ class IcmpHelperLibrary:
 
         def setTtl(self, ttl):
             self.__ttl = ttl
+
+        def setIpTimeout(self, ipTimeout):
+            self.__ipTimeout = ipTimeout
         
         def setRtt(self, rtt):
             self.__rtt = rtt
@@ -148,37 +180,9 @@ class IcmpHelperLibrary:
         # ############################################################################################################ #
         def __recalculateChecksum(self):
             print("calculateChecksum Started...") if self.__DEBUG_IcmpPacket else 0
-            packetAsByteData = b''.join([self.__header, self.__data])
-            checksum = 0
-
-            # This checksum function will work with pairs of values with two separate 16 bit segments. Any remaining
-            # 16 bit segment will be handled on the upper end of the 32 bit segment.
-            countTo = (len(packetAsByteData) // 2) * 2
-
-            # Calculate checksum for all paired segments
-            print(f'{"Count":10} {"Value":10} {"Sum":10}') if self.__DEBUG_IcmpPacket else 0
-            count = 0
-            while count < countTo:
-                thisVal = packetAsByteData[count + 1] * 256 + packetAsByteData[count]
-                checksum = checksum + thisVal
-                checksum = checksum & 0xffffffff        # Capture 16 bit checksum as 32 bit value
-                print(f'{count:10} {hex(thisVal):10} {hex(checksum):10}') if self.__DEBUG_IcmpPacket else 0
-                count = count + 2
-
-            # Calculate checksum for remaining segment (if there are any)
-            if countTo < len(packetAsByteData):
-                thisVal = packetAsByteData[len(packetAsByteData) - 1]
-                checksum = checksum + thisVal
-                checksum = checksum & 0xffffffff        # Capture as 32 bit value
-                print(count, "\t", hex(thisVal), "\t", hex(checksum)) if self.__DEBUG_IcmpPacket else 0
-
-            # Add 1's Complement Rotation to original checksum
-            checksum = (checksum >> 16) + (checksum & 0xffff)   # Rotate and add to base 16 bits
-            checksum = (checksum >> 16) + checksum              # Rotate and add
-
-            answer = ~checksum                  # Invert bits
-            answer = answer & 0xffff            # Trim to 16 bit value
-            answer = answer >> 8 | (answer << 8 & 0xff00)
+
+            # RFC 1071 checksum over the header (checksum field zeroed) and data, summed as 16 bit words in C
+            answer = internet_checksum(b''.join([self.__header, self.__data]))
             print("Checksum: ", hex(answer)) if self.__DEBUG_IcmpPacket else 0
 
             self.setPacketChecksum(answer)
@@ -190,7 +194,7 @@ class IcmpHelperLibrary:
             # ICMP Header Checksum = 16 bits
             # Identifier = 16 bits
             # Sequence Number = 16 bits
-            self.__header = struct.pack("!BBHHH",
+            self.__header = self.__HEADER_STRUCT.pack(
                                    self.getIcmpType(),              #  8 bits / 1 byte  / Format code B
                                    self.getIcmpCode(),              #  8 bits / 1 byte  / Format code B
                                    self.getPacketChecksum(),        # 16 bits / 2 bytes / Format code H
@@ -199,7 +203,7 @@ class IcmpHelperLibrary:
                                    )
 
         def __encodeData(self):
-            data_time = struct.pack("d", time.time())               # Used to track overall round trip time
+            data_time = self.__TIME_STRUCT.pack(time.time())        # Used to track overall round trip time
                                                                     # time.time() creates a 64 bit value of 8 bytes
             dataRawEncoded = self.getDataRaw().encode("utf-8")
 
@@ -207,11 +211,13 @@ class IcmpHelperLibrary:
 
         def __packAndRecalculateChecksum(self):
             # Checksum is calculated with the following sequence to confirm data in up to date
+            self.setPacketChecksum(0)           # The checksum field counts as zero while summing
             self.__packHeader()                 # packHeader() and encodeData() transfer data to their respective bit
                                                 # locations, otherwise, the bit sequences are empty or incorrect.
             self.__encodeData()
             self.__recalculateChecksum()        # Result will set new checksum value
-            self.__packHeader()                 # Header is rebuilt to include new checksum value
+            self.__header = bytearray(self.__header)
+            struct.pack_into("!H", self.__header, 2, self.getPacketChecksum())    # Patch checksum in place
 
         def __validateIcmpReplyPacketWithOriginalPingData(self, icmpReplyPacket):
             # Check if the sequence number is valid
@@ -266,38 +272,42 @@ class IcmpHelperLibrary:
             if not silent:
                 print("Pinging (" + self.__icmpTarget + ") " + self.__destinationIpAddress)
 
-            mySocket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
-            mySocket.settimeout(self.__ipTimeout)
-            mySocket.bind(("", 0))
-            mySocket.setsockopt(IPPROTO_IP, IP_TTL, struct.pack('I', self.getTtl()))  # Unsigned int - 4 bytes
+            # An IPv6 destination takes an ICMPv6 echo request (type 128); the kernel fills in its checksum
+            if ":" in self.__destinationIpAddress and self.getIcmpType() == 8:
+                self.setIcmpType(128)
+                self.__packAndRecalculateChecksum()
+
+            # Probes go out over the process-wide transport instead of a throwaway socket per request
+            transport = IcmpTransport.get_instance()
+            estimator = RttEstimator.get_instance()
+            timeout = self.__ipTimeout
+            if timeout is None:
+                timeout = estimator.timeout(self.__destinationIpAddress, 10)
             try:
-                mySocket.sendto(b''.join([self.__header, self.__data]), (self.__destinationIpAddress, 0))
-                timeLeft = 10
-                pingStartTime = time.time()
-                startedSelect = time.time()
-                whatReady = select.select([mySocket], [], [], timeLeft)
-                endSelect = time.time()
-                howLongInSelect = (endSelect - startedSelect)
-                if whatReady[0] == []:  # Timeout
+                probe = transport.send_probe(self.__destinationIpAddress,
+                                             self.getPacketBytes(),
+                                             self.getPacketIdentifier(),
+                                             self.getPacketSequenceNumber(),
+                                             self.getTtl(),
+                                             timeout)
+                reply = probe.result()
+                if reply is None:  # Timeout
                     if not silent:
                         print("  *        *        *        *        *    Request timed out.")
                     return None
-                recvPacket, addr = mySocket.recvfrom(1024)  # recvPacket - bytes object representing data received
-                # addr  - address of socket sending data
-                timeReceived = time.time()
-                timeLeft = timeLeft - howLongInSelect
-                if timeLeft <= 0:
-                    if not silent:
-                        print("  *        *        *        *        *    Request timed out (By no remaining time left).")
-                    return None
 
                 else:
+                    recvPacket = reply['packet']                # recvPacket - bytes object representing data received
+                    addr = (reply['addr'], 0)                   # addr  - address of socket sending data
+                    timeReceived = reply['time_received']
+
                     # Fetch the ICMP type and code from the received packet
-                    icmpType, icmpCode = recvPacket[20:22]
-                    rtt = (timeReceived - pingStartTime) * 1000
+                    icmpType, icmpCode = reply['type'], reply['code']
+                    rtt = reply['rtt']
+                    estimator.observe(self.__destinationIpAddress, rtt)
 
                     if icmpType == 11:                          # Time Exceeded
-                        icmpMessage = IcmpHelperLibrary.convertIcmpMessage(icmpType, icmpCode)
+                        icmpMessage = IcmpHelperLibrary.convertIcmpMessage(icmpType, icmpCode, reply['family'])
                         if not silent:
                             print("  TTL=%d    RTT=%.0f ms    Type=%d    Code=%d    Message=%s    %s" %
                                     (
@@ -312,7 +322,7 @@ class IcmpHelperLibrary:
                         return {'type': icmpType, 'code': icmpCode, 'addr': addr[0], 'rtt': rtt}
 
                     elif icmpType == 3:                         # Destination Unreachable
-                        icmpMessage = IcmpHelperLibrary.convertIcmpMessage(icmpType, icmpCode)
+                        icmpMessage = IcmpHelperLibrary.convertIcmpMessage(icmpType, icmpCode, reply['family'])
                         if not silent:
                             print("  TTL=%d    RTT=%.0f ms    Type=%d    Code=%d    Message=%s    %s" %
                                       (
@@ -327,10 +337,9 @@ class IcmpHelperLibrary:
                         return {'type': icmpType, 'code': icmpCode, 'addr': addr[0], 'rtt': rtt}
 
                     elif icmpType == 0:                         # Echo Reply
-                        icmpReplyPacket = IcmpHelperLibrary.IcmpPacket_EchoReply(recvPacket)
+                        icmpReplyPacket = IcmpHelperLibrary.IcmpPacket_EchoReply(recvPacket, reply['family'], reply['icmp_offset'])
                         self.__validateIcmpReplyPacketWithOriginalPingData(icmpReplyPacket)
-                        bytes = struct.calcsize("d")
-                        timeSent = struct.unpack("d", recvPacket[28:28 + bytes])[0]
+                        timeSent = icmpReplyPacket.getDateTimeSent()
                         self.setRtt((timeReceived - timeSent) * 1000)
                         if not silent:
                             icmpReplyPacket.printResultToConsole(self.getTtl(), timeReceived, addr, self) 
@@ -340,12 +349,10 @@ class IcmpHelperLibrary:
                         if not silent:
                             print("error")
                         return None
-            except timeout:
+            except OSError as e:
                 if not silent:
-                    print("  *        *        *        *        *    Request timed out (By Exception).")
+                    print("  *        *        *        *        *    Request failed (By Exception): %s" % e)
                 return None
-            finally:
-                mySocket.close()
 
         def printIcmpPacketHeader_hex(self):
             print("Header Size: ", len(self.__header))
@@ -386,11 +393,13 @@ class IcmpHelperLibrary:
         #                                                                                                              #
         #                                                                                                              #
         # ############################################################################################################ #
-        __recvPacket = b''
-        __isValidResponse = False
-        __IcmpSequenceNumber_IsValid = False
-        __IcmpIdentifier_IsValid = False
-        __IcmpRawData_IsValid = False
+        # Every header field is unpacked once in __init__ with precompiled structs and kept in slots
+        __slots__ = ("__recvPacket", "__icmpType", "__icmpCode", "__icmpHeaderChecksum", "__icmpIdentifier",
+                     "__icmpSequenceNumber", "__dateTimeSent", "__dataOffset", "__isValidResponse",
+                     "__IcmpSequenceNumber_IsValid", "__IcmpIdentifier_IsValid", "__IcmpRawData_IsValid")
+
+        __HEADER_STRUCT = struct.Struct("!BBHHH")   # Type, Code, Checksum, Identifier, Sequence Number
+        __TIME_STRUCT = struct.Struct("d")          # Send timestamp, packed natively by IcmpPacket
 
         # ############################################################################################################ #
         # IcmpPacket_EchoReply Constructors                                                                            #
@@ -399,8 +408,26 @@ class IcmpHelperLibrary:
         #                                                                                                              #
         #                                                                                                              #
         # ############################################################################################################ #
-        def __init__(self, recvPacket):
+        def __init__(self, recvPacket, family=4, icmpOffset=None):
             self.__recvPacket = recvPacket
+            self.__isValidResponse = False
+            self.__IcmpSequenceNumber_IsValid = False
+            self.__IcmpIdentifier_IsValid = False
+            self.__IcmpRawData_IsValid = False
+
+            # The ICMP header follows the IP header, whose length is in the low nibble of its first byte.
+            # ICMPv6 replies, and replies to datagram sockets, arrive without an IP header.
+            if icmpOffset is None:
+                icmpOffset = (recvPacket[0] & 0x0f) * 4 if family == 4 else 0
+            (self.__icmpType,
+             self.__icmpCode,
+             self.__icmpHeaderChecksum,
+             self.__icmpIdentifier,
+             self.__icmpSequenceNumber) = self.__HEADER_STRUCT.unpack_from(recvPacket, icmpOffset)
+            if family == 6:
+                self.__icmpType = 0  # ICMPv6 Echo Reply (129), reported under its ICMPv4 type like the transport does
+            self.__dateTimeSent = self.__TIME_STRUCT.unpack_from(recvPacket, icmpOffset + 8)[0]
+            self.__dataOffset = icmpOffset + 16
 
         # ############################################################################################################ #
         # IcmpPacket_EchoReply Getters                                                                                 #
@@ -410,53 +437,27 @@ class IcmpHelperLibrary:
         #                                                                                                              #
         # ############################################################################################################ #
         def getIcmpType(self):
-            # Method 1
-            # bytes = struct.calcsize("B")        # Format code B is 1 byte
-            # return struct.unpack("!B", self.__recvPacket[20:20 + bytes])[0]
-
-            # Method 2
-            return self.__unpackByFormatAndPosition("B", 20)
+            return self.__icmpType
 
         def getIcmpCode(self):
-            # Method 1
-            # bytes = struct.calcsize("B")        # Format code B is 1 byte
-            # return struct.unpack("!B", self.__recvPacket[21:21 + bytes])[0]
-
-            # Method 2
-            return self.__unpackByFormatAndPosition("B", 21)
+            return self.__icmpCode
 
         def getIcmpHeaderChecksum(self):
-            # Method 1
-            # bytes = struct.calcsize("H")        # Format code H is 2 bytes
-            # return struct.unpack("!H", self.__recvPacket[22:22 + bytes])[0]
-
-            # Method 2
-            return self.__unpackByFormatAndPosition("H", 22)
+            return self.__icmpHeaderChecksum
 
         def getIcmpIdentifier(self):
-            # Method 1
-            # bytes = struct.calcsize("H")        # Format code H is 2 bytes
-            # return struct.unpack("!H", self.__recvPacket[24:24 + bytes])[0]
-
-            # Method 2
-            return self.__unpackByFormatAndPosition("H", 24)
+            return self.__icmpIdentifier
 
         def getIcmpSequenceNumber(self):
-            # Method 1
-            # bytes = struct.calcsize("H")        # Format code H is 2 bytes
-            # return struct.unpack("!H", self.__recvPacket[26:26 + bytes])[0]
-
-            # Method 2
-            return self.__unpackByFormatAndPosition("H", 26)
+            return self.__icmpSequenceNumber
 
         def getDateTimeSent(self):
-            # This accounts for bytes 28 through 35 = 64 bits
-            return self.__unpackByFormatAndPosition("d", 28)   # Used to track overall round trip time
-                                                               # time.time() creates a 64 bit value of 8 bytes
+            # 64 bit time.time() value the request carried at the start of its data
+            return self.__dateTimeSent
 
         def getIcmpDataRaw(self):
-            # This accounts for bytes 36 to the end of the packet.
-            return self.__recvPacket[36:].decode('utf-8')
+            # Everything after the timestamp to the end of the packet.
+            return self.__recvPacket[self.__dataOffset:].decode('utf-8')
 
         def getIcmpSequenceNumberIsValid(self):
             return self.__IcmpSequenceNumber_IsValid
@@ -489,17 +490,6 @@ class IcmpHelperLibrary:
         def setIcmpRawDataIsValid(self, booleanValue):
             self.__IcmpRawData_IsValid = booleanValue
         
-        # ############################################################################################################ #
-        # IcmpPacket_EchoReply Private Functions                                                                       #
-        #                                                                                                              #
-        #                                                                                                              #
-        #                                                                                                              #
-        #                                                                                                              #
-        # ############################################################################################################ #
-        def __unpackByFormatAndPosition(self, formatCode, basePosition):
-            numberOfbytes = struct.calcsize(formatCode)
-            return struct.unpack("!" + formatCode, self.__recvPacket[basePosition:basePosition + numberOfbytes])[0]
-
         # ############################################################################################################ #
         # IcmpPacket_EchoReply Public Functions                                                                        #
         #                                                                                                              #
@@ -508,8 +498,7 @@ class IcmpHelperLibrary:
         #                                                                                                              #
         # ############################################################################################################ #
         def printResultToConsole(self, ttl, timeReceived, addr, IcmpEchoRequest):
-            bytes = struct.calcsize("d")
-            timeSent = struct.unpack("d", self.__recvPacket[28:28 + bytes])[0]
+            timeSent = self.getDateTimeSent()
             icmpMessage = IcmpHelperLibrary.convertIcmpMessage(self.getIcmpType(), self.getIcmpCode())
             print("  TTL=%d    RTT=%.0f ms    Type=%d    Code=%d    Message=%s       Identifier=%d    Sequence Number=%d    %s" %
                   (
@@ -569,9 +558,8 @@ class IcmpHelperLibrary:
     def __sendIcmpEchoRequest(self, host):
         print("sendIcmpEchoRequest Started...") if self.__DEBUG_IcmpHelperLibrary else 0
 
-        totalRtt = []
         totalPackets = 4
-        totalPacketsReceived = 0
+        stats = ProbeStats()
 
         for i in range(totalPackets):
             # Build packet
@@ -589,30 +577,26 @@ class IcmpHelperLibrary:
             # Send echo request, returns dict with response details or None if timeout
             result = icmpPacket.sendEchoRequest()                                                # Build IP
             if result and result['type'] == 0 and result['valid']:  # type 0 = Echo Reply
-                totalRtt.append(result['rtt'])
-                totalPacketsReceived += 1
+                stats.add(result['rtt'])
+            else:
+                stats.add(None)
 
             icmpPacket.printIcmpPacketHeader_hex() if self.__DEBUG_IcmpHelperLibrary else 0
             icmpPacket.printIcmpPacket_hex() if self.__DEBUG_IcmpHelperLibrary else 0
             # we should be confirming values are correct, such as identifier and sequence number and data
         print(f"\n--- {host} ping statistics ---")
 
-        # Calculate packet loss rate
-        packetsLost = totalPackets - totalPacketsReceived
-        packetLossRate = (packetsLost / totalPackets) * 100 if totalPackets > 0 else 0
-        print(f"{totalPackets} packets transmitted, {totalPacketsReceived} packets received, {packetLossRate:.2f}% packet loss")
+        summary = stats.summary()
+        print(f"{summary['sent']} packets transmitted, {summary['received']} packets received, {stats.loss:.2f}% packet loss")
 
-        # Calculate min, max, and avg RTT
-        if totalRtt:
-            minRtt = min(totalRtt)
-            maxRtt = max(totalRtt)
-            avgRtt = sum(totalRtt) / len(totalRtt)
+        # min, avg and max RTT (0 when nothing came back)
+        if summary['received']:
+            print(f"round-trip min/avg/max/stddev = {stats.min:.3f}ms/{summary['avg']:.3f}ms/{stats.max:.3f}ms/{stats.stddev:.3f}ms")
         else:
-            minRtt = 0
-            maxRtt = 0
-            avgRtt = 0
+            print(f"round-trip min/avg/max = {0:.3f}ms/{0:.3f}ms/{0:.3f}ms")
 
-        print(f"round-trip min/avg/max = {minRtt:.3f}ms/{avgRtt:.3f}ms/{maxRtt:.3f}ms")
+        summary['host'] = host
+        return summary
 
     def __sendIcmpTraceRoute(self, host):
         print("sendIcmpTraceRoute Started...") if self.__DEBUG_IcmpHelperLibrary else 0
@@ -622,7 +606,7 @@ class IcmpHelperLibrary:
 
         # Get the destination IP address
         try:
-            dest_ip = gethostbyname(host)
+            dest_ip = AddressResolver.resolve(host)
             print(f"traceroute to {host} ({dest_ip}), {maxHops} hops max")
         except:
             print(f"traceroute to {host}, {maxHops} hops max")
@@ -676,8 +660,9 @@ class IcmpHelperLibrary:
     #                                                                                                                  #
     # ################################################################################################################ #
     def sendPing(self, targetHost):
+        # Prints the ping statistics and returns them: host, sent, received, loss (%), min/avg/max/stddev (ms)
         print("ping Started...") if self.__DEBUG_IcmpHelperLibrary else 0
-        self.__sendIcmpEchoRequest(targetHost)
+        return self.__sendIcmpEchoRequest(targetHost)
 
     def traceRoute(self, targetHost):
         print("traceRoute Started...") if self.__DEBUG_IcmpHelperLibrary else 0
@@ -685,7 +670,31 @@ class IcmpHelperLibrary:
 
     # static method to convert ICMP type and code to human-readable message
     @staticmethod
-    def convertIcmpMessage(icmpType, icmpCode):
+    def convertIcmpMessage(icmpType, icmpCode, family=4):
+        # ICMPv6 messages come in under the ICMPv4 type they correspond to, but keep their own codes
+        if family == 6:
+            errorMessages = {
+                0: {  # Echo Reply (129)
+                    0: "Echo Reply"
+                },
+                3: {  # Destination Unreachable (1)
+                    0: "No Route to Destination",
+                    1: "Communication with Destination Administratively Prohibited",
+                    2: "Beyond Scope of Source Address",
+                    3: "Address Unreachable",
+                    4: "Port Unreachable",
+                    5: "Source Address Failed Ingress/Egress Policy",
+                    6: "Reject Route to Destination"
+                },
+                11: {  # Time Exceeded (3)
+                    0: "Hop Limit Exceeded in Transit",
+                    1: "Fragment Reassembly Time Exceeded"
+                }
+            }
+            if icmpType in errorMessages and icmpCode in errorMessages[icmpType]:
+                return errorMessages[icmpType][icmpCode]
+            return f"Unknown ICMPv6 message (ICMP Type {icmpType} equivalent) Code {icmpCode}"
+
         errorMessages = {
             0: {  # Echo Reply
                 0: "Echo Reply"
@@ -0,0 +1,77 @@
+import asyncio
+import ipaddress
+from socket import getaddrinfo, gaierror, AF_INET, AF_INET6, AF_UNSPEC, SOCK_STREAM
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.cache import TTLCache
+
+
+class AddressResolver:
+    """
+    getaddrinfo-based resolution for the probe engines, IPv4 and IPv6 alike, with a shared cache so
+    repeated traces of one hostname skip the resolver. Dual-stack names resolve to the family
+    prefer_ipv6 picks; single-stack names to whatever they have.
+    """
+
+    _cache = TTLCache(maxsize=settings.dns_cache_size, ttl=settings.dns_cache_ttl)
+
+    @staticmethod
+    def resolve(target: str) -> str:
+        """
+        Resolve a hostname or address literal to the IP address to probe. Raises OSError if it does not resolve.
+        """
+        host = target.strip()
+        literal = AddressResolver._literal(host)
+        if literal is not None:
+            return literal
+
+        cached = AddressResolver._cache.get(host.lower())
+        if cached is not None:
+            return cached
+        return AddressResolver._choose(host, getaddrinfo(host, None, AF_UNSPEC, SOCK_STREAM))
+
+    @staticmethod
+    async def resolve_async(target: str) -> str:
+        """
+        resolve() without blocking the event loop
+        """
+        host = target.strip()
+        literal = AddressResolver._literal(host)
+        if literal is not None:
+            return literal
+
+        cached = AddressResolver._cache.get(host.lower())
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        return AddressResolver._choose(host, await loop.getaddrinfo(host, None, family=AF_UNSPEC, type=SOCK_STREAM))
+
+    @staticmethod
+    def family(ip_address: str) -> int:
+        """AF_INET6 for an IPv6 address, AF_INET otherwise"""
+        return AF_INET6 if ":" in ip_address else AF_INET
+
+    @staticmethod
+    def stats() -> Dict:
+        """Resolver cache counters"""
+        return AddressResolver._cache.stats()
+
+    @staticmethod
+    def _literal(host: str) -> Optional[str]:
+        # Address literals need no lookup (a scope suffix such as fe80::1%eth0 is kept as given)
+        try:
+            ipaddress.ip_address(host.split("%", 1)[0])
+        except ValueError:
+            return None
+        return host
+
+    @staticmethod
+    def _choose(host: str, addresses: List[Tuple]) -> str:
+        preferred = AF_INET6 if settings.prefer_ipv6 else AF_INET
+        candidates = [address for address in addresses if address[0] in (AF_INET, AF_INET6)]
+        if not candidates:
+            raise gaierror(f"No IPv4 or IPv6 address for {host}")
+        chosen = next((address for address in candidates if address[0] == preferred), candidates[0])
+        ip_address = chosen[4][0]
+        AddressResolver._cache.set(host.lower(), ip_address)
+        return ip_address
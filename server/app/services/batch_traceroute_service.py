@@ -0,0 +1,249 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+from app.core.config import settings
+from app.services.cache import TTLCache
+from app.services.icmp_traceroute_service import IcmpTracerouteService
+from app.services.traceroute_service import TracerouteService
+
+
+class TraceScheduler:
+    """
+    Process-wide admission control for batch traces. Every trace costs its in-flight probes against a global
+    budget of outstanding probes; waiting traces are admitted round-robin across batch jobs so one large
+    job cannot starve the others, and at most one trace per destination runs at a time.
+    """
+
+    def __init__(self, max_outstanding_probes: int):
+        self.max_outstanding_probes = max_outstanding_probes
+        self._available = max_outstanding_probes
+        self._queues: "OrderedDict[str, Deque[tuple]]" = OrderedDict()  # job id -> (future, destination, cost)
+        self._active_destinations: Set[str] = set()
+        self.admitted = 0
+
+    async def acquire(self, job_id: str, destination: str, cost: int):
+        """
+        Wait until this trace may start. Must be paired with release(destination, cost).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(job_id, deque()).append((future, destination, cost))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled: hand the slot back
+                self.release(destination, cost)
+            else:
+                self._discard(job_id, future)
+            raise
+
+    def release(self, destination: str, cost: int):
+        """Return a finished trace's probes to the budget and admit whatever fits"""
+        self._available += cost
+        self._active_destinations.discard(destination)
+        self._dispatch()
+
+    def _discard(self, job_id: str, future: asyncio.Future):
+        queue = self._queues.get(job_id)
+        if queue is None:
+            return
+        for entry in list(queue):
+            if entry[0] is future:
+                queue.remove(entry)
+        if not queue:
+            del self._queues[job_id]
+
+    def _dispatch(self):
+        # Round-robin over jobs: a job that gets a trace admitted goes to the back of the line,
+        # a job whose next traces do not fit yet keeps its place
+        progress = True
+        while progress:
+            progress = False
+            for job_id in list(self._queues):
+                queue = self._queues[job_id]
+                entry = next((entry for entry in queue if self._admissible(entry)), None)
+                if entry is None:
+                    continue
+
+                future, destination, cost = entry
+                queue.remove(entry)
+                self._available -= cost
+                self._active_destinations.add(destination)
+                self.admitted += 1
+                future.set_result(None)
+                progress = True
+
+                if queue:
+                    self._queues.move_to_end(job_id)
+                else:
+                    del self._queues[job_id]
+
+    def _admissible(self, entry: tuple) -> bool:
+        future, destination, cost = entry
+        # An oversized trace still runs, alone, once the budget is fully free
+        fits = cost <= self._available or self._available == self.max_outstanding_probes
+        return destination not in self._active_destinations and fits
+
+    def stats(self) -> Dict:
+        """Budget in use and traces waiting"""
+        return {
+            "max_outstanding_probes": self.max_outstanding_probes,
+            "outstanding_probes": self.max_outstanding_probes - self._available,
+            "running_traces": len(self._active_destinations),
+            "queued_traces": sum(len(queue) for queue in self._queues.values()),
+            "admitted": self.admitted
+        }
+
+
+class BatchJob:
+    """
+    One multi-target request: per-target results in completion order, plus a wakeup for streaming readers.
+    """
+
+    def __init__(self, targets: List[str], include_geolocation: bool):
+        self.id = uuid.uuid4().hex
+        self.targets = targets
+        self.include_geolocation = include_geolocation
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.results: List[Dict] = []
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def add_result(self, result: Dict):
+        self.results.append(result)
+        self._notify()
+
+    def finish(self):
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        # Wake every current reader, then start a fresh event for the next update
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait_for_update(self):
+        await self._updated.wait()
+
+    def summary(self) -> Dict:
+        return {
+            "batch_id": self.id,
+            "total": len(self.targets),
+            "completed": len(self.results),
+            "succeeded": sum(1 for result in self.results if result["success"]),
+            "done": self.done,
+            "elapsed": round((self.finished_at or time.time()) - self.created_at, 3)
+        }
+
+
+class BatchTracerouteService:
+    _scheduler = TraceScheduler(settings.batch_max_outstanding_probes)
+    _running: Dict[str, BatchJob] = {}  # Never evicted: readers and the scheduler need them until they finish
+    # Finished jobs move here and stay readable for batch_result_ttl seconds after finishing
+    _jobs = TTLCache(maxsize=settings.batch_max_jobs, ttl=settings.batch_result_ttl)
+
+    @staticmethod
+    def start_batch(targets: List[str], include_geolocation: bool = True) -> BatchJob:
+        """
+        Queue a trace for every target and return the job immediately; results arrive as traces finish.
+        """
+        job = BatchJob(targets, include_geolocation)
+        BatchTracerouteService._running[job.id] = job
+        job.task = asyncio.create_task(BatchTracerouteService._run_batch(job))
+        return job
+
+    @staticmethod
+    def get_batch(batch_id: str) -> Optional[BatchJob]:
+        """Look up a job that is running or finished within the retention window"""
+        job = BatchTracerouteService._running.get(batch_id)
+        return job if job is not None else BatchTracerouteService._jobs.get(batch_id)
+
+    @staticmethod
+    def page(job: BatchJob, offset: int = 0, limit: int = 50) -> Dict:
+        """
+        Results offset..offset+limit in completion order, with the offset to ask for next.
+        """
+        results = job.results[offset:offset + limit]
+        page = job.summary()
+        page["results"] = results
+        page["next_offset"] = offset + len(results)
+        return page
+
+    @staticmethod
+    async def stream(job: BatchJob) -> AsyncIterator[Dict]:
+        """
+        Yield a "result" event per finished target (including those finished before the call),
+        then a "done" event with the job summary.
+        """
+        sent = 0
+        while True:
+            while sent < len(job.results):
+                yield {"event": "result", "data": job.results[sent]}
+                sent += 1
+            if job.done:
+                break
+            await job.wait_for_update()
+        yield {"event": "done", "data": job.summary()}
+
+    @staticmethod
+    def stats() -> Dict:
+        """Scheduler budget plus the number of running and retained jobs"""
+        stats = BatchTracerouteService._scheduler.stats()
+        stats["running_jobs"] = len(BatchTracerouteService._running)
+        stats["jobs"] = len(BatchTracerouteService._running) + len(BatchTracerouteService._jobs)
+        return stats
+
+    @staticmethod
+    def _trace_cost() -> int:
+        """Probes one trace keeps outstanding at most: its window of TTLs, probes_per_hop each"""
+        window = min(settings.trace_probe_window or settings.max_hops, settings.max_hops)
+        return window * settings.probes_per_hop
+
+    @staticmethod
+    async def _run_batch(job: BatchJob):
+        try:
+            await asyncio.gather(*(
+                BatchTracerouteService._run_target(job, target) for target in job.targets
+            ))
+        finally:
+            job.finish()
+            BatchTracerouteService._jobs.set(job.id, job)
+            BatchTracerouteService._running.pop(job.id, None)
+
+    @staticmethod
+    async def _run_target(job: BatchJob, target: str):
+        scheduler = BatchTracerouteService._scheduler
+        cost = BatchTracerouteService._trace_cost()
+
+        try:
+            destination = await IcmpTracerouteService.resolve_async(target)
+        except (OSError, UnicodeError, IndexError):
+            # The trace itself reports the resolution failure
+            destination = target
+
+        await scheduler.acquire(job.id, destination, cost)
+        try:
+            # Through the trace cache, so targets traced recently (or right now) by anyone are reused,
+            # and through the shared geolocation batch, so concurrent traces share API requests
+            hops, cached, age = await TracerouteService.run_traceroute_cached(
+                target, include_geolocation=job.include_geolocation
+            )
+        except Exception as e:
+            hops, cached, age = [{"error": f"Unexpected error: {str(e)}"}], False, 0.0
+        finally:
+            scheduler.release(destination, cost)
+
+        if hops and len(hops) == 1 and "error" in hops[0]:
+            job.add_result({"target": target, "hops": [], "success": False, "error": hops[0]["error"],
+                            "cached": False, "age": 0.0})
+        else:
+            job.add_result({"target": target, "hops": hops, "success": True, "error": None,
+                            "cached": cached, "age": age})
@@ -0,0 +1,269 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by threads and event loops.
+    Callers reserve a token and are told how long to wait for it, so waiters are served first come,
+    first served, and async callers sleep with asyncio.sleep instead of blocking the loop.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token and return the seconds to wait before using it (0 if one was available).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance is the queue of callers ahead of us
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float):
+        """
+        Hold back every new reservation for at least the given time (server asked us to slow down).
+        """
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            self._updated = time.monotonic()
+
+    def refund(self):
+        """Give back a reserved token that was never used (its caller gave up waiting)"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def acquire(self):
+        """Block the calling thread until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait for a token without blocking the event loop; a cancelled wait hands its token back"""
+        delay = self.reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.refund()
+                raise
+
+
+class RequestSlots:
+    """
+    Cap on requests in flight shared by threads and event loops: threads block, async callers await.
+    A freed slot is handed straight to the longest waiter, so waiters are served first come, first served.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._waiters: Deque[list] = deque()  # [loop or None, future or threading.Event]
+
+    def acquire(self):
+        """Block the calling thread until a slot is free"""
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            waiter = [None, threading.Event()]
+            self._waiters.append(waiter)
+        waiter[1].wait()
+
+    async def acquire_async(self):
+        """Wait for a slot without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            waiter = [loop, loop.create_future()]
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed to us as we were cancelled: pass it on
+            self.release()
+            raise
+
+    def release(self):
+        """Free a slot, or hand it to the longest waiter"""
+        with self._lock:
+            while self._waiters:
+                loop, handle = self._waiters.popleft()
+                if loop is None:
+                    handle.set()
+                    return
+                try:
+                    loop.call_soon_threadsafe(RequestSlots._wake, handle)
+                    return
+                except RuntimeError:
+                    # Its loop is closed; nobody is waiting there any more
+                    continue
+            self._in_use -= 1
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        # A waiter cancelled in the meantime releases the slot itself
+        if not future.done():
+            future.set_result(None)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+
+class GeolocationClient:
+    """
+    Pooled keep-alive HTTP client for ip-api.com with separate token buckets for the single and batch
+    endpoints and a cap on requests in flight. A sync requests.Session serves worker threads,
+    an httpx.AsyncClient per event loop serves async batch lookups; both share the same buckets and the
+    same request slots, so at most max_concurrency requests are in flight in the whole process.
+    """
+
+    def __init__(self, base_url: str, requests_per_minute: float, batch_requests_per_minute: float,
+                 max_concurrency: int):
+        self.base_url = base_url.rstrip("/")
+        self.single_bucket = TokenBucket(requests_per_minute, max(1, int(requests_per_minute // 4)))
+        self.batch_bucket = TokenBucket(batch_requests_per_minute, max(1, int(batch_requests_per_minute // 4)))
+        self.max_concurrency = max_concurrency
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self.slots = RequestSlots(max_concurrency)
+
+        # httpx.AsyncClient is bound to the loop it is first used on
+        self._async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+    def _check_rate_limit(self, bucket: TokenBucket, response):
+        """
+        Respect ip-api.com's X-Rl (requests left) / X-Ttl (seconds to reset) headers and 429 responses.
+        """
+        remaining = response.headers.get("X-Rl")
+        reset = response.headers.get("X-Ttl")
+        if response.status_code == 429 or remaining == "0":
+            try:
+                seconds = float(reset) if reset is not None else 60.0
+            except ValueError:
+                seconds = 60.0
+            print(f"ip-api.com rate limit reached, pausing lookups for {seconds:.0f}s")
+            bucket.pause(seconds)
+
+    def get_json(self, ip_address: str, timeout: float = 3) -> Optional[Dict]:
+        """
+        GET /json/{ip} and return the decoded body, or None on a non-200 response.
+        """
+        self.single_bucket.acquire()
+        self.slots.acquire()
+        try:
+            response = self._session.get(f"{self.base_url}/json/{ip_address}", timeout=timeout)
+        finally:
+            self.slots.release()
+        self._check_rate_limit(self.single_bucket, response)
+        return response.json() if response.status_code == 200 else None
+
+    def post_batch(self, ip_addresses: List[str], timeout: float = 5) -> Optional[List[Dict]]:
+        """
+        POST /batch (at most 100 IPs) and return the decoded body, or None on a non-200 response.
+        """
+        self.batch_bucket.acquire()
+        self.slots.acquire()
+        try:
+            response = self._session.post(f"{self.base_url}/batch", json=ip_addresses, timeout=timeout)
+        finally:
+            self.slots.release()
+        self._check_rate_limit(self.batch_bucket, response)
+        return response.json() if response.status_code == 200 else None
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Drop clients whose loops are gone (e.g. asyncio.run in scripts and tests)
+            for stale in [stale for stale in self._async_clients if stale.is_closed()]:
+                del self._async_clients[stale]
+            client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_concurrency))
+            self._async_clients[loop] = client
+        return client
+
+    async def post_batch_async(self, ip_addresses: List[str], timeout: float = 5) -> Optional[List[Dict]]:
+        """
+        Async post_batch; waiting for a token or a connection never blocks the event loop.
+        """
+        client = self._async_client()
+        await self.batch_bucket.acquire_async()
+        try:
+            await self.slots.acquire_async()
+        except asyncio.CancelledError:
+            # Cancelled while waiting for a request slot: the token was never used
+            self.batch_bucket.refund()
+            raise
+        try:
+            response = await client.post(f"{self.base_url}/batch", json=ip_addresses, timeout=timeout)
+        finally:
+            self.slots.release()
+        self._check_rate_limit(self.batch_bucket, response)
+        return response.json() if response.status_code == 200 else None
+
+    def close(self):
+        """
+        Close the pooled sync session and every per-loop async client. Clients of loops running in other
+        threads are closed on their own loop without waiting; prefer aclose() from inside an event loop.
+        """
+        self._session.close()
+        clients = self._take_async_clients()
+        for loop, client in clients.items():
+            if loop.is_closed():
+                continue
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+
+    async def aclose(self):
+        """
+        Close the pooled sync session and every per-loop async client, each on the loop it belongs to.
+        Clients of loops that are already closed can no longer be closed cleanly and are dropped.
+        """
+        self._session.close()
+        current = asyncio.get_running_loop()
+        closing = []
+        for loop, client in self._take_async_clients().items():
+            if loop is current:
+                closing.append(client.aclose())
+            elif loop.is_running():
+                closing.append(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), loop)))
+            elif not loop.is_closed():
+                # A loop that is not running cannot be driven from here; close it where it would run
+                loop.call_soon_threadsafe(lambda client=client, loop=loop: loop.create_task(client.aclose()))
+        for result in await asyncio.gather(*closing, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Geolocation client close error: {result}")
+
+    def _take_async_clients(self) -> Dict[asyncio.AbstractEventLoop, httpx.AsyncClient]:
+        clients = dict(self._async_clients)
+        self._async_clients.clear()
+        return clients
@@ -1,27 +1,63 @@
 import IP2Location
-import requests
+import asyncio
+import ipaddress
+import queue
+import sqlite3
+import threading
 import time
-from typing import Dict, Optional
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
+from app.core.config import settings
+from app.services.cache import TTLCache
+from app.services.geolocation_client import GeolocationClient
+from app.services.geolocation_store import GeolocationStore
+from app.services.ip_range_index import IpRangeIndex
 
 class GeolocationService:
     """
     Hybrid geolocation service using ip-api.com first, then IP2Location database fallback.
+    With the local-first policy the database answers first and ip-api.com upgrades it in the background.
     """
     
     _database = None
     _db_path = None
-    _cache = {}
-    _last_api_request_time = 0
-    _api_rate_limit_delay = 0.1  # 100ms between API requests
+    # Bounded LRU; failed lookups expire quickly so transient API outages get retried
+    _cache = TTLCache(
+        maxsize=settings.geolocation_cache_size,
+        ttl=settings.geolocation_cache_ttl,
+        negative_ttl=settings.geolocation_negative_cache_ttl,
+        is_negative=lambda location: location.get("source") == "both-sources-failed"
+    )
+    # Pooled keep-alive connections, token-bucket rate limits shared by every caller in the process
+    _api_client = GeolocationClient(
+        settings.geolocation_api_url,
+        requests_per_minute=settings.geolocation_api_requests_per_minute,
+        batch_requests_per_minute=settings.geolocation_api_batch_requests_per_minute,
+        max_concurrency=settings.geolocation_api_max_concurrency
+    )
+    _api_batch_size = 100  # ip-api.com accepts at most 100 IPs per batch request
+    _store = None  # Optional persistent tier shared across workers and restarts
+    _index = None  # Memory-mapped IPv4 range index compiled from the database
+    # Local-first mode: database answers queued for an ip-api.com upgrade, drained by a background thread
+    _enrichment_queue = queue.Queue()
+    _enrichment_pending = {}  # ip -> Future resolved with the upgraded location (or None)
+    _enrichment_lock = threading.Lock()
+    _enrichment_thread = None
+    # Concurrent traces share lookups: IPs requested within one batch window go out as one get_locations call
+    _shared_batch = {}  # ip -> asyncio.Future
+    _shared_batch_flush = None
     
     @classmethod
     def initialize(cls, db_path: str = None):
         """
         Initialize the geolocation service with IP2Location database.
         """
+        if settings.geolocation_store_enabled:
+            cls.initialize_store()
+        
         if db_path:
-            cls._db_path = db_path
+            cls._db_path = Path(db_path)
         else:
             # Look for IP2Location database in data directory
             cls._db_path = Path(__file__).parent.parent.parent / "data" / "IP2LOCATION-LITE-DB5.IPV6.BIN"
@@ -57,33 +93,131 @@ class GeolocationService:
             print(f"Warning: Failed to load IP2Location database: {e}")
             print("Will use ip-api.com only")
             cls._database = None
+            return
+        
+        if settings.geolocation_index_enabled:
+            cls.initialize_index()
+    
+    @classmethod
+    def initialize_index(cls, index_path: str = None):
+        """
+        Open the compiled IPv4 range index for the loaded database, rebuilding it if missing or stale.
+        """
+        index_path = index_path or settings.geolocation_index_path or cls._db_path.with_suffix(".idx")
+        
+        if cls._index:
+            cls._index.close()
+            cls._index = None
+        
+        try:
+            if not IpRangeIndex.is_current(index_path, cls._db_path):
+                start = time.perf_counter()
+                count = IpRangeIndex.build(cls._db_path, index_path)
+                print(f"Built IP range index with {count} ranges in {time.perf_counter() - start:.1f}s")
+            cls._index = IpRangeIndex(index_path)
+            print(f"IP range index mapped from {index_path}")
+        except Exception as e:
+            # The database itself still works, just through the IP2Location library
+            print(f"Warning: Failed to load IP range index: {e}")
+            cls._index = None
+    
+    @classmethod
+    def initialize_store(cls, path: str = None):
+        """
+        Open the persistent SQLite cache tier and preload its most recent entries into memory.
+        """
+        path = path or settings.geolocation_store_path or \
+            Path(__file__).parent.parent.parent / "data" / "geolocation_cache.sqlite3"
+        
+        try:
+            cls._store = GeolocationStore(path)
+            entries = cls._store.load_recent(settings.geolocation_store_preload, settings.geolocation_cache_ttl)
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to open geolocation store at {path}: {e}")
+            cls._store = None
+            return
+        
+        # Oldest first so the newest entries end up most recently used
+        now = time.time()
+        loaded = 0
+        for ip_address, location, updated_at in reversed(entries):
+            remaining = updated_at + cls._cache.ttl_for(location) - now
+            if remaining > 0:
+                cls._cache.set(ip_address, location, ttl=remaining)
+                loaded += 1
+        print(f"Geolocation store opened at {path}, preloaded {loaded} entries")
+    
+    @classmethod
+    def _load_from_store(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Fresh entries from the persistent tier, promoted into the memory cache.
+        """
+        if not cls._store or not ip_addresses:
+            return {}
+        
+        try:
+            rows = cls._store.get_many(ip_addresses)
+        except sqlite3.Error as e:
+            print(f"Geolocation store read error: {e}")
+            return {}
+        
+        now = time.time()
+        results = {}
+        for ip_address, (location, updated_at) in rows.items():
+            # Entries keep the expiry they had when written, in whichever worker wrote them
+            remaining = updated_at + cls._cache.ttl_for(location) - now
+            if remaining > 0:
+                cls._cache.set(ip_address, location, ttl=remaining)
+                results[ip_address] = location
+        return results
+    
+    @classmethod
+    def _save_to_store(cls, items: List[Tuple[str, Dict]]):
+        """
+        Write resolved locations through to the persistent tier.
+        """
+        if not cls._store:
+            return
+        
+        try:
+            cls._store.put_many(items)
+        except sqlite3.Error as e:
+            print(f"Geolocation store write error: {e}")
     
     @classmethod
     def _is_private_ip(cls, ip_address: str) -> bool:
         """
-        Check if an IP address is private/internal.
+        Check if an IP address is private/internal (RFC 1918, loopback, link-local, IPv6 unique local, ...).
         """
         try:
-            parts = ip_address.split('.')
-            if len(parts) != 4:
-                return False
-            
-            first_octet = int(parts[0])
-            second_octet = int(parts[1])
-            
-            # Private IP ranges
-            if first_octet == 10:
-                return True
-            elif first_octet == 172 and 16 <= second_octet <= 31:
-                return True
-            elif first_octet == 192 and second_octet == 168:
-                return True
-            elif first_octet == 127:
-                return True
-            
-            return False
-        except:
+            address = ipaddress.ip_address(ip_address.split("%", 1)[0])
+        except ValueError:
             return False
+        # IPv4-mapped IPv6 addresses are judged by the IPv4 address they carry
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return address.is_private or address.is_loopback or address.is_link_local
+    
+    @staticmethod
+    def _parse_api_response(data: Dict) -> Optional[Dict]:
+        """
+        Convert one ip-api.com result object into our geolocation dict.
+        """
+        if data.get("status") != "success":
+            return None
+        
+        return {
+            "latitude": data.get("lat"),
+            "longitude": data.get("lon"),
+            "country": data.get("country"),
+            "country_code": data.get("countryCode"),
+            "city": data.get("city"),
+            "region": data.get("regionName"),
+            "postal_code": data.get("zip"),
+            "timezone": data.get("timezone"),
+            "isp": data.get("isp"),
+            "source": "ip-api"
+        }
     
     @classmethod
     def _get_location_from_api(cls, ip_address: str) -> Optional[Dict]:
@@ -91,32 +225,11 @@ class GeolocationService:
         Get geolocation data from ip-api.com API.
         """
         try:
-            # Rate limiting
-            current_time = time.time()
-            time_since_last = current_time - cls._last_api_request_time
-            if time_since_last < cls._api_rate_limit_delay:
-                time.sleep(cls._api_rate_limit_delay - time_since_last)
+            # Make API request (waits for a rate limit token)
+            data = cls._api_client.get_json(ip_address)
             
-            # Make API request
-            response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=3)
-            cls._last_api_request_time = time.time()
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get("status") == "success":
-                    return {
-                        "latitude": data.get("lat"),
-                        "longitude": data.get("lon"),
-                        "country": data.get("country"),
-                        "country_code": data.get("countryCode"),
-                        "city": data.get("city"),
-                        "region": data.get("regionName"),
-                        "postal_code": data.get("zip"),
-                        "timezone": data.get("timezone"),
-                        "isp": data.get("isp"),
-                        "source": "ip-api"
-                    }
+            if data is not None:
+                return cls._parse_api_response(data)
             
             return None
             
@@ -124,6 +237,53 @@ class GeolocationService:
             print(f"API lookup error for {ip_address}: {e}")
             return None
     
+    @classmethod
+    def _get_locations_from_api(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Get geolocation data for many IPs from ip-api.com's batch endpoint, up to 100 IPs per request.
+        IPs the API could not locate are left out of the result.
+        """
+        results = {}
+        
+        for start in range(0, len(ip_addresses), cls._api_batch_size):
+            batch = ip_addresses[start:start + cls._api_batch_size]
+            try:
+                # One rate limit token per batch, not per IP
+                cls._collect_batch_results(results, cls._api_client.post_batch(batch))
+            except Exception as e:
+                print(f"API batch lookup error for {len(batch)} IPs: {e}")
+        
+        return results
+    
+    @classmethod
+    async def _get_locations_from_api_async(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Async _get_locations_from_api; batches run concurrently within the client's limits.
+        """
+        results = {}
+        
+        async def lookup_batch(batch: List[str]):
+            try:
+                cls._collect_batch_results(results, await cls._api_client.post_batch_async(batch))
+            except Exception as e:
+                print(f"API batch lookup error for {len(batch)} IPs: {e}")
+        
+        await asyncio.gather(*(
+            lookup_batch(ip_addresses[start:start + cls._api_batch_size])
+            for start in range(0, len(ip_addresses), cls._api_batch_size)
+        ))
+        return results
+    
+    @classmethod
+    def _collect_batch_results(cls, results: Dict[str, Dict], response: Optional[List[Dict]]):
+        """
+        Add the successful entries of one batch response to results, keyed by IP.
+        """
+        for data in response or []:
+            location = cls._parse_api_response(data)
+            if location:
+                results[data.get("query")] = location
+    
     @classmethod
     def _get_location_from_database(cls, ip_address: str) -> Optional[Dict]:
         """
@@ -132,6 +292,10 @@ class GeolocationService:
         if not cls._database:
             return None
         
+        # IPv4 goes through the compiled index, IPv6 through the library
+        if cls._index and IpRangeIndex.ip_to_int(ip_address) is not None:
+            return cls._index.lookup(ip_address)
+        
         try:
             # Query the IP2Location database
             record = cls._database.get_all(ip_address)
@@ -158,44 +322,218 @@ class GeolocationService:
             print(f"Database lookup error for {ip_address}: {e}")
             return None
     
+    @classmethod
+    def _get_locations_from_database(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Bulk _get_location_from_database; IPv4 addresses are resolved in one index batch.
+        IPs the database could not locate are left out of the result.
+        """
+        if not cls._database:
+            return {}
+        
+        results = cls._index.lookup_many(ip_addresses) if cls._index else {}
+        for ip_address in ip_addresses:
+            if ip_address not in results and (not cls._index or IpRangeIndex.ip_to_int(ip_address) is None):
+                location = cls._get_location_from_database(ip_address)
+                if location:
+                    results[ip_address] = location
+        return results
+    
     @classmethod
     def get_location(cls, ip_address: str) -> Dict:
         """
-        Get geolocation data for an IP address using API first, then database fallback.
+        Get geolocation data for an IP address using API first, then database fallback
+        (database first, enriched later, under the local-first policy).
         """
         # Check if it's a private IP
         if cls._is_private_ip(ip_address):
-            return {
-                "latitude": None,
-                "longitude": None,
-                "country": None,
-                "country_code": None,
-                "city": None,
-                "region": None,
-                "postal_code": None,
-                "timezone": None,
-                "isp": None,
-                "source": "private-ip"
-            }
+            return cls.empty_location("private-ip")
         
         # Check cache first
-        if ip_address in cls._cache:
-            return cls._cache[ip_address]
+        cached = cls._cache.get(ip_address)
+        if cached is not None:
+            return cached
+        
+        return cls._lookup_and_cache(ip_address)
+    
+    @classmethod
+    def _lookup_and_cache(cls, ip_address: str) -> Dict:
+        """
+        Resolve a cache miss (persistent tier, then API, then database) and cache the outcome, failures included.
+        """
+        stored = cls._load_from_store([ip_address])
+        if ip_address in stored:
+            return stored[ip_address]
+        
+        if settings.geolocation_policy == "local-first":
+            local = cls._get_locations_from_database([ip_address])
+            if local:
+                cls._cache_local(local)
+                return local[ip_address]
         
         # Try API first (better data quality)
-        api_result = cls._get_location_from_api(ip_address)
-        if api_result:
-            cls._cache[ip_address] = api_result
-            return api_result
+        result = cls._get_location_from_api(ip_address)
         
         # Fallback to database (faster, but less accurate)
-        db_result = cls._get_location_from_database(ip_address)
-        if db_result:
-            cls._cache[ip_address] = db_result
-            return db_result
+        if not result:
+            result = cls._get_location_from_database(ip_address)
         
         # If both fail, return error
-        result = {
+        if not result:
+            result = cls.empty_location("both-sources-failed")
+        
+        cls._cache.set(ip_address, result)
+        cls._save_to_store([(ip_address, result)])
+        return result
+    
+    @classmethod
+    def get_locations(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Bulk get_location keyed by IP. Duplicates are looked up once, private IPs and cache hits are
+        served directly, and the misses are resolved with batched API requests (database fallback).
+        """
+        results, misses = cls._resolve_locally(ip_addresses)
+        
+        if misses:
+            cls._resolve_misses(misses, cls._get_locations_from_api(misses), results)
+        return results
+    
+    @classmethod
+    def _resolve_locally(cls, ip_addresses: List[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """
+        First half of get_locations: everything that needs no API request.
+        Returns the resolved locations and the IPs still missing.
+        """
+        results = {}
+        misses = []
+        
+        for ip_address in dict.fromkeys(ip_addresses):
+            if cls._is_private_ip(ip_address):
+                results[ip_address] = cls.empty_location("private-ip")
+                continue
+            
+            cached = cls._cache.get(ip_address)
+            if cached is not None:
+                results[ip_address] = cached
+            else:
+                misses.append(ip_address)
+        
+        # Other workers (or a previous run) may already have resolved some of them
+        stored = cls._load_from_store(misses)
+        results.update(stored)
+        misses = [ip_address for ip_address in misses if ip_address not in stored]
+        
+        if misses and settings.geolocation_policy == "local-first":
+            local = cls._get_locations_from_database(misses)
+            cls._cache_local(local)
+            results.update(local)
+            misses = [ip_address for ip_address in misses if ip_address not in local]
+        
+        return results, misses
+    
+    @classmethod
+    def _resolve_misses(cls, misses: List[str], api_results: Dict[str, Dict], results: Dict[str, Dict]):
+        """
+        Second half of get_locations: database fallback for what the API missed, then cache and store everything.
+        """
+        database_results = cls._get_locations_from_database(
+            [ip_address for ip_address in misses if ip_address not in api_results]
+        )
+        
+        for ip_address in misses:
+            result = api_results.get(ip_address) or database_results.get(ip_address)
+            if not result:
+                result = cls.empty_location("both-sources-failed")
+            cls._cache.set(ip_address, result)
+            results[ip_address] = result
+        
+        cls._save_to_store([(ip_address, results[ip_address]) for ip_address in misses])
+    
+    @classmethod
+    def _cache_local(cls, locations: Dict[str, Dict]):
+        """
+        Cache local-first database answers and queue them for enrichment from the API.
+        They expire like failed lookups until upgraded, so a failed enrichment is retried later.
+        """
+        for ip_address, location in locations.items():
+            cls._cache.set(ip_address, location, ttl=settings.geolocation_negative_cache_ttl)
+        cls.request_enrichment(list(locations))
+    
+    @classmethod
+    def request_enrichment(cls, ip_addresses: List[str]):
+        """
+        Queue IPs for a background ip-api.com lookup that upgrades their cached record.
+        IPs already queued are not queued twice.
+        """
+        with cls._enrichment_lock:
+            for ip_address in ip_addresses:
+                if ip_address not in cls._enrichment_pending:
+                    cls._enrichment_pending[ip_address] = Future()
+                    cls._enrichment_queue.put(ip_address)
+            
+            if ip_addresses and cls._enrichment_thread is None:
+                cls._enrichment_thread = threading.Thread(
+                    target=cls._enrichment_loop, name="geolocation-enrichment", daemon=True
+                )
+                cls._enrichment_thread.start()
+    
+    @classmethod
+    def pending_enrichment(cls, ip_addresses: List[str]) -> Dict[str, Future]:
+        """
+        Futures for the given IPs that are still waiting on enrichment, keyed by IP.
+        Each resolves with the upgraded location, or None if the API had nothing better.
+        """
+        with cls._enrichment_lock:
+            return {
+                ip_address: cls._enrichment_pending[ip_address]
+                for ip_address in ip_addresses if ip_address in cls._enrichment_pending
+            }
+    
+    @classmethod
+    def _enrichment_loop(cls):
+        """
+        Background worker: collect queued IPs for one batch window, then upgrade them with batched API requests.
+        """
+        while True:
+            batch = [cls._enrichment_queue.get()]
+            time.sleep(settings.geolocation_batch_window)
+            while True:
+                try:
+                    batch.append(cls._enrichment_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            # Whatever goes wrong with one batch, its waiters are released and the worker keeps going
+            api_results = {}
+            try:
+                api_results = cls._get_locations_from_api(batch)
+                for ip_address, location in api_results.items():
+                    cls._cache.set(ip_address, location)
+                cls._save_to_store(list(api_results.items()))
+            except Exception as e:
+                print(f"Geolocation enrichment error for {len(batch)} IPs: {e}")
+            finally:
+                with cls._enrichment_lock:
+                    futures = [(cls._enrichment_pending.pop(ip_address, None), ip_address) for ip_address in batch]
+                for future, ip_address in futures:
+                    if future is not None:
+                        cls._resolve_enrichment(future, api_results.get(ip_address))
+    
+    @staticmethod
+    def _resolve_enrichment(future: Future, location: Optional[Dict]):
+        try:
+            if not future.done():
+                future.set_result(location)
+        except InvalidStateError:
+            # Cancelled by a waiter between the check and the set
+            pass
+    
+    @staticmethod
+    def empty_location(source: str) -> Dict:
+        """
+        Geolocation record with every field unset, tagged with why
+        """
+        return {
             "latitude": None,
             "longitude": None,
             "country": None,
@@ -205,92 +543,132 @@ class GeolocationService:
             "postal_code": None,
             "timezone": None,
             "isp": None,
-            "source": "both-sources-failed"
+            "source": source
         }
-        cls._cache[ip_address] = result
-        return result
+    
+    @classmethod
+    def peek_location(cls, ip_address: str) -> Optional[Dict]:
+        """
+        Return the location only if it is known without a lookup (private IP or cache hit), else None.
+        """
+        if cls._is_private_ip(ip_address):
+            return cls.empty_location("private-ip")
+        return cls._cache.peek(ip_address)
+    
+    @classmethod
+    async def get_location_async(cls, ip_address: str) -> Dict:
+        """
+        Async get_location. Private IPs and cache hits return immediately, misses run in a worker thread.
+        """
+        if cls._is_private_ip(ip_address):
+            return cls.empty_location("private-ip")
+        
+        cached = cls._cache.get(ip_address)
+        if cached is not None:
+            return cached
+        
+        return await asyncio.to_thread(cls._lookup_and_cache, ip_address)
+    
+    @classmethod
+    async def get_locations_async(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Async get_locations. Resolves inline when nothing needs a lookup; otherwise the store and database
+        run in a worker thread and the API requests on the event loop.
+        """
+        if all(cls.peek_location(ip_address) is not None for ip_address in ip_addresses):
+            return cls.get_locations(ip_addresses)
+        
+        results, misses = await asyncio.to_thread(cls._resolve_locally, ip_addresses)
+        if misses:
+            api_results = await cls._get_locations_from_api_async(misses)
+            await asyncio.to_thread(cls._resolve_misses, misses, api_results, results)
+        return results
+    
+    @classmethod
+    async def get_locations_shared(cls, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        get_locations_async for callers running side by side (parallel traces, batch jobs): misses from
+        every caller within one batch window are merged into a single lookup, so they share API batches.
+        """
+        loop = asyncio.get_running_loop()
+        if cls._shared_batch_flush is not None and cls._shared_batch_flush.get_loop() is not loop:
+            # Left over from a previous event loop (scripts calling asyncio.run repeatedly)
+            cls._shared_batch = {}
+            cls._shared_batch_flush = None
+        
+        results = {}
+        waiting = {}
+        for ip_address in dict.fromkeys(ip_addresses):
+            known = cls.peek_location(ip_address)
+            if known is not None:
+                results[ip_address] = known
+                continue
+            
+            future = cls._shared_batch.get(ip_address)
+            if future is None:
+                future = loop.create_future()
+                cls._shared_batch[ip_address] = future
+            waiting[ip_address] = future
+        
+        if waiting and cls._shared_batch_flush is None:
+            cls._shared_batch_flush = loop.create_task(cls._flush_shared_batch())
+        
+        # Shielded so one caller going away does not cancel the lookup for the others
+        locations = await asyncio.gather(*(asyncio.shield(future) for future in waiting.values()))
+        results.update(zip(waiting, locations))
+        return results
+    
+    @classmethod
+    async def _flush_shared_batch(cls):
+        """
+        Wait one batch window, then resolve everything collected by get_locations_shared in one lookup.
+        """
+        await asyncio.sleep(settings.geolocation_batch_window)
+        batch = cls._shared_batch
+        cls._shared_batch = {}
+        cls._shared_batch_flush = None
+        
+        try:
+            locations = await cls.get_locations_async(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for ip_address, future in batch.items():
+            if not future.done():
+                future.set_result(locations[ip_address])
     
     @classmethod
     def clear_cache(cls):
         """Clear the cache"""
         cls._cache.clear()
     
+    @classmethod
+    def cache_stats(cls) -> Dict:
+        """Cache size and hit/miss/eviction counters, plus persistent tier latency when enabled"""
+        stats = cls._cache.stats()
+        if cls._store:
+            stats["persistent"] = cls._store.stats()
+        return stats
+    
+    @classmethod
+    async def aclose(cls):
+        """close() for the event loop: the async API clients are closed on the loops they belong to"""
+        await cls._api_client.aclose()
+        cls.close()
+    
     @classmethod
     def close(cls):
-        """Close the database to free resources"""
+        """Close the database, range index, persistent store and API connections to free resources"""
+        cls._api_client.close()
+        if cls._index:
+            cls._index.close()
+            cls._index = None
         if cls._database:
             cls._database.close()
             cls._database = None
-        # Rate limiting (very minimal)
-        current_time = time.time()
-        time_since_last = current_time - cls._last_request_time
-        if time_since_last < cls._rate_limit_delay:
-            time.sleep(cls._rate_limit_delay - time_since_last)
-        
-        try:
-            # Make API request
-            response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=3)
-            cls._last_request_time = time.time()
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get("status") == "success":
-                    result = {
-                        "latitude": data.get("lat"),
-                        "longitude": data.get("lon"),
-                        "country": data.get("country"),
-                        "country_code": data.get("countryCode"),
-                        "city": data.get("city"),
-                        "region": data.get("regionName"),
-                        "postal_code": data.get("zip"),
-                        "timezone": data.get("timezone"),
-                        "isp": data.get("isp"),
-                        "source": "ip-api"
-                    }
-                else:
-                    result = {
-                        "latitude": None,
-                        "longitude": None,
-                        "country": None,
-                        "country_code": None,
-                        "city": None,
-                        "region": None,
-                        "postal_code": None,
-                        "timezone": None,
-                        "isp": None,
-                        "source": "ip-api-error"
-                    }
-            else:
-                result = {
-                    "latitude": None,
-                    "longitude": None,
-                    "country": None,
-                    "country_code": None,
-                    "city": None,
-                    "region": None,
-                    "postal_code": None,
-                    "timezone": None,
-                    "isp": None,
-                    "source": "ip-api-error"
-                }
-            
-            # Cache the result
-            cls._cache[ip_address] = result
-            return result
-            
-        except Exception as e:
-            result = {
-                "latitude": None,
-                "longitude": None,
-                "country": None,
-                "country_code": None,
-                "city": None,
-                "region": None,
-                "postal_code": None,
-                "timezone": None,
-                "isp": None,
-                "source": "ip-api-error"
-            }
-            cls._cache[ip_address] = result
-            return result
\ No newline at end of file
+        if cls._store:
+            cls._store.close()
+            cls._store = None
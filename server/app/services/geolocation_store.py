@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.services.sqlite_connections import SqliteConnectionPool
+
+
+class GeolocationStore:
+    """
+    Persistent geolocation cache tier backed by SQLite in WAL mode.
+    Many worker processes can read and write the same file concurrently; each thread gets its own connection.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = str(path)
+        self._pool = SqliteConnectionPool(self.path, busy_timeout_ms)
+        self._stats_lock = threading.Lock()
+        self._reads = 0
+        self._read_time = 0.0
+        self._read_max = 0.0
+        self._writes = 0
+        self._write_time = 0.0
+        self._write_max = 0.0
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS locations ("
+            " ip TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS locations_updated_at ON locations (updated_at)")
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._pool.connection()
+
+    def _record(self, kind: str, elapsed: float):
+        with self._stats_lock:
+            if kind == "read":
+                self._reads += 1
+                self._read_time += elapsed
+                self._read_max = max(self._read_max, elapsed)
+            else:
+                self._writes += 1
+                self._write_time += elapsed
+                self._write_max = max(self._write_max, elapsed)
+
+    def get_many(self, ip_addresses: List[str]) -> Dict[str, Tuple[Dict, float]]:
+        """
+        Return {ip: (location, updated_at)} for the IPs present in the store.
+        """
+        if not ip_addresses:
+            return {}
+
+        start = time.perf_counter()
+        results = {}
+        connection = self._connection()
+        # Stay well below SQLite's bound-parameter limit
+        for offset in range(0, len(ip_addresses), 500):
+            chunk = ip_addresses[offset:offset + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT ip, data, updated_at FROM locations WHERE ip IN ({placeholders})", chunk
+            ).fetchall()
+            for ip_address, data, updated_at in rows:
+                results[ip_address] = (json.loads(data), updated_at)
+        self._record("read", time.perf_counter() - start)
+        return results
+
+    def get(self, ip_address: str) -> Optional[Tuple[Dict, float]]:
+        """
+        Return (location, updated_at) for one IP, or None.
+        """
+        return self.get_many([ip_address]).get(ip_address)
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]]):
+        """
+        Insert or refresh locations, stamped with the current time, in one transaction.
+        """
+        now = time.time()
+        rows = [(ip_address, json.dumps(location), now) for ip_address, location in items]
+        if not rows:
+            return
+
+        start = time.perf_counter()
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO locations (ip, data, updated_at) VALUES (?, ?, ?)", rows
+            )
+        self._record("write", time.perf_counter() - start)
+
+    def put(self, ip_address: str, location: Dict):
+        """Insert or refresh a single location"""
+        self.put_many([(ip_address, location)])
+
+    def load_recent(self, limit: int, max_age: float) -> List[Tuple[str, Dict, float]]:
+        """
+        Most recently updated entries no older than max_age seconds, for bulk preload at startup.
+        """
+        start = time.perf_counter()
+        rows = self._connection().execute(
+            "SELECT ip, data, updated_at FROM locations WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT ?",
+            (time.time() - max_age, limit)
+        ).fetchall()
+        self._record("read", time.perf_counter() - start)
+        return [(ip_address, json.loads(data), updated_at) for ip_address, data, updated_at in rows]
+
+    def stats(self) -> Dict:
+        """Read/write counts and latency in milliseconds"""
+        with self._stats_lock:
+            return {
+                "path": self.path,
+                "reads": self._reads,
+                "read_avg_ms": round(self._read_time / self._reads * 1000, 3) if self._reads else 0.0,
+                "read_max_ms": round(self._read_max * 1000, 3),
+                "writes": self._writes,
+                "write_avg_ms": round(self._write_time / self._writes * 1000, 3) if self._writes else 0.0,
+                "write_max_ms": round(self._write_max * 1000, 3)
+            }
+
+    def close(self):
+        """Close the connections of every thread that used the store"""
+        self._pool.close()
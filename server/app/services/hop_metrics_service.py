@@ -0,0 +1,194 @@
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.services.hop_metrics_store import HopMetricsStore, MINUTE, HOUR, RESOLUTIONS
+
+_RESOLUTION_NAMES = {"raw": None, "1m": MINUTE, "1h": HOUR}
+
+
+class HopMetricsService:
+    """
+    Keeps every finished hop's RTT as a time series per (target, ttl, ip). Traces only put samples on a
+    bounded queue (never waiting: when the queue is full samples are dropped and counted); a background
+    thread writes them to the store in batches every hop_metrics_flush_interval seconds, rolls complete
+    minutes and hours up and expires old data.
+    """
+
+    _store: Optional[HopMetricsStore] = None
+    _queue = queue.Queue(maxsize=settings.hop_metrics_queue_size)
+    _writer_thread = None
+    _stopping = threading.Event()
+    _recorded = 0
+    _dropped = 0
+    _written = 0
+    _flushes = 0
+    _last_rollup = 0.0
+
+    @classmethod
+    def initialize(cls, path: str = None):
+        """
+        Open the store and start the writer thread
+        """
+        path = path or settings.hop_metrics_path or \
+            Path(__file__).parent.parent.parent / "data" / "hop_metrics.sqlite3"
+
+        try:
+            cls._store = HopMetricsStore(path)
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to open hop metrics store at {path}: {e}")
+            cls._store = None
+            return
+
+        if cls._writer_thread is None:
+            cls._writer_thread = threading.Thread(target=cls._writer_loop, name="hop-metrics-writer", daemon=True)
+            cls._writer_thread.start()
+        print(f"Hop metrics store opened at {path}")
+
+    @classmethod
+    def close(cls):
+        """
+        Stop the writer thread, write every sample still queued and close the store. Blocking: call from a thread
+        """
+        if cls._store is None:
+            return
+        cls._stopping.set()
+        if cls._writer_thread is not None:
+            try:
+                # Wake a writer waiting for its first sample
+                cls._queue.put_nowait(None)
+            except queue.Full:
+                pass
+            cls._writer_thread.join(timeout=settings.hop_metrics_flush_interval + 5)
+            cls._writer_thread = None
+        cls.flush()
+        cls._store.close()
+        cls._store = None
+        cls._stopping.clear()
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls._store is not None
+
+    @classmethod
+    def record(cls, target: str, hops: List[Dict], timestamp: float = None):
+        """
+        Queue the RTTs of answered hops; returns at once. Silent hops and error entries are skipped.
+        """
+        if cls._store is None:
+            return
+
+        timestamp = timestamp or time.time()
+        target = target.strip()
+        for hop_data in hops:
+            if "error" in hop_data or hop_data.get("ip", "*") == "*" or hop_data.get("remembered"):
+                continue
+            for rtt in hop_data.get("times", []):
+                if rtt is None:
+                    continue
+                try:
+                    cls._queue.put_nowait((target, hop_data["hop"], hop_data["ip"], rtt, timestamp))
+                    cls._recorded += 1
+                except queue.Full:
+                    cls._dropped += 1
+
+    @classmethod
+    def query(cls, target: str, start: float, end: float, resolution: str = "auto",
+              ttl: Optional[int] = None) -> Dict:
+        """
+        Hop series of target between start and end (Unix seconds) as raw samples or 1m/1h rollups
+        with count/min/avg/p95. "auto" picks raw for up to two hours, 1m for up to three days, else 1h.
+        Blocking: call from a thread.
+        """
+        if resolution == "auto":
+            span = end - start
+            resolution = "raw" if span <= 2 * HOUR else "1m" if span <= 72 * HOUR else "1h"
+        if resolution not in _RESOLUTION_NAMES:
+            return {"error": f"Unknown resolution {resolution!r}, expected raw, 1m, 1h or auto"}
+
+        seconds = _RESOLUTION_NAMES[resolution]
+        try:
+            if seconds is None:
+                series = cls._store.query_raw(target.strip(), start, end, ttl)
+            else:
+                series = cls._store.query_rollups(target.strip(), seconds, start, end, ttl)
+        except sqlite3.Error as e:
+            return {"error": f"Hop metrics store read error: {e}"}
+
+        return {"target": target, "start": start, "end": end, "resolution": resolution, "series": series}
+
+    @classmethod
+    def targets(cls) -> List[Dict]:
+        """Targets with recorded samples. Blocking: call from a thread"""
+        return cls._store.targets()
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """Samples recorded, dropped and written, and what is still queued"""
+        return {
+            "enabled": cls._store is not None,
+            "recorded": cls._recorded,
+            "dropped": cls._dropped,
+            "queued": cls._queue.qsize(),
+            "written": cls._written,
+            "flushes": cls._flushes
+        }
+
+    @classmethod
+    def flush(cls, samples: List = None):
+        """Write samples plus everything queued so far (the writer thread does this every flush interval)"""
+        samples = samples or []
+        while True:
+            try:
+                sample = cls._queue.get_nowait()
+            except queue.Empty:
+                break
+            if sample is not None:
+                samples.append(sample)
+        if not samples:
+            return
+
+        try:
+            cls._written += cls._store.append(samples)
+            cls._flushes += 1
+        except sqlite3.Error as e:
+            print(f"Hop metrics write error for {len(samples)} samples: {e}")
+
+    @classmethod
+    def _writer_loop(cls):
+        """
+        Background writer: wait for a sample, let a flush interval's worth accumulate, write them as one
+        batch. Rolls up and expires at most once a minute, also while no traces are running.
+        """
+        while not cls._stopping.is_set():
+            try:
+                first = cls._queue.get(timeout=MINUTE)
+            except queue.Empty:
+                first = None
+            if first is not None:
+                # Cut short at shutdown; close() writes whatever is still queued
+                cls._stopping.wait(settings.hop_metrics_flush_interval)
+                cls.flush([first])
+
+            if not cls._stopping.is_set() and time.time() - cls._last_rollup >= MINUTE:
+                cls._roll_up()
+
+    @classmethod
+    def _roll_up(cls):
+        now = time.time()
+        cls._last_rollup = now
+        raw_horizon = now - settings.hop_metrics_raw_retention
+        # Samples can arrive up to a flush interval late, so a bucket is only final a little after it ends
+        settled = now - 2 * settings.hop_metrics_flush_interval
+        try:
+            for resolution in RESOLUTIONS:
+                cls._store.roll_up(resolution, settled, raw_horizon)
+            cls._store.expire(raw_horizon, {
+                MINUTE: now - settings.hop_metrics_minute_retention,
+                HOUR: now - settings.hop_metrics_hour_retention
+            })
+        except sqlite3.Error as e:
+            print(f"Hop metrics rollup error: {e}")
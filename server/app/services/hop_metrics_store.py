@@ -0,0 +1,262 @@
+import math
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.services.sqlite_connections import SqliteConnectionPool
+
+CHUNK_SECONDS = 60  # Raw samples are stored in one chunk per series per aligned minute
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+
+
+def _summarize(rtts: List[float]) -> Dict:
+    """count, min, avg and nearest-rank p95 of a bucket's RTTs"""
+    rtts = sorted(rtts)
+    return {
+        "count": len(rtts),
+        "min": round(rtts[0], 3),
+        "avg": round(sum(rtts) / len(rtts), 3),
+        "p95": round(rtts[max(0, math.ceil(0.95 * len(rtts)) - 1)], 3)
+    }
+
+
+class HopMetricsStore:
+    """
+    Per-hop RTT history backed by SQLite in WAL mode. A series is one (target, ttl, ip); its raw samples
+    are stored column-wise, as packed float32 arrays of time offsets and RTTs with one row per series
+    and minute, so range queries read only the minutes they cover. Minute and hour rollups
+    (count/min/avg/p95) are kept for longer than the raw samples.
+    Each thread gets its own connection from a SqliteConnectionPool.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = str(path)
+        self._pool = SqliteConnectionPool(self.path, busy_timeout_ms)
+        self._series: Dict[Tuple[str, int, str], int] = {}  # (target, ttl, ip) -> series id
+        self._series_lock = threading.Lock()
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS series ("
+                " id INTEGER PRIMARY KEY,"
+                " target TEXT NOT NULL,"
+                " ttl INTEGER NOT NULL,"
+                " ip TEXT NOT NULL,"
+                " UNIQUE (target, ttl, ip)"
+                ")"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " series_id INTEGER NOT NULL,"
+                " start_time INTEGER NOT NULL,"
+                " times BLOB NOT NULL,"  # float32 seconds since start_time
+                " rtts BLOB NOT NULL"  # float32 milliseconds
+                ")"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS chunks_series_time ON chunks (series_id, start_time)")
+            connection.execute("CREATE INDEX IF NOT EXISTS chunks_time ON chunks (start_time)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                " series_id INTEGER NOT NULL,"
+                " resolution INTEGER NOT NULL,"
+                " bucket INTEGER NOT NULL,"
+                " count INTEGER NOT NULL,"
+                " min REAL NOT NULL,"
+                " avg REAL NOT NULL,"
+                " p95 REAL NOT NULL,"
+                " PRIMARY KEY (series_id, resolution, bucket)"
+                ") WITHOUT ROWID"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS watermarks (resolution INTEGER PRIMARY KEY, until INTEGER NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._pool.connection()
+
+    def _series_ids(self, connection: sqlite3.Connection, keys: Iterable[Tuple[str, int, str]]) -> Dict[Tuple, int]:
+        """Series ids for (target, ttl, ip) keys, creating missing series"""
+        ids = {}
+        with self._series_lock:
+            for key in keys:
+                series_id = self._series.get(key)
+                if series_id is None:
+                    connection.execute("INSERT OR IGNORE INTO series (target, ttl, ip) VALUES (?, ?, ?)", key)
+                    series_id = connection.execute(
+                        "SELECT id FROM series WHERE target = ? AND ttl = ? AND ip = ?", key
+                    ).fetchone()[0]
+                    self._series[key] = series_id
+                ids[key] = series_id
+        return ids
+
+    def append(self, samples: Iterable[Tuple[str, int, str, float, float]]) -> int:
+        """
+        Write (target, ttl, ip, rtt_ms, timestamp) samples as one batch of chunk rows, one per series and
+        minute. Returns the number of samples written.
+        """
+        grouped: Dict[Tuple, Tuple[array, array]] = {}
+        for target, ttl, ip, rtt, timestamp in samples:
+            start = int(timestamp // CHUNK_SECONDS * CHUNK_SECONDS)
+            times, rtts = grouped.setdefault((target, ttl, ip, start), (array("f"), array("f")))
+            times.append(timestamp - start)
+            rtts.append(rtt)
+        if not grouped:
+            return 0
+
+        connection = self._connection()
+        with connection:
+            ids = self._series_ids(connection, {key[:3] for key in grouped})
+        with connection:
+            connection.executemany(
+                "INSERT INTO chunks (series_id, start_time, times, rtts) VALUES (?, ?, ?, ?)",
+                [(ids[key[:3]], key[3], times.tobytes(), rtts.tobytes()) for key, (times, rtts) in grouped.items()]
+            )
+        return sum(len(times) for times, _ in grouped.values())
+
+    def targets(self) -> List[Dict]:
+        """Every target with samples, with its number of series"""
+        rows = self._connection().execute(
+            "SELECT target, COUNT(*) FROM series GROUP BY target ORDER BY target"
+        ).fetchall()
+        return [{"target": target, "series": count} for target, count in rows]
+
+    def _find_series(self, target: str, ttl: Optional[int]) -> Dict[int, Tuple[int, str]]:
+        """series id -> (ttl, ip) for a target, optionally one TTL only"""
+        query = "SELECT id, ttl, ip FROM series WHERE target = ?"
+        parameters = [target]
+        if ttl is not None:
+            query += " AND ttl = ?"
+            parameters.append(ttl)
+        return {series_id: (series_ttl, ip) for series_id, series_ttl, ip in
+                self._connection().execute(query, parameters).fetchall()}
+
+    def _read_chunks(self, series_ids: Iterable[int], start: float, end: float) -> Dict[int, List[Tuple[float, float]]]:
+        """(timestamp, rtt) samples of each series within start..end, from the chunks overlapping it"""
+        samples: Dict[int, List[Tuple[float, float]]] = {}
+        connection = self._connection()
+        first_chunk = int(start // CHUNK_SECONDS * CHUNK_SECONDS)
+        for series_id in series_ids:
+            rows = connection.execute(
+                "SELECT start_time, times, rtts FROM chunks WHERE series_id = ? AND start_time BETWEEN ? AND ?"
+                " ORDER BY start_time", (series_id, first_chunk, end)
+            ).fetchall()
+            for chunk_start, times, rtts in rows:
+                offsets, values = array("f"), array("f")
+                offsets.frombytes(times)
+                values.frombytes(rtts)
+                samples.setdefault(series_id, []).extend(
+                    (chunk_start + offset, rtt) for offset, rtt in zip(offsets, values)
+                    if start <= chunk_start + offset <= end
+                )
+        return samples
+
+    def query_raw(self, target: str, start: float, end: float, ttl: Optional[int] = None) -> List[Dict]:
+        """Raw samples per series of target within start..end"""
+        series = self._find_series(target, ttl)
+        samples = self._read_chunks(series, start, end)
+        return [{
+            "hop": series[series_id][0],
+            "ip": series[series_id][1],
+            "points": [{"time": round(timestamp, 3), "rtt": round(rtt, 3)} for timestamp, rtt in sorted(points)]
+        } for series_id, points in sorted(samples.items(), key=lambda item: series[item[0]])]
+
+    def query_rollups(self, target: str, resolution: int, start: float, end: float,
+                      ttl: Optional[int] = None) -> List[Dict]:
+        """
+        Rollup buckets per series of target covering start..end. Buckets not rolled up yet (the most
+        recent ones) are computed from the raw chunks.
+        """
+        series = self._find_series(target, ttl)
+        if not series:
+            return []
+
+        connection = self._connection()
+        first_bucket = int(start // resolution * resolution)
+        rolled_until = self.watermark(resolution) or first_bucket
+        buckets: Dict[int, Dict[int, Dict]] = {}
+        for series_id in series:
+            rows = connection.execute(
+                "SELECT bucket, count, min, avg, p95 FROM rollups"
+                " WHERE series_id = ? AND resolution = ? AND bucket BETWEEN ? AND ?",
+                (series_id, resolution, first_bucket, min(end, rolled_until - 1))
+            ).fetchall()
+            for bucket, count, low, mean, p95 in rows:
+                buckets.setdefault(series_id, {})[bucket] = {"count": count, "min": low, "avg": mean, "p95": p95}
+
+        if end >= rolled_until:
+            live = self._bucket_samples(self._read_chunks(series, max(first_bucket, rolled_until), end), resolution)
+            for (series_id, bucket), rtts in live.items():
+                buckets.setdefault(series_id, {})[bucket] = _summarize(rtts)
+
+        return [{
+            "hop": series[series_id][0],
+            "ip": series[series_id][1],
+            "points": [dict(summary, time=bucket) for bucket, summary in sorted(series_buckets.items())]
+        } for series_id, series_buckets in sorted(buckets.items(), key=lambda item: series[item[0]])]
+
+    @staticmethod
+    def _bucket_samples(samples: Dict[int, List[Tuple[float, float]]], resolution: int) -> Dict[Tuple[int, int], List[float]]:
+        buckets: Dict[Tuple[int, int], List[float]] = {}
+        for series_id, points in samples.items():
+            for timestamp, rtt in points:
+                buckets.setdefault((series_id, int(timestamp // resolution * resolution)), []).append(rtt)
+        return buckets
+
+    def watermark(self, resolution: int) -> Optional[int]:
+        """Start of the first bucket at resolution that is not rolled up yet"""
+        row = self._connection().execute("SELECT until FROM watermarks WHERE resolution = ?", (resolution,)).fetchone()
+        return row[0] if row else None
+
+    def roll_up(self, resolution: int, until: float, oldest: float) -> int:
+        """
+        Roll up every complete bucket before until that is not rolled up yet, reading back at most to
+        oldest (the raw retention horizon). Returns the number of buckets written.
+        """
+        until = int(until // resolution * resolution)
+        connection = self._connection()
+        since = self.watermark(resolution)
+        if since is None:
+            # A new store starts rolling up from now on; older buckets are computed from raw chunks when queried
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO watermarks (resolution, until) VALUES (?, ?)", (resolution, until))
+            return 0
+        since = max(since, int(oldest // resolution * resolution))
+        if since >= until:
+            return 0
+
+        buckets: Dict[Tuple[int, int], List[float]] = {}
+        rows = connection.execute(
+            "SELECT series_id, start_time, times, rtts FROM chunks WHERE start_time >= ? AND start_time < ?",
+            (since, until)
+        ).fetchall()
+        for series_id, chunk_start, times, rtts in rows:
+            offsets, values = array("f"), array("f")
+            offsets.frombytes(times)
+            values.frombytes(rtts)
+            for offset, rtt in zip(offsets, values):
+                key = (series_id, int((chunk_start + offset) // resolution * resolution))
+                buckets.setdefault(key, []).append(rtt)
+
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO rollups (series_id, resolution, bucket, count, min, avg, p95)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(series_id, resolution, bucket, *_summarize(rtts).values()) for (series_id, bucket), rtts in buckets.items()]
+            )
+            connection.execute("INSERT OR REPLACE INTO watermarks (resolution, until) VALUES (?, ?)", (resolution, until))
+        return len(buckets)
+
+    def expire(self, raw_before: float, rollups_before: Dict[int, float]):
+        """Drop raw chunks older than raw_before and rollups older than rollups_before[resolution]"""
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM chunks WHERE start_time < ?", (int(raw_before // CHUNK_SECONDS * CHUNK_SECONDS),))
+            for resolution, before in rollups_before.items():
+                connection.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (resolution, before))
+
+    def close(self):
+        """Close the connections of every thread that used the store"""
+        self._pool.close()
@@ -0,0 +1,152 @@
+import struct
+import sys
+import time
+from array import array
+from typing import Optional
+
+ICMP_ECHO_REQUEST = 8
+ICMPV6_ECHO_REQUEST = 128
+DEFAULT_PAYLOAD = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+_HEADER = struct.Struct("!BBHHH")
+_CHECKSUM = struct.Struct("!H")
+_SEQUENCE = struct.Struct("!H")
+_TIMESTAMP = struct.Struct("d")  # Native double, as IcmpPacket has always sent it
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+_CHECKSUM_OFFSET = 2
+_SEQUENCE_OFFSET = 6
+_TIMESTAMP_OFFSET = _HEADER.size
+_COMPENSATION_OFFSET = _TIMESTAMP_OFFSET + _TIMESTAMP.size
+
+MAX_FLOW_ID = 0xFFFE  # A checksum of 0xFFFF needs a one's complement sum of zero, which no probe can have
+
+
+def _fold(total: int) -> int:
+    """Fold a 32+ bit one's complement sum down to 16 bits"""
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def _to_network_order(word: int) -> int:
+    # One's complement sums are byte-order independent (RFC 1071), so a sum of native-order words
+    # only needs its final bytes swapped on little-endian hosts
+    return ((word >> 8) | ((word & 0xFF) << 8)) if _LITTLE_ENDIAN else word
+
+
+def _native_sum(data) -> int:
+    """Sum of the 16-bit native-order words of data, odd trailing byte padded with zero"""
+    if len(data) % 2:
+        data = bytes(data) + b"\0"
+    return sum(array("H", bytes(data)))
+
+
+def internet_checksum(data) -> int:
+    """
+    RFC 1071 Internet checksum of data, as a network-order value ready for struct "!H".
+    Sums 16-bit words through array("H") in C instead of a per-byte Python loop.
+    """
+    return _to_network_order(~_fold(_native_sum(data)) & 0xFFFF)
+
+
+class EchoRequestBuilder:
+    """
+    Builds ICMP echo requests for one identifier into a single preallocated buffer.
+    Type, code, identifier and payload are summed once; each probe only writes its sequence number
+    and send timestamp and adds those five words to the precomputed sum.
+    The buffer is reused: send (or copy) a built packet before building the next one.
+    Pass icmp_type=ICMPV6_ECHO_REQUEST for ICMPv6 probes; the kernel replaces their checksum.
+    """
+
+    __slots__ = ("identifier", "_buffer", "_words", "_base_sum")
+
+    def __init__(self, identifier: int, payload: bytes = DEFAULT_PAYLOAD, icmp_type: int = ICMP_ECHO_REQUEST):
+        self.identifier = identifier
+        self._buffer = bytearray(_HEADER.size + _TIMESTAMP.size + len(payload))
+        _HEADER.pack_into(self._buffer, 0, icmp_type, 0, 0, identifier, 0)
+        self._buffer[_TIMESTAMP_OFFSET + _TIMESTAMP.size:] = payload
+
+        # Constant part: everything except the checksum, sequence and timestamp words (all zero here)
+        self._base_sum = _native_sum(self._buffer)
+        # Odd-length packets cannot be viewed as 16-bit words; they take the full checksum path
+        self._words = memoryview(self._buffer).cast("H") if len(self._buffer) % 2 == 0 else None
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def build_into(self, sequence: int, timestamp: Optional[float] = None) -> bytearray:
+        """
+        Fill in sequence number, timestamp and checksum and return the shared buffer (no allocation).
+        """
+        buffer = self._buffer
+        buffer[_CHECKSUM_OFFSET] = 0
+        buffer[_CHECKSUM_OFFSET + 1] = 0
+        _SEQUENCE.pack_into(buffer, _SEQUENCE_OFFSET, sequence)
+        _TIMESTAMP.pack_into(buffer, _TIMESTAMP_OFFSET, time.time() if timestamp is None else timestamp)
+
+        words = self._words
+        if words is not None:
+            # Words 3..7: sequence number and the four words of the timestamp
+            total = self._base_sum + words[3] + words[4] + words[5] + words[6] + words[7]
+            checksum = _to_network_order(~_fold(total) & 0xFFFF)
+        else:
+            checksum = internet_checksum(buffer)
+
+        _CHECKSUM.pack_into(buffer, _CHECKSUM_OFFSET, checksum)
+        return buffer
+
+    def build(self, sequence: int, timestamp: Optional[float] = None) -> bytes:
+        """build_into, returning an independent copy of the packet"""
+        return bytes(self.build_into(sequence, timestamp))
+
+
+class FlowEchoRequestBuilder:
+    """
+    Paris traceroute echo requests: the ICMP checksum is the flow identifier. Load balancers hash the
+    first words of the ICMP header, so every probe built for the same flow follows the same path even
+    though its sequence number and timestamp change; a 16-bit compensation word after the timestamp
+    absorbs the difference. Vary the flow to deliberately spread probes over ECMP next hops.
+    Reuses one buffer like EchoRequestBuilder; the payload must have an even length.
+    """
+
+    __slots__ = ("identifier", "_buffer", "_words", "_base_sum")
+
+    def __init__(self, identifier: int, payload: bytes = DEFAULT_PAYLOAD):
+        if len(payload) % 2:
+            raise ValueError("Flow echo request payloads must have an even length")
+        self.identifier = identifier
+        self._buffer = bytearray(_COMPENSATION_OFFSET + 2 + len(payload))
+        _HEADER.pack_into(self._buffer, 0, ICMP_ECHO_REQUEST, 0, 0, identifier, 0)
+        self._buffer[_COMPENSATION_OFFSET + 2:] = payload
+        self._base_sum = _native_sum(self._buffer)
+        self._words = memoryview(self._buffer).cast("H")
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def build_into(self, sequence: int, flow: int, timestamp: Optional[float] = None) -> bytearray:
+        """
+        Fill in sequence number and timestamp, then set the compensation word so the checksum equals
+        flow (0..MAX_FLOW_ID). Returns the shared buffer.
+        """
+        if not 0 <= flow <= MAX_FLOW_ID:
+            raise ValueError(f"Flow identifier must be between 0 and {MAX_FLOW_ID}")
+
+        buffer = self._buffer
+        words = self._words
+        _SEQUENCE.pack_into(buffer, _SEQUENCE_OFFSET, sequence)
+        _TIMESTAMP.pack_into(buffer, _TIMESTAMP_OFFSET, time.time() if timestamp is None else timestamp)
+
+        # The packet must sum to ~flow; whatever the variable words do not contribute, the compensation
+        # word does (one's complement subtraction: target + ~current)
+        current = _fold(self._base_sum + words[3] + words[4] + words[5] + words[6] + words[7])
+        target = ~_to_network_order(flow) & 0xFFFF
+        words[_COMPENSATION_OFFSET // 2] = _fold(target + (~current & 0xFFFF))
+
+        _CHECKSUM.pack_into(buffer, _CHECKSUM_OFFSET, flow)
+        return buffer
+
+    def build(self, sequence: int, flow: int, timestamp: Optional[float] = None) -> bytes:
+        """build_into, returning an independent copy of the packet"""
+        return bytes(self.build_into(sequence, flow, timestamp))
@@ -0,0 +1,526 @@
+import asyncio
+import time
+from concurrent.futures import Future, FIRST_COMPLETED, wait as wait_for_futures
+from typing import AsyncIterator, Callable, List, Dict, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.IcmpHelperLibrary import IcmpHelperLibrary
+from app.services.address_resolver import AddressResolver
+from app.services.icmp_packet_builder import EchoRequestBuilder, FlowEchoRequestBuilder, MAX_FLOW_ID, \
+    ICMPV6_ECHO_REQUEST
+from app.services.icmp_transport import IcmpTransport, ICMP_ECHO_REPLY, ICMP_DESTINATION_UNREACHABLE, \
+    ICMP_TIME_EXCEEDED
+from app.services.local_topology import LocalTopology
+from app.services.probe_stats import ProbeStats
+from app.services.rtt_estimator import RttEstimate, RttEstimator
+
+# With several probes per hop, a TTL whose first reply is in waits this long for the rest of its probes:
+# they left at the same moment, so anything later than a few RTTs after the first reply counts as lost
+_SIBLING_WAIT_MIN = 0.05  # Seconds
+_SIBLING_WAIT_RTTS = 2
+# Probe sequence numbers are index << 8 | ttl: the TTL must fit the low byte, the index the high one
+MAX_TTL = 255
+MAX_PROBES_PER_HOP = 256
+# Settings that change which hops a trace returns or what they carry; the trace cache keys on all of them
+TRACE_SETTINGS = ("max_hops", "timeout", "probes_per_hop", "probe_percentiles", "probe_socket_mode",
+                  "trace_max_silent_hops", "trace_time_budget", "trace_probe_window", "doubletree_enabled",
+                  "doubletree_max_start_ttl", "doubletree_min_traces", "doubletree_ttl", "adaptive_timeout",
+                  "adaptive_timeout_min")
+
+
+class _TraceProgress:
+    """
+    Bookkeeping for one native trace, shared by the sync and async probe loops: which TTLs to send next
+    (at most trace_probe_window in flight), which have settled, and where the path ends. It ends at the
+    destination or the first unreachable, after trace_max_silent_hops silent TTLs in a row, or when
+    trace_time_budget runs out.
+    With Doubletree, forward probing starts past the near hops recent traces shared and backward probing
+    (one TTL at a time) stops at the first hop in the local stop set; the hops below it are remembered.
+    Each TTL gets probes_per_hop probes at once and settles when all of them are answered or lost.
+    """
+
+    def __init__(self, destination_ip: str, max_hops: int, started: float):
+        self.destination_ip = destination_ip
+        self.deadline = started + settings.trace_time_budget if settings.trace_time_budget > 0 else None
+        self.window = settings.trace_probe_window or max_hops
+        self.replies: Dict[int, Dict] = {}
+        self.settled: Set[int] = set()
+        self.sent_at: Dict[int, float] = {}
+        self.estimate = RttEstimate()
+        self.last_ttl = max_hops
+        self.stop_reason: Optional[str] = None
+        self.probes_sent = 0
+        self.probes_per_hop = settings.probes_per_hop
+        self.outstanding: Dict[int, int] = {}  # TTL -> probes neither answered nor given up
+        self.answered_at: Dict[int, float] = {}  # TTL -> arrival of its first reply
+        self.times: Dict[int, List[Optional[float]]] = {}
+        self.stats: Dict[int, ProbeStats] = {}
+
+        self.source = LocalTopology.source_for(destination_ip) if settings.doubletree_enabled else None
+        start_ttl = 1
+        if self.source is not None:
+            start_ttl = min(LocalTopology.get_instance().start_ttl(self.source), max_hops)
+        self.next_ttl = start_ttl
+        self.backward_ttl = start_ttl - 1  # Next TTL to probe backwards; 0 once backward probing is over
+        self.backward_in_flight = False
+        self.remembered: Set[int] = set()
+
+    def ttls_to_send(self, in_flight: int, now: float) -> List[int]:
+        """TTLs that fit in the probe window (in_flight counts TTLs, not probes) and are not past the end of the path"""
+        ttls = []
+        if self.backward_ttl and not self.backward_in_flight and in_flight < self.window:
+            ttls.append(self.backward_ttl)
+            self.backward_in_flight = True
+        while in_flight + len(ttls) < self.window and self.next_ttl <= self.last_ttl:
+            ttls.append(self.next_ttl)
+            self.next_ttl += 1
+        self.probes_sent += len(ttls) * self.probes_per_hop
+        for ttl in ttls:
+            self.sent_at[ttl] = now
+            self.outstanding[ttl] = self.probes_per_hop
+            self.times[ttl] = []
+            self.stats[ttl] = ProbeStats(percentiles=bool(settings.probe_percentiles))
+        return ttls
+
+    def record(self, ttl: int, reply: Optional[Dict], now: float):
+        """
+        Count one probe of a TTL with its reply (None if it timed out). The first reply moves the end of
+        the path; the TTL settles once all its probes are in.
+        """
+        if reply is not None:
+            IcmpTracerouteService._observe(self.destination_ip, reply, self.estimate)
+            if ttl not in self.replies:
+                self.replies[ttl] = reply
+                self.answered_at[ttl] = now
+                if reply["type"] in (ICMP_ECHO_REPLY, ICMP_DESTINATION_UNREACHABLE) and ttl <= self.last_ttl:
+                    self.last_ttl = ttl
+                    self.stop_reason = "destination" if reply["type"] == ICMP_ECHO_REPLY else "unreachable"
+        self._probe_done(ttl, reply["rtt"] if reply is not None else None)
+
+    def _probe_done(self, ttl: int, rtt: Optional[float]):
+        self.times[ttl].append(rtt)
+        self.stats[ttl].add(rtt)
+        self.outstanding[ttl] -= 1
+        if self.outstanding[ttl] > 0:
+            return
+
+        self.settled.add(ttl)
+        reply = self.replies.get(ttl)
+        if self.backward_in_flight and ttl == self.backward_ttl:
+            self._step_backward(ttl, reply)
+        if reply is None:
+            self._check_silent()
+
+    def _step_backward(self, ttl: int, reply: Optional[Dict]):
+        # A known near hop (as a router, not the destination) means the rest of the way back is known too
+        self.backward_in_flight = False
+        path = None
+        if reply is not None and reply["type"] == ICMP_TIME_EXCEEDED:
+            path = LocalTopology.get_instance().path_to(self.source, ttl, reply["addr"])
+        if path is None:
+            self.backward_ttl = ttl - 1
+            return
+
+        self.backward_ttl = 0
+        for hop_ttl, addr, rtt in path:
+            self.remembered.add(hop_ttl)
+            self.settled.add(hop_ttl)
+            if addr is not None:
+                self.replies[hop_ttl] = {"type": ICMP_TIME_EXCEEDED, "code": 0, "addr": addr,
+                                         "rtt": rtt or 0.0, "remembered": True}
+
+    def finish(self):
+        """
+        Count the trace's probes and teach the local topology its near hops (unless it ran out of time)
+        """
+        if self.source is None:
+            return
+        topology = LocalTopology.get_instance()
+        topology.record_trace(self.probes_sent, len(self.remembered) * self.probes_per_hop)
+        if self.stop_reason != "time_budget":
+            topology.learn(self.source, {ttl: self.replies.get(ttl) for ttl in self.settled}, self.last_ttl,
+                           self.remembered)
+
+    def _check_silent(self):
+        # The path has gone dark once trace_max_silent_hops TTLs past the deepest answer all timed out
+        silent_hops = settings.trace_max_silent_hops
+        if silent_hops <= 0:
+            return
+        deepest = max(self.replies, default=0)
+        end = deepest + silent_hops
+        if end < self.last_ttl and all(ttl in self.settled for ttl in range(deepest + 1, end + 1)):
+            self.last_ttl = end
+            self.stop_reason = "silent"
+
+    def wait_time(self, now: float, pending_ttls: List[int]) -> Optional[float]:
+        """
+        Seconds until expire() has something to do: the time budget runs out or TTLs that are silent
+        although a deeper TTL answered are given up. None waits for the next reply or probe deadline.
+        """
+        waits = []
+        if self.deadline is not None:
+            waits.append(self.deadline - now)
+        silent = self._silent_below_deepest(pending_ttls)
+        if silent:
+            waits.append(min(self.sent_at[ttl] for ttl in silent) + self._give_up_after() - now)
+        answered = [ttl for ttl in pending_ttls if ttl in self.answered_at]
+        if answered:
+            waits.append(min(self._sibling_deadline(ttl) for ttl in answered) - now)
+        return max(0.0, min(waits)) if waits else None
+
+    def _silent_below_deepest(self, pending_ttls) -> List[int]:
+        if not settings.adaptive_timeout or not self.replies:
+            return []
+        deepest = max(self.replies)
+        return [ttl for ttl in pending_ttls if ttl < deepest]
+
+    def _sibling_deadline(self, ttl: int) -> float:
+        # Remaining probes of a TTL that has answered are lost if they are not in shortly after its first reply
+        return self.answered_at[ttl] + max(_SIBLING_WAIT_MIN, _SIBLING_WAIT_RTTS * self.replies[ttl]["rtt"] / 1000)
+
+    def _give_up_after(self) -> float:
+        # Nearer routers answer no later than deeper ones, give or take their ICMP generation delay:
+        # allow the trace's own RTO and twice its slowest reply, counted from when the probe was sent
+        return max(settings.adaptive_timeout_min, self.estimate.rto() / 1000, 2 * self.estimate.max_rtt / 1000)
+
+    def expire(self, now: float, pending_ttls: Dict) -> List:
+        """
+        Called when wait_time ran out: settle and return the pending keys (probes) to stop waiting on
+        """
+        if self.deadline is not None and now >= self.deadline:
+            if self.stop_reason is None:
+                self.stop_reason = "time_budget"
+            # Keep the path up to the deepest answer; nothing past it will be heard in time
+            self.last_ttl = min(self.last_ttl, max(self.replies, default=self.next_ttl - 1))
+            self.backward_ttl = 0
+            self.backward_in_flight = False
+            # TTLs never probed (backward probing cut short) end up as "*" hops
+            self.settled.update(range(1, self.last_ttl + 1))
+            given_up = list(pending_ttls)
+        else:
+            silent = set(self._silent_below_deepest(pending_ttls.values()))
+            give_up_after = self._give_up_after()
+            given_up = [key for key, ttl in pending_ttls.items()
+                        if (ttl in silent and now >= self.sent_at[ttl] + give_up_after)
+                        or (ttl in self.answered_at and now >= self._sibling_deadline(ttl))]
+
+        for key in given_up:
+            self._probe_done(pending_ttls[key], None)
+        return given_up
+
+    def beyond_path(self, pending_ttls: Dict) -> List:
+        """Pending keys whose TTL lies past the end of the path"""
+        return [key for key, ttl in pending_ttls.items() if ttl > self.last_ttl]
+
+    def is_final(self, ttl: int) -> bool:
+        """
+        Whether nothing can still end the path below ttl: it or a deeper TTL has answered (so neither
+        silence nor the time budget cuts it off), and every TTL below it has answered or settled (so none
+        of them can still turn out to be the destination or unreachable)
+        """
+        return ttl <= self.last_ttl and ttl <= max(self.replies, default=0) and \
+            all(below in self.replies or below in self.settled for below in range(1, ttl))
+
+    def is_complete(self) -> bool:
+        """
+        Done once every TTL up to the end of the path has answered, timed out or been given up.
+        """
+        return all(ttl in self.settled for ttl in range(1, self.last_ttl + 1))
+
+
+class IcmpTracerouteService:
+    """
+    Native traceroute engine that keeps a window of TTLs in flight over the shared ICMP transport.
+    IPv6 destinations are probed with ICMPv6 echo requests over the transport's ICMPv6 sockets.
+    """
+
+    @staticmethod
+    def run_traceroute(target: str, max_hops: int = None, timeout: float = None) -> List[Dict]:
+        """
+        Probe TTLs 1..max_hops in parallel and return hops in the same shape as the subprocess parser.
+        Raises PermissionError when no probe sockets (for the target's address family) are available
+        so callers can fall back.
+        """
+        max_hops = max_hops or settings.max_hops
+        timeout = timeout or settings.timeout
+        error = IcmpTracerouteService._check_limits(max_hops)
+        if error:
+            return [{"error": error}]
+
+        try:
+            destination_ip = AddressResolver.resolve(target)
+        except (OSError, UnicodeError) as e:
+            return [{"error": f"Could not resolve {target}: {e}"}]
+
+        progress = _TraceProgress(destination_ip, max_hops, time.monotonic())
+        send_probes = IcmpTracerouteService._prober(destination_ip, timeout, progress.probes_per_hop)
+        probes = {}
+        pending = set()
+
+        try:
+            while True:
+                in_flight = len({probes[future] for future in pending})
+                for ttl in progress.ttls_to_send(in_flight, time.monotonic()):
+                    for future in send_probes(ttl):
+                        probes[future] = ttl
+                        pending.add(future)
+
+                if progress.is_complete() or not pending:
+                    break
+
+                wait = progress.wait_time(time.monotonic(), [probes[future] for future in pending])
+                done, pending = wait_for_futures(pending, timeout=wait, return_when=FIRST_COMPLETED)
+                if not done:
+                    IcmpTracerouteService._drop(pending, progress.expire(
+                        time.monotonic(), {future: probes[future] for future in pending}
+                    ))
+                for future in done:
+                    progress.record(probes[future], future.result(), time.monotonic())
+
+                # The path may have ended below probes still in flight
+                IcmpTracerouteService._drop(pending, progress.beyond_path(
+                    {future: probes[future] for future in pending}
+                ))
+        finally:
+            for future in probes:
+                future.cancel()
+
+        progress.finish()
+        return IcmpTracerouteService._build_hops(progress)
+
+    @staticmethod
+    async def run_traceroute_async(target: str, max_hops: int = None, timeout: float = None) -> List[Dict]:
+        """
+        Event-loop friendly run_traceroute: resolution and reply waits never block the loop.
+        """
+        hops = [hop async for hop in IcmpTracerouteService.stream_hops(target, max_hops, timeout)]
+        if len(hops) == 1 and "error" in hops[0]:
+            return hops
+        return sorted(hops, key=lambda hop: hop["hop"])
+
+    @staticmethod
+    async def stream_hops(target: str, max_hops: int = None, timeout: float = None) -> AsyncIterator[Dict]:
+        """
+        Yield each hop as soon as its TTL is settled and the path cannot end below it any more, so no hop
+        past the final end of the path is ever yielded. Hops can arrive out of order; the last hop is held
+        back until every TTL below it has been yielded.
+        """
+        max_hops = max_hops or settings.max_hops
+        timeout = timeout or settings.timeout
+        error = IcmpTracerouteService._check_limits(max_hops)
+        if error:
+            yield {"error": error}
+            return
+
+        try:
+            destination_ip = await IcmpTracerouteService.resolve_async(target)
+        except (OSError, UnicodeError) as e:
+            yield {"error": f"Could not resolve {target}: {e}"}
+            return
+
+        loop = asyncio.get_running_loop()
+        progress = _TraceProgress(destination_ip, max_hops, loop.time())
+        send_probes = IcmpTracerouteService._prober(destination_ip, timeout, progress.probes_per_hop)
+        waiting = {}
+        pending = set()
+        emitted = set()
+
+        try:
+            while True:
+                in_flight = len({waiting[future] for future in pending})
+                for ttl in progress.ttls_to_send(in_flight, loop.time()):
+                    for probe in send_probes(ttl):
+                        future = asyncio.wrap_future(probe)
+                        waiting[future] = ttl
+                        pending.add(future)
+
+                if (progress.is_complete() and progress.last_ttl in emitted) or not pending:
+                    break
+
+                wait = progress.wait_time(loop.time(), [waiting[future] for future in pending])
+                done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    IcmpTracerouteService._drop(pending, progress.expire(
+                        loop.time(), {future: waiting[future] for future in pending}
+                    ))
+                for future in done:
+                    progress.record(waiting[future], future.result(), loop.time())
+
+                # The path may have ended below probes still in flight
+                IcmpTracerouteService._drop(pending, progress.beyond_path(
+                    {future: waiting[future] for future in pending}
+                ))
+
+                # A hop goes out once the end of the path can no longer move below it; the last one only
+                # once the path below it is complete. The rest go out below, when the trace is over.
+                last_ttl = progress.last_ttl
+                for ttl in sorted(progress.settled - emitted):
+                    if not progress.is_final(ttl):
+                        continue
+                    if ttl < last_ttl or all(hop in emitted for hop in range(1, ttl)):
+                        emitted.add(ttl)
+                        yield IcmpTracerouteService._progress_hop(progress, ttl)
+
+            # Whatever is still unsettled at this point timed out
+            for ttl in range(1, progress.last_ttl + 1):
+                if ttl not in emitted:
+                    emitted.add(ttl)
+                    yield IcmpTracerouteService._progress_hop(progress, ttl)
+
+            progress.finish()
+        finally:
+            for future in waiting:
+                future.cancel()
+
+    @staticmethod
+    async def probe_ttls(destination_ip: str, ttls: List[int], timeout: float = None) -> Dict[int, Optional[Dict]]:
+        """
+        Send one probe to each of ttls at once and return the reply per TTL (None for silence).
+        For re-checking parts of a known path without tracing all of it.
+        Raises PermissionError when no probe sockets are available.
+        """
+        send_probes = IcmpTracerouteService._prober(destination_ip, timeout or settings.timeout)
+        futures = {ttl: asyncio.wrap_future(send_probes(ttl)[0]) for ttl in ttls}
+        try:
+            replies = await asyncio.gather(*futures.values())
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+        trace_estimate = RttEstimate()
+        for reply in replies:
+            IcmpTracerouteService._observe(destination_ip, reply, trace_estimate)
+        return dict(zip(futures, replies))
+
+    @staticmethod
+    async def resolve_async(target: str) -> str:
+        """
+        Resolve a hostname to the IPv4 or IPv6 address to probe without blocking the event loop (cached).
+        """
+        return await AddressResolver.resolve_async(target)
+
+    @staticmethod
+    def trace_settings() -> Tuple:
+        """Current values of TRACE_SETTINGS, hashable (lists become tuples)"""
+        values = (getattr(settings, name) for name in TRACE_SETTINGS)
+        return tuple(tuple(value) if isinstance(value, list) else value for value in values)
+
+    @staticmethod
+    def _check_limits(max_hops: int) -> Optional[str]:
+        """Error message if max_hops or probes_per_hop do not fit the probe sequence number, else None"""
+        if not 1 <= max_hops <= MAX_TTL:
+            return f"max_hops must be between 1 and {MAX_TTL}"
+        if not 1 <= settings.probes_per_hop <= MAX_PROBES_PER_HOP:
+            return f"probes_per_hop must be between 1 and {MAX_PROBES_PER_HOP}"
+        return None
+
+    @staticmethod
+    def _prober(destination_ip: str, timeout: float, probes_per_hop: int = 1) -> Callable[[int], List[Future]]:
+        """
+        Return a function that sends probes_per_hop echo requests with the given TTL over the shared
+        transport at once and returns their futures. The low byte of the sequence number carries the TTL,
+        the high byte the probe's index, so replies can be matched back.
+        """
+        transport = IcmpTransport.get_instance()
+        identifier = transport.allocate_identifier()
+        timeout = IcmpTracerouteService._probe_timeout(destination_ip, timeout)
+
+        if ":" in destination_ip:
+            if not transport.supports_ipv6():
+                raise PermissionError(f"IPv6 {transport.mode} probe sockets unavailable")
+            # The kernel owns the ICMPv6 checksum, so the Paris flow trick does not apply; IPv6 load
+            # balancers hash the flow label, which stays the same for every probe from the shared socket
+            builder = EchoRequestBuilder(identifier, icmp_type=ICMPV6_ECHO_REQUEST)
+
+            def send_probes(ttl: int) -> List[Future]:
+                futures = []
+                for index in range(probes_per_hop):
+                    sequence = index << 8 | ttl
+                    packet = builder.build_into(sequence)
+                    futures.append(transport.send_probe(destination_ip, packet, identifier, sequence, ttl, timeout))
+                return futures
+
+            return send_probes
+
+        # Every TTL uses the same flow (Paris traceroute), so load balancers send all of them down one path
+        # and the hops form a real path instead of a mix of ECMP branches. Only raw sockets keep the
+        # checksum as built; the datagram modes probe like classic traceroute.
+        builder = FlowEchoRequestBuilder(identifier)
+        flow = identifier % (MAX_FLOW_ID + 1)
+
+        def send_probes(ttl: int) -> List[Future]:
+            # send_probe sends synchronously, so the builder's buffer can be reused for the next probe
+            futures = []
+            for index in range(probes_per_hop):
+                sequence = index << 8 | ttl
+                packet = builder.build_into(sequence, flow)
+                futures.append(transport.send_probe(destination_ip, packet, identifier, sequence, ttl, timeout))
+            return futures
+
+        return send_probes
+
+    @staticmethod
+    def _drop(pending: Set, futures: List):
+        """Stop waiting on futures: cancel them and take them out of pending"""
+        for future in futures:
+            pending.discard(future)
+            future.cancel()
+
+    @staticmethod
+    def _probe_timeout(destination_ip: str, timeout: float) -> float:
+        """
+        Per-probe deadline: the destination's (or its prefix's) estimated RTO, with timeout as the ceiling
+        """
+        return RttEstimator.get_instance().timeout(destination_ip, timeout)
+
+    @staticmethod
+    def _observe(destination_ip: str, reply: Optional[Dict], trace_estimate: RttEstimate):
+        """Feed a reply's RTT to this trace's estimate and the shared per-destination estimates"""
+        if reply is None:
+            return
+        trace_estimate.update(reply["rtt"])
+        RttEstimator.get_instance().observe(destination_ip, reply["rtt"])
+
+    @staticmethod
+    def _build_hops(progress: _TraceProgress) -> List[Dict]:
+        """
+        Turn a trace's matched replies into hop dicts, stopping at the end of the path.
+        """
+        return [IcmpTracerouteService._progress_hop(progress, ttl) for ttl in range(1, progress.last_ttl + 1)]
+
+    @staticmethod
+    def _progress_hop(progress: _TraceProgress, ttl: int) -> Dict:
+        """
+        Hop dict for a settled TTL of a trace, with every probe's RTT and, for several probes per hop,
+        their statistics
+        """
+        hop = IcmpTracerouteService._build_hop(ttl, progress.replies.get(ttl))
+        if progress.probes_per_hop > 1 and ttl in progress.stats and not hop.get("remembered"):
+            hop["times"] = [round(rtt, 3) if rtt is not None else None for rtt in progress.times[ttl]]
+            hop["stats"] = progress.stats[ttl].summary(settings.probe_percentiles)
+        return hop
+
+    @staticmethod
+    def _build_hop(ttl: int, reply: Optional[Dict]) -> Dict:
+        """
+        Build a single hop dict; a missing reply becomes a "*" hop, an unreachable one says why.
+        """
+        if reply is None:
+            return {
+                "hop": ttl,
+                "ip": "*",
+                "times": [None],
+                "hostname": None
+            }
+        hop = {
+            "hop": ttl,
+            "ip": reply["addr"],
+            "times": [round(reply["rtt"], 3)],
+            "hostname": None
+        }
+        if reply.get("remembered"):
+            # Filled in from the Doubletree stop set, not probed by this trace
+            hop["remembered"] = True
+        if reply["type"] == ICMP_DESTINATION_UNREACHABLE:
+            hop["unreachable"] = IcmpHelperLibrary.convertIcmpMessage(reply["type"], reply["code"],
+                                                                      reply.get("family", 4))
+        return hop
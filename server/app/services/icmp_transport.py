@@ -0,0 +1,696 @@
+import errno
+import heapq
+import os
+import select
+import socket as socket_module
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, InvalidStateError
+from socket import socket, socketpair, inet_pton, inet_ntop, AF_INET, AF_INET6, SOCK_RAW, SOCK_DGRAM, \
+    IPPROTO_ICMP, IPPROTO_ICMPV6, IPPROTO_IP, IPPROTO_IPV6, IP_TTL, IPV6_UNICAST_HOPS, SOL_SOCKET, SO_RCVBUF, SO_ERROR
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+# ICMP message types the transport routes
+ICMP_ECHO_REPLY = 0
+ICMP_DESTINATION_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+# ICMPv6 counterparts; replies are reported under the ICMPv4 type they correspond to
+ICMPV6_DESTINATION_UNREACHABLE = 1
+ICMPV6_TIME_EXCEEDED = 3
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+_ICMPV6_EQUIVALENTS = {
+    ICMPV6_ECHO_REPLY: ICMP_ECHO_REPLY,
+    ICMPV6_DESTINATION_UNREACHABLE: ICMP_DESTINATION_UNREACHABLE,
+    ICMPV6_TIME_EXCEEDED: ICMP_TIME_EXCEEDED
+}
+_PORT_UNREACHABLE = {AF_INET: 3, AF_INET6: 4}  # Destination Unreachable code a UDP probe's target answers with
+
+# Linux raw socket filter (SOL_RAW / ICMP_FILTER): a set bit drops that ICMP type in the kernel
+SOL_RAW = 255
+ICMP_FILTER = 1
+SO_RCVBUFFORCE = 33
+_WANTED_TYPES_MASK = (1 << ICMP_ECHO_REPLY) | (1 << ICMP_DESTINATION_UNREACHABLE) | (1 << ICMP_TIME_EXCEEDED)
+# ICMPv6 equivalent (IPPROTO_ICMPV6 / ICMP6_FILTER): 256 bits, a set bit blocks that type
+ICMP6_FILTER = 1
+_IPV6_HEADER_LENGTH = 40  # Raw ICMPv6 sockets deliver the ICMPv6 message without it; quoted probes carry it
+
+# Extended socket errors (IP_RECVERR / IPV6_RECVERR): datagram sockets get the ICMP errors their
+# packets caused on an error queue, read with MSG_ERRQUEUE
+IP_RECVERR = getattr(socket_module, "IP_RECVERR", 11)
+IPV6_RECVERR = getattr(socket_module, "IPV6_RECVERR", 25)
+MSG_ERRQUEUE = getattr(socket_module, "MSG_ERRQUEUE", 0x2000)
+SO_EE_ORIGIN_ICMP = 2
+SO_EE_ORIGIN_ICMP6 = 3
+_EXTENDED_ERROR = struct.Struct("=IBBBBII")  # struct sock_extended_err, followed by the offender's sockaddr
+_RECVERR_OPTIONS = {AF_INET: (IPPROTO_IP, IP_RECVERR), AF_INET6: (IPPROTO_IPV6, IPV6_RECVERR)}
+_TTL_OPTIONS = {AF_INET: (IPPROTO_IP, IP_TTL), AF_INET6: (IPPROTO_IPV6, IPV6_UNICAST_HOPS)}
+# Errors a queued ICMP error also leaves pending on the socket, where the next send picks them up
+_ICMP_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ECONNREFUSED, errno.EACCES, errno.EPROTO}
+_SEND_ATTEMPTS = 3
+
+# UDP probes: one destination port per probe in flight, from the classic traceroute base port up
+UDP_BASE_PORT = 33434
+UDP_PORT_COUNT = 32000
+
+_IDENTIFIER_SEQUENCE = struct.Struct("!HH")  # Echo identifier and sequence number, 4 bytes into the ICMP header
+
+
+def _icmp6_filter(passed_types) -> bytes:
+    words = [0xffffffff] * 8
+    for icmp_type in passed_types:
+        words[icmp_type >> 5] &= ~(1 << (icmp_type & 31)) & 0xffffffff
+    return struct.pack("8I", *words)
+
+
+def _open_transport() -> "IcmpTransport":
+    """
+    Open the transport for probe_socket_mode. "auto" takes the first mode this process may use:
+    raw sockets, then ICMP datagram (ping) sockets, then UDP probes.
+    """
+    modes = {transport_class.mode: transport_class
+             for transport_class in (IcmpTransport, DatagramIcmpTransport, UdpProbeTransport)}
+    if settings.probe_socket_mode != "auto":
+        if settings.probe_socket_mode not in modes:
+            raise ValueError(f"Unknown probe_socket_mode {settings.probe_socket_mode!r}")
+        return modes[settings.probe_socket_mode]()
+
+    for transport_class in modes.values():
+        try:
+            transport = transport_class()
+        except PermissionError as e:
+            print(f"{transport_class.mode} probe sockets unavailable: {e}")
+            continue
+        print(f"Probing with {transport.mode} sockets")
+        return transport
+    raise PermissionError("No probe socket mode is available to this process")
+
+
+class _PendingProbe:
+    __slots__ = ("future", "key", "destination", "packed_destination", "sent_time", "deadline", "wire", "probe")
+
+    def __init__(self, future: Future, key: Tuple[int, int], destination: str, packed_destination: bytes,
+                 sent_time: float, deadline: float):
+        self.future = future
+        self.key = key
+        self.destination = destination
+        self.packed_destination = packed_destination  # As error messages quote it
+        self.sent_time = sent_time
+        self.deadline = deadline
+        self.wire: Optional[int] = None  # Datagram modes: the sequence number or port the probe went out with
+        self.probe: Optional[bytes] = None
+
+
+class IcmpTransport:
+    """
+    Process-wide raw ICMP transport: one send socket and one receive socket per address family, the
+    receive sockets owned by a background reader thread that routes every reply to the probe waiting for it.
+    The ICMPv6 pair is opened alongside the ICMPv4 one when the host supports IPv6.
+    Without raw socket access, get_instance() falls back to the unprivileged datagram transports below.
+    """
+
+    mode = "raw"
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "IcmpTransport":
+        """
+        Return the shared transport, opening it on first use in the mode probe_socket_mode selects.
+        Raises PermissionError if this process may not open probe sockets at all.
+        """
+        if IcmpTransport._instance is None:
+            with IcmpTransport._instance_lock:
+                if IcmpTransport._instance is None:
+                    IcmpTransport._instance = _open_transport()
+        return IcmpTransport._instance
+
+    @classmethod
+    def shutdown(cls):
+        """Close the shared transport if it was opened"""
+        with IcmpTransport._instance_lock:
+            if IcmpTransport._instance is not None:
+                IcmpTransport._instance.close()
+                IcmpTransport._instance = None
+
+    def __init__(self):
+        self._senders: Dict[int, socket] = {}  # Address family -> socket probes go out on
+        self._receivers: List[Tuple[socket, int]] = []  # (socket, address family) pairs the reader drains
+        try:
+            self._open_sockets()
+        except OSError:
+            self._close_sockets()
+            raise
+
+        self._wakeup_reader, self._wakeup_writer = socketpair()
+        self._wakeup_reader.setblocking(False)
+
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: Dict[Tuple[int, int], _PendingProbe] = {}
+        self._deadlines = []
+        self._next_identifier = os.getpid() & 0xffff
+        self._closed = False
+
+        self._reader = threading.Thread(target=self._read_loop, name="icmp-transport-reader", daemon=True)
+        self._reader.start()
+
+    def _open_sockets(self):
+        send_socket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+        self._senders[AF_INET] = send_socket
+        recv_socket = socket(AF_INET, SOCK_RAW, IPPROTO_ICMP)
+        self._receivers.append((recv_socket, AF_INET))
+
+        # Every raw ICMP socket gets a copy of every ICMP packet. Keep the send socket's queue empty
+        # and let only the types we route reach the receive socket.
+        try:
+            send_socket.setsockopt(SOL_RAW, ICMP_FILTER, struct.pack("I", 0xffffffff))
+            recv_socket.setsockopt(SOL_RAW, ICMP_FILTER, struct.pack("I", ~_WANTED_TYPES_MASK & 0xffffffff))
+        except OSError:
+            pass
+        IcmpTransport._prepare_receiver(recv_socket)
+
+        # The kernel fills in ICMPv6 checksums (they cover a pseudo-header with the source address)
+        try:
+            send_socket6 = socket(AF_INET6, SOCK_RAW, IPPROTO_ICMPV6)
+            self._senders[AF_INET6] = send_socket6
+            recv_socket6 = socket(AF_INET6, SOCK_RAW, IPPROTO_ICMPV6)
+            self._receivers.append((recv_socket6, AF_INET6))
+            send_socket6.setsockopt(IPPROTO_ICMPV6, ICMP6_FILTER, _icmp6_filter(()))
+            recv_socket6.setsockopt(IPPROTO_ICMPV6, ICMP6_FILTER, _icmp6_filter(_ICMPV6_EQUIVALENTS))
+            IcmpTransport._prepare_receiver(recv_socket6)
+        except OSError as e:
+            print(f"ICMPv6 unavailable, IPv6 targets need the traceroute subprocess: {e}")
+            self._drop_family(AF_INET6)
+
+    @staticmethod
+    def _prepare_receiver(sock: socket):
+        sock.setblocking(False)
+        # Hundreds of traces answering at once overflow the default receive buffer and silently drop replies
+        try:
+            sock.setsockopt(SOL_SOCKET, SO_RCVBUFFORCE, settings.icmp_receive_buffer)
+        except OSError:
+            sock.setsockopt(SOL_SOCKET, SO_RCVBUF, settings.icmp_receive_buffer)
+
+    def _drop_family(self, family: int):
+        """Close whatever was opened for an address family that turned out to be unusable"""
+        sender = self._senders.pop(family, None)
+        if sender is not None:
+            sender.close()
+        for receiver in [receiver for receiver in self._receivers if receiver[1] == family]:
+            receiver[0].close()
+            self._receivers.remove(receiver)
+
+    def _close_sockets(self):
+        for sock in set(self._senders.values()) | {sock for sock, _ in self._receivers}:
+            sock.close()
+
+    def allocate_identifier(self) -> int:
+        """
+        Hand out a distinct ICMP identifier so concurrent users of the socket never share (identifier, sequence) keys.
+        """
+        with self._lock:
+            self._next_identifier = (self._next_identifier + 1) & 0xffff
+            return self._next_identifier
+
+    def send_probe(self, destination: str, packet: bytes, identifier: int, sequence: int,
+                   ttl: int, timeout: float) -> Future:
+        """
+        Send one ICMP (or, to an IPv6 destination, ICMPv6) probe and return a Future that resolves to the
+        matching reply dict, or to None if nothing arrives within timeout seconds.
+        """
+        future = Future()
+        key = (identifier, sequence)
+        family = AF_INET6 if ":" in destination else AF_INET
+        send_socket = self._senders.get(family)
+        if send_socket is None:
+            raise OSError(f"Cannot probe {destination}: IPv6 {self.mode} sockets are not available on this host")
+        # Link-local destinations carry a scope suffix (fe80::1%eth0) that error messages do not quote
+        packed_destination = inet_pton(family, destination.split("%", 1)[0])
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ICMP transport is closed")
+            if key in self._pending:
+                raise ValueError(f"Probe with identifier {identifier} and sequence {sequence} already in flight")
+
+            # Register before sending so a fast reply can never beat the bookkeeping
+            sent_time = time.time()
+            pending = _PendingProbe(future, key, destination, packed_destination, sent_time, sent_time + timeout)
+            self._register(pending)
+            heapq.heappush(self._deadlines, (pending.deadline, key, pending))
+
+        try:
+            with self._send_lock:
+                send_socket.setsockopt(*_TTL_OPTIONS[family], ttl)
+                self._send(send_socket, pending, packet)
+        except OSError:
+            with self._lock:
+                self._forget(pending)
+            raise
+
+        # Wake the reader so it picks up a deadline that may be earlier than the one it sleeps on
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+
+        return future
+
+    def _register(self, pending: _PendingProbe):
+        """Make a probe findable by its reply (lock held)"""
+        self._pending[pending.key] = pending
+
+    def _forget(self, pending: _PendingProbe):
+        """Undo _register if the probe is still the one registered under its key (lock held)"""
+        if self._pending.get(pending.key) is pending:
+            del self._pending[pending.key]
+
+    def _send(self, send_socket: socket, pending: _PendingProbe, packet: bytes):
+        pending.sent_time = time.time()
+        send_socket.sendto(packet, (pending.destination, 0))
+
+    def supports_ipv6(self) -> bool:
+        """Whether IPv6 destinations can be probed"""
+        return AF_INET6 in self._senders
+
+    def pending_count(self) -> int:
+        """Number of probes currently waiting for a reply"""
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        """Stop the reader thread, time out every waiting probe and close the sockets"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+        self._reader.join(timeout=1)
+
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._deadlines.clear()
+        for probe in pending:
+            self._resolve(probe.future, None)
+
+        self._close_sockets()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    @staticmethod
+    def parse_reply(packet: bytes, family: int = AF_INET) -> Optional[Dict]:
+        """
+        Decode a received IPv4 packet (or ICMPv6 message) into ICMP type/code plus the identifier and sequence
+        number of the probe it answers. Error messages also report the destination quoted in the embedded header.
+        """
+        if family == AF_INET6:
+            return IcmpTransport._parse_reply6(packet)
+        try:
+            ip_header_length = (packet[0] & 0x0f) * 4
+            icmp_type, icmp_code = packet[ip_header_length:ip_header_length + 2]
+            original_destination = None
+
+            if icmp_type == ICMP_ECHO_REPLY:
+                identifier, sequence = _IDENTIFIER_SEQUENCE.unpack_from(packet, ip_header_length + 4)
+            elif icmp_type in (ICMP_TIME_EXCEEDED, ICMP_DESTINATION_UNREACHABLE):
+                # Error messages quote the original IP header followed by the first 8 bytes of our probe
+                inner_offset = ip_header_length + 8
+                inner_header_length = (packet[inner_offset] & 0x0f) * 4
+                if packet[inner_offset + 9] != IPPROTO_ICMP:
+                    return None
+                original_destination = packet[inner_offset + 16:inner_offset + 20]
+                probe_offset = inner_offset + inner_header_length
+                if packet[probe_offset] != ICMP_ECHO_REQUEST:
+                    return None
+                identifier, sequence = _IDENTIFIER_SEQUENCE.unpack_from(packet, probe_offset + 4)
+            else:
+                return None
+
+            return {
+                "type": icmp_type,
+                "code": icmp_code,
+                "identifier": identifier,
+                "sequence": sequence,
+                "original_destination": original_destination,
+                "family": 4,
+                "icmp_offset": ip_header_length
+            }
+        except (IndexError, struct.error):
+            return None
+
+    @staticmethod
+    def _parse_reply6(message: bytes) -> Optional[Dict]:
+        try:
+            icmp_type, icmp_code = message[0:2]
+            original_destination = None
+
+            if icmp_type == ICMPV6_ECHO_REPLY:
+                identifier, sequence = _IDENTIFIER_SEQUENCE.unpack_from(message, 4)
+            elif icmp_type in (ICMPV6_TIME_EXCEEDED, ICMPV6_DESTINATION_UNREACHABLE):
+                # Error messages quote as much of the original packet as fits: its fixed IPv6 header
+                # (we send no extension headers) followed by our probe
+                inner_offset = 8
+                if message[inner_offset + 6] != IPPROTO_ICMPV6:
+                    return None
+                original_destination = message[inner_offset + 24:inner_offset + 40]
+                probe_offset = inner_offset + _IPV6_HEADER_LENGTH
+                if message[probe_offset] != ICMPV6_ECHO_REQUEST:
+                    return None
+                identifier, sequence = _IDENTIFIER_SEQUENCE.unpack_from(message, probe_offset + 4)
+            else:
+                return None
+
+            return {
+                "type": _ICMPV6_EQUIVALENTS[icmp_type],
+                "code": icmp_code,
+                "identifier": identifier,
+                "sequence": sequence,
+                "original_destination": original_destination,
+                "family": 6,
+                "icmp_offset": 0
+            }
+        except (IndexError, struct.error):
+            return None
+
+    @staticmethod
+    def _resolve(future: Future, result):
+        try:
+            if not future.done():
+                future.set_result(result)
+        except InvalidStateError:
+            # Cancelled by the caller between the check and the set
+            pass
+
+    def _expire_deadlines(self, now: float) -> Optional[float]:
+        """
+        Time out overdue probes and return the next deadline, if any.
+        """
+        expired = []
+        with self._lock:
+            while self._deadlines:
+                deadline, key, pending = self._deadlines[0]
+                if self._pending.get(key) is not pending:
+                    # Already answered (or replaced); drop the stale heap entry
+                    heapq.heappop(self._deadlines)
+                    continue
+                if deadline > now:
+                    break
+                heapq.heappop(self._deadlines)
+                self._forget(pending)
+                expired.append(pending)
+            next_deadline = self._deadlines[0][0] if self._deadlines else None
+
+        for pending in expired:
+            self._resolve(pending.future, None)
+        return next_deadline
+
+    def _lookup(self, reply: Dict) -> Optional[_PendingProbe]:
+        """The probe a parsed reply answers (lock held)"""
+        return self._pending.get((reply["identifier"], reply["sequence"]))
+
+    def _reply_packet(self, pending: _PendingProbe, reply: Dict, packet: bytes) -> bytes:
+        """The packet handed to the caller with the reply"""
+        return packet
+
+    def _deliver(self, reply: Dict, addr: str, time_received: float, packet: bytes):
+        """Resolve the probe a parsed reply answers, if it is still waiting"""
+        with self._lock:
+            pending = self._lookup(reply)
+            if pending is None:
+                return
+            # Errors must quote a probe we sent to this destination, not a stranger's reused identifier
+            if reply["original_destination"] is not None and \
+                    reply["original_destination"] != pending.packed_destination:
+                return
+            self._forget(pending)
+
+        reply["identifier"], reply["sequence"] = pending.key
+        reply["addr"] = addr
+        reply["rtt"] = (time_received - pending.sent_time) * 1000
+        reply["time_received"] = time_received
+        reply["packet"] = self._reply_packet(pending, reply, packet)
+        self._resolve(pending.future, reply)
+
+    def _receive(self, recv_socket: socket, family: int) -> bool:
+        """
+        Drain everything that has queued up on recv_socket since the last select. False once the socket is gone.
+        """
+        while True:
+            try:
+                packet, addr = recv_socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError:
+                return False
+            reply = IcmpTransport.parse_reply(packet, family)
+            if reply:
+                self._deliver(reply, addr[0], time.time(), packet)
+
+    def _read_loop(self):
+        readable = [sock for sock, _ in self._receivers] + [self._wakeup_reader]
+
+        while not self._closed:
+            next_deadline = self._expire_deadlines(time.time())
+            wait = 1.0 if next_deadline is None else max(0.0, min(1.0, next_deadline - time.time()))
+
+            try:
+                ready, _, _ = select.select(readable, [], [], wait)
+            except (OSError, ValueError):
+                break
+
+            if self._wakeup_reader in ready:
+                try:
+                    while self._wakeup_reader.recv(4096):
+                        pass
+                except (BlockingIOError, OSError):
+                    pass
+
+            for recv_socket, family in self._receivers:
+                if recv_socket in ready and not self._receive(recv_socket, family):
+                    return
+
+
+class _ErrorQueueTransport(IcmpTransport, ABC):
+    """
+    Shared part of the unprivileged modes: one datagram socket per address family both sends and receives,
+    and with IP_RECVERR the ICMP errors our probes cause are queued on its error queue. The socket decides
+    part of what goes on the wire, so every probe in flight gets a "wire" number of its own (a sequence
+    number or a port) that replies are matched on.
+    """
+
+    _protocols = {AF_INET: 0, AF_INET6: 0}
+    _wire_count = 0x10000
+
+    def _open_sockets(self):
+        for family in (AF_INET, AF_INET6):
+            try:
+                probe_socket = socket(family, SOCK_DGRAM, self._protocols[family])
+                self._senders[family] = probe_socket
+                self._receivers.append((probe_socket, family))
+                probe_socket.setsockopt(*_RECVERR_OPTIONS[family], 1)
+                IcmpTransport._prepare_receiver(probe_socket)
+            except OSError as e:
+                if family == AF_INET:
+                    raise
+                print(f"IPv6 {self.mode} sockets unavailable, IPv6 targets need the traceroute subprocess: {e}")
+                self._drop_family(AF_INET6)
+
+        self._wires: Dict[int, _PendingProbe] = {}
+        self._next_wire = 0
+
+    @staticmethod
+    def _sendto(send_socket: socket, data: bytes, address: Tuple):
+        # A reply that arrived since the last send may have left its error pending on the socket; it belongs
+        # to the error queue, not to this send. A genuinely unroutable destination keeps failing.
+        for attempt in range(_SEND_ATTEMPTS):
+            send_socket.getsockopt(SOL_SOCKET, SO_ERROR)
+            try:
+                send_socket.sendto(data, address)
+                return
+            except OSError as e:
+                if e.errno not in _ICMP_ERRNOS or attempt == _SEND_ATTEMPTS - 1:
+                    raise
+
+    def _register(self, pending: _PendingProbe):
+        if len(self._wires) >= self._wire_count:
+            raise OSError(errno.ENOBUFS, f"All {self._wire_count} {self.mode} probe slots are in flight")
+        while self._next_wire in self._wires:
+            self._next_wire = (self._next_wire + 1) % self._wire_count
+        pending.wire = self._next_wire
+        self._next_wire = (self._next_wire + 1) % self._wire_count
+        self._wires[pending.wire] = pending
+        super()._register(pending)
+
+    def _forget(self, pending: _PendingProbe):
+        if self._wires.get(pending.wire) is pending:
+            del self._wires[pending.wire]
+        super()._forget(pending)
+
+    def _lookup(self, reply: Dict) -> Optional[_PendingProbe]:
+        return self._wires.get(reply["wire"])
+
+    def _receive(self, recv_socket: socket, family: int) -> bool:
+        # ICMP errors first, then ordinary datagrams
+        while True:
+            try:
+                data, ancdata, _, addr = recv_socket.recvmsg(2048, 512, MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                return False
+            time_received = time.time()
+            reply = self._parse_error(data, ancdata, addr, family)
+            if reply:
+                self._deliver(reply, reply.pop("offender"), time_received, data)
+
+        while True:
+            try:
+                data, addr = recv_socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError as e:
+                # Each queued ICMP error is also reported once as a pending socket error
+                if e.errno in (errno.EBADF, errno.ENOTSOCK):
+                    return False
+                continue
+            self._receive_datagram(data, addr, time.time(), family)
+
+    def _receive_datagram(self, data: bytes, addr: Tuple, time_received: float, family: int):
+        """Handle an ordinary datagram; ICMP errors are all some modes ever get"""
+
+    def _parse_error(self, data: bytes, ancdata: List, addr: Tuple, family: int) -> Optional[Dict]:
+        """
+        Decode one error queue entry into a reply dict carrying the answering router as "offender", or None
+        if it is not an ICMP Time Exceeded / Destination Unreachable for one of our probes
+        """
+        for level, cmsg_type, cmsg_data in ancdata:
+            if (level, cmsg_type) != _RECVERR_OPTIONS[family] or len(cmsg_data) < _EXTENDED_ERROR.size:
+                continue
+            _, origin, icmp_type, icmp_code, _, _, _ = _EXTENDED_ERROR.unpack_from(cmsg_data)
+            if origin == SO_EE_ORIGIN_ICMP6:
+                icmp_type = _ICMPV6_EQUIVALENTS.get(icmp_type)
+            elif origin != SO_EE_ORIGIN_ICMP:
+                # Local errors (e.g. EMSGSIZE) are not replies
+                continue
+            if icmp_type not in (ICMP_TIME_EXCEEDED, ICMP_DESTINATION_UNREACHABLE):
+                continue
+
+            offender = _ErrorQueueTransport._sockaddr_address(cmsg_data[_EXTENDED_ERROR.size:])
+            wire = self._error_wire(data, addr)
+            if offender is None or wire is None:
+                continue
+            return {
+                "type": icmp_type,
+                "code": icmp_code,
+                "wire": wire,
+                # The error queue reports the destination of the packet that caused the error
+                "original_destination": inet_pton(family, addr[0].split("%", 1)[0]),
+                "family": 4 if family == AF_INET else 6,
+                "icmp_offset": 0,
+                "offender": offender
+            }
+        return None
+
+    @abstractmethod
+    def _error_wire(self, data: bytes, addr: Tuple) -> Optional[int]:
+        """Wire number of the probe an error queue entry refers to, from its payload or original destination"""
+
+    @staticmethod
+    def _sockaddr_address(sockaddr: bytes) -> Optional[str]:
+        # SO_EE_OFFENDER is a raw sockaddr_in / sockaddr_in6 (family in host byte order)
+        if len(sockaddr) >= 8 and struct.unpack_from("=H", sockaddr)[0] == AF_INET:
+            return inet_ntop(AF_INET, sockaddr[4:8])
+        if len(sockaddr) >= 24 and struct.unpack_from("=H", sockaddr)[0] == AF_INET6:
+            return inet_ntop(AF_INET6, sockaddr[8:24])
+        return None
+
+
+class DatagramIcmpTransport(_ErrorQueueTransport):
+    """
+    ICMP datagram ("ping") sockets: echo requests without root, for the groups net.ipv4.ping_group_range
+    allows. The kernel owns the echo identifier (one per socket) and the checksum, so the sequence number
+    on the wire is the transport's own and Paris flow identifiers do not survive; replies are handed back
+    with the caller's identifier and sequence restored. Echo replies arrive as datagrams, Time Exceeded
+    and Unreachable on the error queue.
+    """
+
+    mode = "icmp-dgram"
+    _protocols = {AF_INET: IPPROTO_ICMP, AF_INET6: IPPROTO_ICMPV6}
+
+    def _send(self, send_socket: socket, pending: _PendingProbe, packet: bytes):
+        wire_packet = bytearray(packet)
+        struct.pack_into("!H", wire_packet, 6, pending.wire)
+        pending.sent_time = time.time()
+        _ErrorQueueTransport._sendto(send_socket, wire_packet, (pending.destination, 0))
+
+    def _error_wire(self, data: bytes, addr: Tuple) -> Optional[int]:
+        # The error queue hands back the echo request the router quoted
+        if len(data) < 8 or data[0] not in (ICMP_ECHO_REQUEST, ICMPV6_ECHO_REQUEST):
+            return None
+        return struct.unpack_from("!H", data, 6)[0]
+
+    def _receive_datagram(self, data: bytes, addr: Tuple, time_received: float, family: int):
+        if len(data) < 8 or data[0] not in (ICMP_ECHO_REPLY, ICMPV6_ECHO_REPLY):
+            return
+        reply = {
+            "type": ICMP_ECHO_REPLY,
+            "code": data[1],
+            "wire": struct.unpack_from("!H", data, 6)[0],
+            "original_destination": None,
+            "family": 4 if family == AF_INET else 6,
+            "icmp_offset": 0
+        }
+        self._deliver(reply, addr[0], time_received, data)
+
+    def _reply_packet(self, pending: _PendingProbe, reply: Dict, packet: bytes) -> bytes:
+        if reply["type"] != ICMP_ECHO_REPLY:
+            return packet
+        # Callers validate echo replies against the identifier and sequence number they sent
+        restored = bytearray(packet)
+        _IDENTIFIER_SEQUENCE.pack_into(restored, 4, *pending.key)
+        return bytes(restored)
+
+
+class UdpProbeTransport(_ErrorQueueTransport):
+    """
+    UDP probes to high ports from an ordinary socket, so no privileges at all: routers answer Time Exceeded
+    and the destination Port Unreachable, both read from the error queue. Every probe in flight goes to a
+    port of its own (classic rather than Paris traceroute). Reaching the destination is reported as an echo
+    reply carrying the probe itself as its packet, so ping-style callers find their identifier and payload.
+    """
+
+    mode = "udp"
+    _wire_count = UDP_PORT_COUNT
+
+    def _send(self, send_socket: socket, pending: _PendingProbe, packet: bytes):
+        pending.probe = bytes(packet)
+        pending.sent_time = time.time()
+        _ErrorQueueTransport._sendto(send_socket, pending.probe, (pending.destination, UDP_BASE_PORT + pending.wire))
+
+    def _error_wire(self, data: bytes, addr: Tuple) -> Optional[int]:
+        # The original destination comes with its port
+        wire = addr[1] - UDP_BASE_PORT
+        return wire if 0 <= wire < UDP_PORT_COUNT else None
+
+    def _parse_error(self, data: bytes, ancdata: List, addr: Tuple, family: int) -> Optional[Dict]:
+        reply = super()._parse_error(data, ancdata, addr, family)
+        if reply is not None and reply["type"] == ICMP_DESTINATION_UNREACHABLE \
+                and reply["code"] == _PORT_UNREACHABLE[family] \
+                and inet_pton(family, reply["offender"]) == reply["original_destination"]:
+            reply["type"] = ICMP_ECHO_REPLY
+            reply["code"] = 0
+        return reply
+
+    def _reply_packet(self, pending: _PendingProbe, reply: Dict, packet: bytes) -> bytes:
+        return pending.probe if reply["type"] == ICMP_ECHO_REPLY and pending.probe is not None else packet
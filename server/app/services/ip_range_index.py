@@ -0,0 +1,269 @@
+import bisect
+import mmap
+import os
+import socket
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import numpy
+except ImportError:  # Batch lookups fall back to bisect
+    numpy = None
+
+# Column positions per IP2Location database type (1-based, 0 = column not present),
+# mirroring the tables in the IP2Location library
+_COUNTRY_POSITION = (0, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2, 2)
+_REGION_POSITION = (0, 0, 0, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3, 3)
+_CITY_POSITION = (0, 0, 0, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4)
+_LATITUDE_POSITION = (0, 0, 0, 0, 0, 5, 5, 0, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5)
+_LONGITUDE_POSITION = (0, 0, 0, 0, 0, 6, 6, 0, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6, 6)
+
+_BIN_HEADER = struct.Struct("<BBBBBIIIIII")
+_UINT32 = struct.Struct("<I")
+_FLOAT32 = struct.Struct("<f")
+_IPV4 = struct.Struct("!I")
+_MAX_IPV4 = 0xFFFFFFFF
+
+# magic, byte-order mark, row count, string count, source size, source mtime
+_INDEX_HEADER = struct.Struct("=8sIIIQd")
+_INDEX_MAGIC = b"PKTIDX01"
+_BYTE_ORDER_MARK = 0x01020304
+_HEADER_SIZE = 64
+
+# Per-row columns after the range starts, in file order
+_FLOAT_COLUMNS = ("latitude", "longitude")
+_STRING_COLUMNS = ("country_code", "country", "region", "city")
+
+
+class IpRangeIndex:
+    """
+    Compiled, memory-mapped IPv4 range index built from an IP2Location BIN file.
+    Range starts are one sorted uint32 array and every field is its own column (strings interned into
+    a shared table), so a lookup is a binary search plus a few indexed reads with no per-lookup parsing.
+    The file is mapped read-only, so every worker process shares the same pages.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(self.path, "rb") as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order_mark, count, string_count, _, _ = _INDEX_HEADER.unpack_from(self._mmap, 0)
+        if magic != _INDEX_MAGIC or byte_order_mark != _BYTE_ORDER_MARK:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not an IP range index for this platform")
+
+        self.count = count
+        self._buffer = memoryview(self._mmap)
+        self._views = []
+        offset = _HEADER_SIZE
+
+        self._starts = self._column(offset, count, "I")
+        offset += count * 4
+        self._floats = {}
+        for name in _FLOAT_COLUMNS:
+            self._floats[name] = self._column(offset, count, "f")
+            offset += count * 4
+        self._strings = {}
+        for name in _STRING_COLUMNS:
+            self._strings[name] = self._column(offset, count, "I")
+            offset += count * 4
+
+        string_offsets = self._column(offset, string_count + 1, "I")
+        offset += (string_count + 1) * 4
+        blob = bytes(self._buffer[offset:offset + string_offsets[-1]])
+        # The string table is tiny next to the row columns, decode it once
+        self._string_table = [
+            blob[string_offsets[i]:string_offsets[i + 1]].decode("utf-8") or None
+            for i in range(string_count)
+        ]
+        string_offsets.release()
+        self._views.remove(string_offsets)
+
+        self._numpy_starts = numpy.frombuffer(self._mmap, dtype=numpy.uint32, count=count, offset=_HEADER_SIZE) \
+            if numpy is not None else None
+
+    def _column(self, offset: int, count: int, typecode: str) -> memoryview:
+        view = self._buffer[offset:offset + count * 4].cast(typecode)
+        self._views.append(view)
+        return view
+
+    @staticmethod
+    def is_current(index_path: str, bin_path: str) -> bool:
+        """
+        Check that an index file exists, is readable here and was built from the current BIN file.
+        """
+        try:
+            with open(index_path, "rb") as index_file:
+                header = index_file.read(_INDEX_HEADER.size)
+            magic, byte_order_mark, _, _, source_size, source_mtime = _INDEX_HEADER.unpack(header)
+            source = os.stat(bin_path)
+        except (OSError, struct.error):
+            return False
+
+        return magic == _INDEX_MAGIC and byte_order_mark == _BYTE_ORDER_MARK and \
+            source_size == source.st_size and source_mtime == source.st_mtime
+
+    @staticmethod
+    def build(bin_path: str, index_path: str) -> int:
+        """
+        Compile the IPv4 section of an IP2Location BIN file into an index file and return its row count.
+        Written to a temporary file and renamed, so concurrent workers never see a partial index.
+        """
+        source = os.stat(bin_path)
+        with open(bin_path, "rb") as bin_file:
+            data = mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            dbtype, dbcolumn, _, _, _, count, base_address, _, _, _, _ = _BIN_HEADER.unpack_from(data, 0)
+
+            string_ids = {"": 0}
+
+            def intern(pointer: int) -> int:
+                # Length-prefixed ISO-8859-1 string; BIN offsets are 1-based
+                length = data[pointer]
+                value = data[pointer + 1:pointer + 1 + length].decode("iso-8859-1")
+                return string_ids.setdefault(value, len(string_ids))
+
+            def position(table) -> int:
+                return table[dbtype] if dbtype < len(table) else 0
+
+            columns = {"starts": array("I")}
+            columns.update((name, array("f")) for name in _FLOAT_COLUMNS)
+            columns.update((name, array("I")) for name in _STRING_COLUMNS)
+            row_width = dbcolumn * 4
+            field_positions = {
+                "country": position(_COUNTRY_POSITION),
+                "region": position(_REGION_POSITION),
+                "city": position(_CITY_POSITION),
+                "latitude": position(_LATITUDE_POSITION),
+                "longitude": position(_LONGITUDE_POSITION)
+            }
+
+            for row in range(count):
+                row_offset = base_address - 1 + row * row_width
+                columns["starts"].append(_UINT32.unpack_from(data, row_offset)[0])
+
+                def field(name: str, unpacker: struct.Struct):
+                    return unpacker.unpack_from(data, row_offset + 4 * (field_positions[name] - 1))[0]
+
+                for name in _FLOAT_COLUMNS:
+                    columns[name].append(field(name, _FLOAT32) if field_positions[name] else float("nan"))
+
+                if field_positions["country"]:
+                    country_pointer = field("country", _UINT32)
+                    columns["country_code"].append(intern(country_pointer))
+                    columns["country"].append(intern(country_pointer + 3))
+                else:
+                    columns["country_code"].append(0)
+                    columns["country"].append(0)
+
+                for name in ("region", "city"):
+                    columns[name].append(intern(field(name, _UINT32)) if field_positions[name] else 0)
+        finally:
+            data.close()
+
+        encoded = [value.encode("utf-8") for value in string_ids]
+        string_offsets = array("I", [0])
+        for value in encoded:
+            string_offsets.append(string_offsets[-1] + len(value))
+
+        Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as index_file:
+            header = _INDEX_HEADER.pack(_INDEX_MAGIC, _BYTE_ORDER_MARK, count, len(encoded),
+                                        source.st_size, source.st_mtime)
+            index_file.write(header.ljust(_HEADER_SIZE, b"\0"))
+            index_file.write(columns["starts"].tobytes())
+            for name in _FLOAT_COLUMNS + _STRING_COLUMNS:
+                index_file.write(columns[name].tobytes())
+            index_file.write(string_offsets.tobytes())
+            index_file.write(b"".join(encoded))
+        os.replace(temporary_path, index_path)
+
+        return count
+
+    @staticmethod
+    def ip_to_int(ip_address: str) -> Optional[int]:
+        """
+        IPv4 address as an integer, or None if it is not a dotted-quad IPv4 address.
+        """
+        try:
+            ip_number = _IPV4.unpack(socket.inet_pton(socket.AF_INET, ip_address))[0]
+        except (OSError, TypeError):
+            return None
+        # The last range's end is exclusive, so the library maps the broadcast address onto the one below
+        return min(ip_number, _MAX_IPV4 - 1)
+
+    def _row(self, ip_number: int) -> int:
+        return bisect.bisect_right(self._starts, ip_number) - 1
+
+    def _record(self, row: int) -> Optional[Dict]:
+        if row < 0:
+            return None
+
+        strings = self._string_table
+        country_code = strings[self._strings["country_code"][row]]
+        if country_code is None or country_code == "-":
+            return None
+
+        latitude = self._floats["latitude"][row]
+        longitude = self._floats["longitude"][row]
+        return {
+            # Same six-decimal strings the IP2Location library returns
+            "latitude": format(round(latitude, 6), ".6f") if latitude == latitude else None,
+            "longitude": format(round(longitude, 6), ".6f") if longitude == longitude else None,
+            "country": strings[self._strings["country"][row]],
+            "country_code": country_code,
+            "city": strings[self._strings["city"][row]],
+            "region": strings[self._strings["region"][row]],
+            "postal_code": None,  # IP2Location LITE doesn't include postal codes
+            "timezone": None,     # IP2Location LITE doesn't include timezone
+            "isp": None,          # IP2Location LITE doesn't include ISP
+            "source": "ip2location-database"
+        }
+
+    def lookup(self, ip_address: str) -> Optional[Dict]:
+        """
+        Location for one IPv4 address, or None if it is not IPv4 or not covered by the database.
+        """
+        ip_number = self.ip_to_int(ip_address)
+        if ip_number is None:
+            return None
+        return self._record(self._row(ip_number))
+
+    def lookup_many(self, ip_addresses: List[str]) -> Dict[str, Dict]:
+        """
+        Bulk lookup keyed by IP, with one vectorized search when numpy is installed.
+        IPs that are not IPv4 or not covered by the database are left out.
+        """
+        ip_numbers = {}
+        for ip_address in ip_addresses:
+            ip_number = self.ip_to_int(ip_address)
+            if ip_number is not None:
+                ip_numbers[ip_address] = ip_number
+
+        if self._numpy_starts is not None and ip_numbers:
+            rows = numpy.searchsorted(
+                self._numpy_starts, numpy.fromiter(ip_numbers.values(), dtype=numpy.uint32), side="right"
+            ) - 1
+            rows = rows.tolist()
+        else:
+            rows = [self._row(ip_number) for ip_number in ip_numbers.values()]
+
+        results = {}
+        for ip_address, row in zip(ip_numbers, rows):
+            record = self._record(row)
+            if record:
+                results[ip_address] = record
+        return results
+
+    def close(self):
+        """Release the column views and unmap the file"""
+        self._numpy_starts = None
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._buffer.release()
+        self._mmap.close()
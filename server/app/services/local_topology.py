@@ -0,0 +1,149 @@
+import threading
+import time
+from socket import socket, SOCK_DGRAM
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.address_resolver import AddressResolver
+from app.services.icmp_transport import ICMP_TIME_EXCEEDED
+
+
+class _HopNode:
+    __slots__ = ("ttl", "addr", "parent", "rtt", "count", "seen_at")
+
+    def __init__(self, ttl: int, addr: Optional[str], parent: Optional[str]):
+        self.ttl = ttl
+        self.addr = addr  # None for a TTL that never answers
+        self.parent = parent
+        self.rtt: Optional[float] = None
+        self.count = 0
+        self.seen_at = 0.0
+
+
+class LocalTopology:
+    """
+    Doubletree local stop set: the near-side hops recent traces from this host went through, as a tree
+    per source address (root = the first hop). Traces start at a learned TTL past the hops every trace
+    shares and probe backwards from there; the first known interface they hit stops backward probing
+    and the hops below it are filled in from the tree.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "LocalTopology":
+        """Return the shared topology, creating it on first use"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._trees: Dict[str, Dict[Tuple[int, Optional[str]], _HopNode]] = {}  # source -> (ttl, addr) -> node
+        self._lock = threading.Lock()
+        self.traces = 0
+        self.probes_sent = 0
+        self.probes_saved = 0
+
+    @staticmethod
+    def source_for(destination_ip: str) -> Optional[str]:
+        """
+        Local address the kernel routes destination_ip from (a connected UDP socket sends nothing)
+        """
+        try:
+            with socket(AddressResolver.family(destination_ip), SOCK_DGRAM) as probe_socket:
+                probe_socket.connect((destination_ip, 33434))
+                return probe_socket.getsockname()[0]
+        except OSError:
+            return None
+
+    def start_ttl(self, source: str) -> int:
+        """
+        TTL to start forward probing at: one past the hops that every recent trace from source shared
+        (at least doubletree_min_traces times), capped at doubletree_max_start_ttl. 1 when nothing is shared.
+        """
+        now = time.monotonic()
+        shared = 0
+        with self._lock:
+            tree = self._trees.get(source, {})
+            for ttl in range(1, settings.doubletree_max_start_ttl):
+                nodes = [node for (node_ttl, _), node in tree.items()
+                         if node_ttl == ttl and now - node.seen_at < settings.doubletree_ttl]
+                if len(nodes) != 1 or nodes[0].count < settings.doubletree_min_traces:
+                    break
+                shared = ttl
+        # Starting at 2 would only trade one forward probe for one backward probe
+        return shared + 1 if shared >= 2 else 1
+
+    def path_to(self, source: str, ttl: int, addr: str) -> Optional[List[Tuple[int, Optional[str], Optional[float]]]]:
+        """
+        If (ttl, addr) is in the stop set, the remembered hops below it as (ttl, addr, rtt) from ttl - 1
+        down to 1; None if it is unknown or its branch has expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tree = self._trees.get(source, {})
+            node = tree.get((ttl, addr))
+            if node is None or now - node.seen_at >= settings.doubletree_ttl:
+                return None
+
+            path = []
+            while node.ttl > 1:
+                parent = tree.get((node.ttl - 1, node.parent))
+                if parent is None or now - parent.seen_at >= settings.doubletree_ttl:
+                    return None
+                path.append((parent.ttl, parent.addr, parent.rtt))
+                node = parent
+            return path
+
+    def learn(self, source: str, hops: Dict[int, Optional[Dict]], last_ttl: int, remembered: Set[int] = frozenset()):
+        """
+        Add a finished trace's near-side hops (TTL below doubletree_max_start_ttl) to the tree.
+        hops maps every TTL up to last_ttl to its reply, None for silent ones. TTLs in remembered were
+        filled in from the tree, not probed: they do not refresh it, so their branch still expires.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tree = self._trees.setdefault(source, {})
+            parent = None
+            for ttl in range(1, min(last_ttl, settings.doubletree_max_start_ttl - 1) + 1):
+                reply = hops.get(ttl)
+                # The destination itself is not part of the shared near side
+                if reply is not None and reply["type"] != ICMP_TIME_EXCEEDED:
+                    break
+                addr = reply["addr"] if reply is not None else None
+                if ttl in remembered:
+                    parent = addr
+                    continue
+                node = tree.get((ttl, addr))
+                if node is None or node.parent != parent:
+                    node = tree[(ttl, addr)] = _HopNode(ttl, addr, parent)
+                node.count += 1
+                node.seen_at = now
+                if reply is not None:
+                    node.rtt = reply["rtt"]
+                parent = addr
+
+            # Drop what has not been seen for a while so a changed route is relearned from scratch
+            for key in [key for key, node in tree.items() if now - node.seen_at >= settings.doubletree_ttl]:
+                del tree[key]
+
+    def record_trace(self, probes_sent: int, probes_saved: int):
+        """Count one trace's probes, and the probes the stop set spared it"""
+        with self._lock:
+            self.traces += 1
+            self.probes_sent += probes_sent
+            self.probes_saved += probes_saved
+
+    def stats(self) -> Dict:
+        """Traces, probes sent and saved, and the saved-probe ratio"""
+        with self._lock:
+            total = self.probes_sent + self.probes_saved
+            return {
+                "traces": self.traces,
+                "probes_sent": self.probes_sent,
+                "probes_saved": self.probes_saved,
+                "saved_probe_ratio": round(self.probes_saved / total, 4) if total else 0.0,
+                "sources": len(self._trees)
+            }
@@ -0,0 +1,403 @@
+import asyncio
+import heapq
+import random
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+from app.core.config import settings
+from app.services.batch_traceroute_service import BatchTracerouteService
+from app.services.hop_metrics_service import HopMetricsService
+from app.services.icmp_traceroute_service import IcmpTracerouteService
+from app.services.rtt_estimator import RttEstimate
+from app.services.traceroute_service import TracerouteService
+
+_BASELINE_SAMPLES = 3  # RTT samples a hop needs before shifts from its baseline are reported
+_SCHEDULER_JOB = "monitor"  # Job id monitor traces queue under in the shared trace scheduler
+
+
+class _HopState:
+    __slots__ = ("ip", "baseline", "deviations", "changed_run")
+
+    def __init__(self, ip: str, run: Optional[int] = None):
+        self.ip = ip  # "*" for a silent hop
+        self.baseline = RttEstimate()
+        self.deviations = 0  # Consecutive samples outside the baseline
+        self.changed_run = run  # Run in which the hop last changed, None if it never has
+
+
+class MonitorTarget:
+    """
+    One monitored target: its schedule, the last stored path and a per-TTL RTT baseline.
+    """
+
+    def __init__(self, target: str, interval: float, incremental: bool):
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.interval = interval
+        self.incremental = incremental
+        self.created_at = time.time()
+        self.destination: Optional[str] = None
+        self.path: Dict[int, _HopState] = {}
+        self.last_ttl = 0
+        self.reached = False  # The last stored path ends at the destination
+        self.next_run: Optional[float] = None  # Monotonic
+        self.last_run_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.full_traces = 0
+        self.incremental_runs = 0
+        self.ttls_probed = 0
+        self.events = 0
+        self.task: Optional[asyncio.Task] = None
+        self._runs_since_full = 0
+        self._sample_cursor = 0
+
+    def summary(self) -> Dict:
+        return {
+            "monitor_id": self.id,
+            "target": self.target,
+            "destination": self.destination,
+            "interval": self.interval,
+            "incremental": self.incremental,
+            "created_at": self.created_at,
+            "last_run_at": self.last_run_at,
+            "next_run_in": round(max(0.0, self.next_run - time.monotonic()), 3) if self.next_run else None,
+            "running": self.task is not None,
+            "path_length": self.last_ttl,
+            "reached": self.reached,
+            "runs": self.runs,
+            "full_traces": self.full_traces,
+            "incremental_runs": self.incremental_runs,
+            "ttls_probed": self.ttls_probed,
+            "events": self.events,
+            "last_error": self.last_error
+        }
+
+    def detail(self) -> Dict:
+        """summary() plus the stored path with each hop's RTT baseline"""
+        detail = self.summary()
+        detail["path"] = [{
+            "hop": ttl,
+            "ip": state.ip,
+            "srtt": round(state.baseline.srtt, 3) if state.baseline.srtt is not None else None,
+            "rttvar": round(state.baseline.rttvar, 3)
+        } for ttl, state in sorted(self.path.items())]
+        return detail
+
+
+class MonitorService:
+    """
+    Continuous path monitoring: registered targets are re-traced every interval by one scheduler task
+    and each result is compared against the stored path, producing hop_changed, hop_silent, rtt_shift
+    and path_length events. Start times are spread over the interval and jittered so thousands of
+    targets never fire together, and every trace goes through the batch scheduler's probe budget.
+    With the native engine most runs are incremental: only the end of the path, recently changed or
+    silent hops and a few sampled stable hops are probed, and any disagreement escalates to a full trace.
+    """
+
+    _targets: Dict[str, MonitorTarget] = {}
+    _schedule: List[tuple] = []  # Heap of (next_run, sequence, monitor id); removed targets are skipped lazily
+    _sequence = 0
+    _task: Optional[asyncio.Task] = None
+    _wakeup: Optional[asyncio.Event] = None
+    _events: Deque[Dict] = deque(maxlen=settings.monitor_event_history)
+    _last_event_id = 0
+    _updated: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def add(target: str, interval: Optional[float] = None, incremental: bool = True) -> MonitorTarget:
+        """
+        Register a target and schedule its first run at a random point within one interval.
+        Callers check monitor_max_targets and monitor_min_interval first.
+        """
+        monitor = MonitorTarget(target, interval or settings.monitor_default_interval, incremental)
+        MonitorService._targets[monitor.id] = monitor
+        MonitorService._push(monitor, time.monotonic() + random.uniform(0, monitor.interval))
+        if MonitorService._task is None or MonitorService._task.done():
+            MonitorService._task = asyncio.create_task(MonitorService._schedule_loop())
+        return monitor
+
+    @staticmethod
+    def remove(monitor_id: str) -> bool:
+        """Stop monitoring a target, cancelling a run in progress. False if it is unknown"""
+        monitor = MonitorService._targets.pop(monitor_id, None)
+        if monitor is None:
+            return False
+        if monitor.task is not None:
+            monitor.task.cancel()
+        MonitorService._wake()
+        return True
+
+    @staticmethod
+    def get(monitor_id: str) -> Optional[MonitorTarget]:
+        return MonitorService._targets.get(monitor_id)
+
+    @staticmethod
+    def count() -> int:
+        return len(MonitorService._targets)
+
+    @staticmethod
+    def page(offset: int = 0, limit: int = 50) -> Dict:
+        """Registered targets offset..offset+limit in registration order"""
+        monitors = list(MonitorService._targets.values())[offset:offset + limit]
+        return {
+            "total": len(MonitorService._targets),
+            "monitors": [monitor.summary() for monitor in monitors],
+            "next_offset": offset + len(monitors)
+        }
+
+    @staticmethod
+    def events(since: int = 0, limit: int = 100, monitor_id: Optional[str] = None) -> Dict:
+        """
+        Retained events with an id above since, oldest first, with the value to pass as since next time
+        """
+        events = [event for event in MonitorService._events
+                  if event["id"] > since and (monitor_id is None or event["monitor_id"] == monitor_id)][:limit]
+        return {"events": events, "next_since": events[-1]["id"] if events else since}
+
+    @staticmethod
+    async def stream(since: Optional[int] = None, monitor_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Yield every new event as {"event": type, "data": event}, starting after since (default: now)
+        """
+        last = MonitorService._last_event_id if since is None else since
+        while True:
+            events = [event for event in MonitorService._events
+                      if event["id"] > last and (monitor_id is None or event["monitor_id"] == monitor_id)]
+            if not events:
+                # Nothing is appended between the scan above and this wait, so no event can be missed
+                if MonitorService._updated is None:
+                    MonitorService._updated = asyncio.Event()
+                await MonitorService._updated.wait()
+                continue
+            for event in events:
+                last = event["id"]
+                yield {"event": event["type"], "data": event}
+
+    @staticmethod
+    def stats() -> Dict:
+        """Registered targets, runs so far and events retained"""
+        monitors = MonitorService._targets.values()
+        return {
+            "targets": len(MonitorService._targets),
+            "running": sum(1 for monitor in monitors if monitor.task is not None),
+            "runs": sum(monitor.runs for monitor in monitors),
+            "full_traces": sum(monitor.full_traces for monitor in monitors),
+            "incremental_runs": sum(monitor.incremental_runs for monitor in monitors),
+            "ttls_probed": sum(monitor.ttls_probed for monitor in monitors),
+            "events": MonitorService._last_event_id,
+            "events_retained": len(MonitorService._events)
+        }
+
+    @staticmethod
+    def _push(monitor: MonitorTarget, next_run: float):
+        monitor.next_run = next_run
+        MonitorService._sequence += 1
+        heapq.heappush(MonitorService._schedule, (next_run, MonitorService._sequence, monitor.id))
+        MonitorService._wake()
+
+    @staticmethod
+    def _wake():
+        if MonitorService._wakeup is not None:
+            MonitorService._wakeup.set()
+
+    @staticmethod
+    async def _schedule_loop():
+        # One task for all targets: start whatever is due, then sleep until the next due run or until
+        # a target is added, removed or rescheduled. Exits once nothing is registered.
+        schedule = MonitorService._schedule
+        while MonitorService._targets:
+            MonitorService._wakeup = asyncio.Event()
+            now = time.monotonic()
+            while schedule and schedule[0][0] <= now:
+                _, _, monitor_id = heapq.heappop(schedule)
+                monitor = MonitorService._targets.get(monitor_id)
+                if monitor is None or monitor.task is not None:
+                    continue
+                monitor.task = asyncio.create_task(MonitorService._run(monitor))
+
+            delay = schedule[0][0] - now if schedule else None
+            try:
+                await asyncio.wait_for(MonitorService._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        schedule.clear()
+        MonitorService._wakeup = None
+
+    @staticmethod
+    async def _run(monitor: MonitorTarget):
+        try:
+            await MonitorService._check(monitor)
+        except Exception as e:
+            monitor.last_error = f"Unexpected error: {str(e)}"
+        finally:
+            monitor.task = None
+            monitor.runs += 1
+            monitor.last_run_at = time.time()
+            # The next run is timed from the end of this one, so a slow trace never overlaps the next
+            if MonitorService._targets.get(monitor.id) is monitor:
+                jitter = settings.monitor_jitter
+                MonitorService._push(monitor, time.monotonic() + monitor.interval * random.uniform(1 - jitter, 1 + jitter))
+
+    @staticmethod
+    async def _check(monitor: MonitorTarget):
+        try:
+            destination = await IcmpTracerouteService.resolve_async(monitor.target)
+        except (OSError, UnicodeError, IndexError):
+            # The full trace reports the resolution failure
+            destination = monitor.target
+
+        if MonitorService._incremental_due(monitor, destination):
+            hops = await MonitorService._probe(monitor, destination, MonitorService._incremental_ttls(monitor))
+            if hops is not None and all(hop["ip"] == monitor.path[hop["hop"]].ip for hop in hops):
+                monitor.incremental_runs += 1
+                monitor._runs_since_full += 1
+                monitor.last_error = None
+                MonitorService._compare(monitor, hops, full=False)
+                return
+            # Something moved (or the probes could not be sent): find out what with a full trace
+
+        await MonitorService._full_trace(monitor, destination)
+
+    @staticmethod
+    def _incremental_due(monitor: MonitorTarget, destination: str) -> bool:
+        return (monitor.incremental and settings.monitor_incremental and monitor.reached
+                and destination == monitor.destination
+                and monitor._runs_since_full + 1 < settings.monitor_full_trace_every
+                and settings.traceroute_backend == "icmp" and TracerouteService._icmp_available())
+
+    @staticmethod
+    def _incremental_ttls(monitor: MonitorTarget) -> List[int]:
+        """
+        TTLs an incremental run re-probes: the destination and the hop before it, silent hops and hops
+        that changed within the last monitor_full_trace_every runs, plus monitor_sample_ttls of the
+        remaining stable hops in rotation
+        """
+        ttls = {ttl for ttl in (monitor.last_ttl - 1, monitor.last_ttl) if ttl >= 1}
+        for ttl, state in monitor.path.items():
+            recently_changed = (state.changed_run is not None
+                                and monitor.runs - state.changed_run < settings.monitor_full_trace_every)
+            if state.ip == "*" or recently_changed:
+                ttls.add(ttl)
+
+        stable = sorted(ttl for ttl in monitor.path if ttl not in ttls)
+        for _ in range(min(settings.monitor_sample_ttls, len(stable))):
+            ttls.add(stable[monitor._sample_cursor % len(stable)])
+            monitor._sample_cursor += 1
+        return sorted(ttls)
+
+    @staticmethod
+    async def _probe(monitor: MonitorTarget, destination: str, ttls: List[int]) -> Optional[List[Dict]]:
+        """
+        One probe per TTL through the shared budget, as hop dicts. None if probe sockets are unavailable.
+        """
+        scheduler = BatchTracerouteService._scheduler
+        await scheduler.acquire(_SCHEDULER_JOB, destination, len(ttls))
+        try:
+            replies = await IcmpTracerouteService.probe_ttls(destination, ttls)
+        except PermissionError:
+            return None
+        finally:
+            scheduler.release(destination, len(ttls))
+
+        monitor.ttls_probed += len(ttls)
+        hops = [IcmpTracerouteService._build_hop(ttl, replies[ttl]) for ttl in ttls]
+        HopMetricsService.record(monitor.target, hops)
+        return hops
+
+    @staticmethod
+    async def _full_trace(monitor: MonitorTarget, destination: str):
+        scheduler = BatchTracerouteService._scheduler
+        cost = BatchTracerouteService._trace_cost()
+        await scheduler.acquire(_SCHEDULER_JOB, destination, cost)
+        try:
+            hops = await TracerouteService._collect_hops(monitor.target)
+        finally:
+            scheduler.release(destination, cost)
+
+        if hops and len(hops) == 1 and "error" in hops[0]:
+            monitor.last_error = hops[0]["error"]
+            return
+
+        monitor.full_traces += 1
+        monitor.ttls_probed += len(hops)
+        monitor._runs_since_full = 0
+        monitor.last_error = None
+        monitor.destination = destination
+        MonitorService._compare(monitor, hops, full=True)
+        monitor.reached = hops[-1]["ip"] == destination
+
+    @staticmethod
+    def _compare(monitor: MonitorTarget, hops: List[Dict], full: bool):
+        """
+        Fold a run's hops into the stored path, emitting events for whatever differs. The first full
+        trace of a target only sets the baseline.
+        """
+        baseline = bool(monitor.path)
+        if full:
+            length = hops[-1]["hop"] if hops else 0
+            if baseline and length != monitor.last_ttl:
+                MonitorService._emit(monitor, "path_length", None,
+                                     previous_length=monitor.last_ttl, length=length)
+            for ttl in [ttl for ttl in monitor.path if ttl > length]:
+                del monitor.path[ttl]
+            monitor.last_ttl = length
+
+        for hop in hops:
+            ttl, ip = hop["hop"], hop["ip"]
+            rtt = next((sample for sample in hop.get("times", []) if sample is not None), None)
+            state = monitor.path.get(ttl)
+            if state is None:
+                # First trace, or the path grew (already reported as path_length)
+                state = monitor.path[ttl] = _HopState(ip)
+            elif ip != state.ip:
+                if ip == "*":
+                    MonitorService._emit(monitor, "hop_silent", ttl, previous_ip=state.ip)
+                else:
+                    MonitorService._emit(monitor, "hop_changed", ttl,
+                                         previous_ip=None if state.ip == "*" else state.ip, ip=ip)
+                # A new interface starts a new RTT baseline
+                state = monitor.path[ttl] = _HopState(ip, monitor.runs)
+            if rtt is not None:
+                MonitorService._track_rtt(monitor, ttl, state, rtt)
+
+    @staticmethod
+    def _track_rtt(monitor: MonitorTarget, ttl: int, state: _HopState, rtt: float):
+        # A shift is monitor_rtt_shift_samples consecutive samples further from the smoothed RTT than
+        # both monitor_rtt_shift_ms and four RTT variances; deviating samples stay out of the baseline
+        # until then, after which the baseline restarts at the new level
+        baseline = state.baseline
+        if baseline.samples >= _BASELINE_SAMPLES and \
+                abs(rtt - baseline.srtt) > max(settings.monitor_rtt_shift_ms, 4 * baseline.rttvar):
+            state.deviations += 1
+            if state.deviations >= settings.monitor_rtt_shift_samples:
+                MonitorService._emit(monitor, "rtt_shift", ttl, ip=state.ip,
+                                     previous_rtt=round(baseline.srtt, 3), rtt=round(rtt, 3))
+                state.baseline = RttEstimate()
+                state.baseline.update(rtt)
+                state.deviations = 0
+            return
+
+        state.deviations = 0
+        baseline.update(rtt)
+
+    @staticmethod
+    def _emit(monitor: MonitorTarget, event_type: str, ttl: Optional[int], **details):
+        MonitorService._last_event_id += 1
+        event = {
+            "id": MonitorService._last_event_id,
+            "type": event_type,
+            "monitor_id": monitor.id,
+            "target": monitor.target,
+            "hop": ttl,
+            "time": time.time()
+        }
+        event.update(details)
+        MonitorService._events.append(event)
+        monitor.events += 1
+
+        # Wake every current stream reader; the next wait starts a fresh event
+        if MonitorService._updated is not None:
+            MonitorService._updated.set()
+            MonitorService._updated = None
@@ -0,0 +1,188 @@
+import asyncio
+import random
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.geolocation_service import GeolocationService
+from app.services.icmp_packet_builder import FlowEchoRequestBuilder, MAX_FLOW_ID
+from app.services.icmp_traceroute_service import IcmpTracerouteService
+from app.services.icmp_transport import IcmpTransport, ICMP_ECHO_REPLY, ICMP_DESTINATION_UNREACHABLE
+from app.services.rtt_estimator import RttEstimate
+from app.services.traceroute_service import TracerouteService
+
+# Multipath Detection Algorithm stopping points at 95% confidence: after seeing k distinct next hops,
+# MDA_STOPPING_POINTS[k - 1] probes in total rule out a (k + 1)th one (Augustin et al., "Multipath
+# tracing with Paris traceroute"). TTLs wider than the table are probed up to the per-hop cap.
+MDA_STOPPING_POINTS = (6, 11, 16, 21, 27, 33, 38, 44, 51, 57, 63, 70, 76, 83, 90, 96)
+
+
+class MultipathTracerouteService:
+    """
+    ECMP path enumeration over the native ICMP engine. Each probe carries a flow identifier that keeps
+    it on one load-balanced path (Paris traceroute); flows are varied deliberately to reach every next
+    hop of a TTL, and each TTL is probed until the MDA stopping rule says no further next hop is likely.
+    Flow i is reused at every TTL, so the interfaces one flow meets at consecutive TTLs form the path graph.
+    """
+
+    @staticmethod
+    async def run_multipath(target: str, include_geolocation: bool = True, max_hops: int = None,
+                            timeout: float = None, max_probes_per_hop: int = None) -> Dict:
+        """
+        Enumerate the interfaces at every TTL up to the destination. Returns per-TTL interface sets
+        ("hops"), the path graph ("edges") and the probe count, or {"error": ...}.
+        """
+        max_hops = max_hops or settings.max_hops
+        timeout = timeout or settings.timeout
+        max_probes_per_hop = min(max_probes_per_hop or settings.multipath_max_probes_per_hop,
+                                 MDA_STOPPING_POINTS[-1])
+
+        try:
+            destination_ip = await IcmpTracerouteService.resolve_async(target)
+        except (OSError, UnicodeError, IndexError) as e:
+            return {"error": f"Could not resolve {target}: {e}"}
+        if ":" in destination_ip:
+            # Flows are steered through the ICMP checksum, which the kernel computes itself for ICMPv6
+            return {"error": f"Multipath discovery supports IPv4 destinations only ({target} is {destination_ip})"}
+
+        try:
+            transport = IcmpTransport.get_instance()
+        except PermissionError:
+            transport = None
+        if transport is None or transport.mode != "raw":
+            # Flows are steered through the ICMP checksum, which only raw sockets control
+            return {"error": "Multipath discovery needs raw ICMP sockets (run as root or with CAP_NET_RAW)"}
+
+        timeout = IcmpTracerouteService._probe_timeout(destination_ip, timeout)
+        trace_estimate = RttEstimate()
+        identifier = transport.allocate_identifier()
+        builder = FlowEchoRequestBuilder(identifier)
+        first_flow = random.randint(0, MAX_FLOW_ID)
+
+        # observed[ttl][flow index] = reply or None; sent[ttl] = flows probed so far (always 0..sent-1)
+        observed: Dict[int, Dict[int, Optional[Dict]]] = {ttl: {} for ttl in range(1, max_hops + 1)}
+        sent = {ttl: 0 for ttl in range(1, max_hops + 1)}
+        last_ttl = max_hops
+        sequence = 0
+
+        while True:
+            probes = {}
+            for ttl in range(1, last_ttl + 1):
+                # Besides the stopping rule, reuse at least one flow of every interface on the neighbouring
+                # TTLs so each interface gets linked to a predecessor and a successor in the graph
+                wanted = max(
+                    MultipathTracerouteService._stopping_point(observed[ttl]),
+                    MultipathTracerouteService._flows_covering(observed.get(ttl - 1, {})),
+                    MultipathTracerouteService._flows_covering(observed[ttl + 1]) if ttl < last_ttl else 0
+                )
+                wanted = min(wanted, max_probes_per_hop)
+                for flow_index in range(sent[ttl], wanted):
+                    sequence += 1
+                    flow = (first_flow + flow_index) % (MAX_FLOW_ID + 1)
+                    packet = builder.build_into(sequence, flow)
+                    future = transport.send_probe(destination_ip, packet, identifier, sequence, ttl, timeout)
+                    probes[asyncio.wrap_future(future)] = (ttl, flow_index)
+                sent[ttl] = max(sent[ttl], wanted)
+
+            if not probes:
+                break
+
+            try:
+                replies = await asyncio.gather(*probes)
+            finally:
+                for future in probes:
+                    future.cancel()
+
+            for (ttl, flow_index), reply in zip(probes.values(), replies):
+                observed[ttl][flow_index] = reply
+                IcmpTracerouteService._observe(destination_ip, reply, trace_estimate)
+                if reply is not None and reply["type"] in (ICMP_ECHO_REPLY, ICMP_DESTINATION_UNREACHABLE):
+                    last_ttl = min(last_ttl, ttl)
+
+        hops = [
+            MultipathTracerouteService._build_hop(ttl, observed[ttl], sent[ttl])
+            for ttl in range(1, last_ttl + 1)
+        ]
+        edges = MultipathTracerouteService._build_edges(observed, last_ttl)
+
+        if include_geolocation:
+            interfaces = [interface for hop_data in hops for interface in hop_data["interfaces"]]
+            locations = await GeolocationService.get_locations_shared(
+                list(dict.fromkeys(interface["ip"] for interface in interfaces))
+            )
+            for interface in interfaces:
+                TracerouteService._apply_geolocation(interface, locations[interface["ip"]])
+
+        return {
+            "destination": destination_ip,
+            "hops": hops,
+            "edges": edges,
+            "probes_sent": sum(sent[ttl] for ttl in sent)
+        }
+
+    @staticmethod
+    def _stopping_point(replies: Dict[int, Optional[Dict]]) -> int:
+        """
+        Probes a TTL needs in total given the distinct interfaces seen so far (a silent TTL counts as one)
+        """
+        seen = len({reply["addr"] for reply in replies.values() if reply is not None})
+        if seen > len(MDA_STOPPING_POINTS):
+            # Wider than the table: probe up to the cap and report the TTL as incomplete
+            return MDA_STOPPING_POINTS[-1] + 1
+        return MDA_STOPPING_POINTS[max(seen, 1) - 1]
+
+    @staticmethod
+    def _flows_covering(replies: Dict[int, Optional[Dict]]) -> int:
+        """
+        Number of leading flows that includes at least one flow through every interface in replies
+        """
+        first_flows = {}
+        for flow_index, reply in replies.items():
+            if reply is not None:
+                first_flows[reply["addr"]] = min(flow_index, first_flows.get(reply["addr"], flow_index))
+        return max(first_flows.values(), default=-1) + 1
+
+    @staticmethod
+    def _build_hop(ttl: int, replies: Dict[int, Optional[Dict]], sent: int) -> Dict:
+        """
+        One TTL's interface set; "complete" is False when the probe cap cut enumeration short
+        """
+        interfaces: Dict[str, Dict] = {}
+        for flow_index in sorted(replies):
+            reply = replies[flow_index]
+            if reply is None:
+                continue
+            interface = interfaces.setdefault(reply["addr"], {"ip": reply["addr"], "times": [], "flows": 0,
+                                                              "hostname": None})
+            interface["times"].append(round(reply["rtt"], 3))
+            interface["flows"] += 1
+
+        answered = sum(interface["flows"] for interface in interfaces.values())
+        return {
+            "hop": ttl,
+            "interfaces": list(interfaces.values()),
+            "probes": sent,
+            "responses": answered,
+            "complete": MultipathTracerouteService._stopping_point(replies) <= sent
+        }
+
+    @staticmethod
+    def _build_edges(observed: Dict[int, Dict[int, Optional[Dict]]], last_ttl: int) -> List[Dict]:
+        """
+        Follow every flow hop by hop: consecutive interfaces on one flow are linked, bridging silent TTLs
+        """
+        links: Dict[Tuple[int, str, int, str], int] = {}
+        flows = {flow_index for ttl in range(1, last_ttl + 1) for flow_index in observed[ttl]}
+        for flow_index in flows:
+            previous = None
+            for ttl in range(1, last_ttl + 1):
+                reply = observed[ttl].get(flow_index)
+                if reply is None:
+                    continue
+                if previous is not None:
+                    link = (previous[0], previous[1], ttl, reply["addr"])
+                    links[link] = links.get(link, 0) + 1
+                previous = (ttl, reply["addr"])
+
+        return [
+            {"from_hop": from_hop, "from": from_ip, "to_hop": to_hop, "to": to_ip, "flows": count}
+            for (from_hop, from_ip, to_hop, to_ip), count in sorted(links.items())
+        ]
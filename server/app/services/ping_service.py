@@ -0,0 +1,258 @@
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from app.services.IcmpHelperLibrary import IcmpHelperLibrary
+from app.services.address_resolver import AddressResolver
+from app.services.cache import TTLCache
+from app.services.icmp_packet_builder import EchoRequestBuilder, ICMP_ECHO_REQUEST, ICMPV6_ECHO_REQUEST
+from app.services.icmp_transport import IcmpTransport, ICMP_ECHO_REPLY, ICMP_DESTINATION_UNREACHABLE
+from app.services.probe_stats import ProbeStats
+from app.services.rtt_estimator import RttEstimator
+
+_MAX_SEQUENCE = 0xFFFF
+_PACER_BURST = 0.01  # Seconds of sending a pacer that fell behind may catch up on at once
+
+
+class _Pacer:
+    """
+    Spaces sends at a fixed rate. Waits shorter than the event loop can sleep are paid back in small
+    bursts, so the average rate holds at thousands of packets per second.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        self._next = max(self._next, now - _PACER_BURST)
+        delay = self._next - now
+        self._next += self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class _PingTarget:
+    __slots__ = ("target", "ip", "stats", "futures", "unreachable")
+
+    def __init__(self, target: str):
+        self.target = target
+        self.ip: Optional[str] = None
+        self.stats = ProbeStats(percentiles=bool(settings.probe_percentiles))
+        self.futures: List[asyncio.Future] = []
+        self.unreachable: Optional[str] = None  # Message of the last unreachable reply, if any
+
+
+class PingSweep:
+    """
+    One sweep request: per-host summaries in completion order, plus a wakeup for streaming readers.
+    """
+
+    def __init__(self, targets: List[str], count: int, pps: float):
+        self.id = uuid.uuid4().hex
+        self.targets = targets
+        self.count = count
+        self.pps = pps
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.results: List[Dict] = []
+        self.probes_sent = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def add_result(self, result: Dict):
+        self.results.append(result)
+        self._notify()
+
+    def finish(self):
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        # Wake every current reader, then start a fresh event for the next update
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait_for_update(self):
+        await self._updated.wait()
+
+    def summary(self) -> Dict:
+        return {
+            "sweep_id": self.id,
+            "total": len(self.targets),
+            "completed": len(self.results),
+            "reachable": sum(1 for result in self.results if result["success"]),
+            "count": self.count,
+            "pps": self.pps,
+            "probes_sent": self.probes_sent,
+            "done": self.done,
+            "elapsed": round((self.finished_at or time.time()) - self.created_at, 3)
+        }
+
+
+class PingService:
+    """
+    Latency sweeps over the shared probe transport: count echo requests to every host, paced at the
+    sweep's packets per second (and at ping_max_pps across all sweeps), sent round-robin so each host
+    sees its probes spread over the sweep. Each host's RTT/loss summary is published once its last
+    probe is answered or times out.
+    """
+
+    _pacer = _Pacer(settings.ping_max_pps)  # Process-wide cap shared by every sweep
+    _running: Dict[str, PingSweep] = {}  # Never evicted: readers need them until they finish
+    # Finished sweeps move here and stay readable for ping_result_ttl seconds after finishing
+    _sweeps = TTLCache(maxsize=settings.ping_max_sweeps, ttl=settings.ping_result_ttl)
+    _probes_sent = 0
+
+    @staticmethod
+    def start_sweep(targets: List[str], count: int = None, pps: float = None) -> PingSweep:
+        """
+        Start pinging every target and return the sweep immediately; summaries arrive as hosts finish.
+        Raises PermissionError when no probe sockets are available.
+        """
+        IcmpTransport.get_instance()
+        count = count or settings.ping_default_count
+        pps = min(pps or settings.ping_default_pps, settings.ping_max_pps)
+        sweep = PingSweep(targets, count, pps)
+        PingService._running[sweep.id] = sweep
+        sweep.task = asyncio.create_task(PingService._run_sweep(sweep))
+        return sweep
+
+    @staticmethod
+    def get_sweep(sweep_id: str) -> Optional[PingSweep]:
+        """Look up a sweep that is running or finished within the retention window"""
+        sweep = PingService._running.get(sweep_id)
+        return sweep if sweep is not None else PingService._sweeps.get(sweep_id)
+
+    @staticmethod
+    def page(sweep: PingSweep, offset: int = 0, limit: int = 100) -> Dict:
+        """
+        Summaries offset..offset+limit in completion order, with the offset to ask for next.
+        """
+        results = sweep.results[offset:offset + limit]
+        page = sweep.summary()
+        page["results"] = results
+        page["next_offset"] = offset + len(results)
+        return page
+
+    @staticmethod
+    async def stream(sweep: PingSweep) -> AsyncIterator[Dict]:
+        """
+        Yield a "result" event per finished host (including those finished before the call),
+        then a "done" event with the sweep summary.
+        """
+        sent = 0
+        while True:
+            while sent < len(sweep.results):
+                yield {"event": "result", "data": sweep.results[sent]}
+                sent += 1
+            if sweep.done:
+                break
+            await sweep.wait_for_update()
+        yield {"event": "done", "data": sweep.summary()}
+
+    @staticmethod
+    def stats() -> Dict:
+        """Probes sent by all sweeps and the number of running and retained sweeps"""
+        return {
+            "max_pps": settings.ping_max_pps,
+            "probes_sent": PingService._probes_sent,
+            "running_sweeps": len(PingService._running),
+            "sweeps": len(PingService._running) + len(PingService._sweeps)
+        }
+
+    @staticmethod
+    async def _run_sweep(sweep: PingSweep):
+        hosts = [_PingTarget(target) for target in sweep.targets]
+        finishing = []
+        try:
+            await asyncio.gather(*(PingService._resolve(sweep, host) for host in hosts))
+            hosts = [host for host in hosts if host.ip is not None]
+
+            transport = IcmpTransport.get_instance()
+            if not transport.supports_ipv6():
+                for host in hosts:
+                    if ":" in host.ip:
+                        sweep.add_result(PingService._error(host, f"IPv6 {transport.mode} probe sockets unavailable"))
+                hosts = [host for host in hosts if ":" not in host.ip]
+
+            pacer = _Pacer(sweep.pps)
+            builders = {}
+            identifier, sequence = transport.allocate_identifier(), 0
+            for round_number in range(sweep.count):
+                for host in hosts:
+                    await pacer.wait()
+                    await PingService._pacer.wait()
+
+                    if sequence > _MAX_SEQUENCE:
+                        identifier, sequence = transport.allocate_identifier(), 0
+                    icmp_type = ICMPV6_ECHO_REQUEST if ":" in host.ip else ICMP_ECHO_REQUEST
+                    builder = builders.get((identifier, icmp_type))
+                    if builder is None:
+                        builder = builders[(identifier, icmp_type)] = EchoRequestBuilder(identifier, icmp_type=icmp_type)
+                    timeout = RttEstimator.get_instance().timeout(host.ip, settings.ping_timeout)
+
+                    try:
+                        probe = transport.send_probe(host.ip, builder.build_into(sequence), identifier, sequence,
+                                                     64, timeout)
+                        host.futures.append(asyncio.wrap_future(probe))
+                    except OSError as e:
+                        # Counted as lost, like a probe that never came back
+                        host.unreachable = str(e)
+                        host.stats.add(None)
+                    sequence += 1
+                    sweep.probes_sent += 1
+                    PingService._probes_sent += 1
+
+                    if round_number == sweep.count - 1:
+                        finishing.append(asyncio.create_task(PingService._finish_host(sweep, host)))
+
+            await asyncio.gather(*finishing)
+        finally:
+            for task in finishing:
+                task.cancel()
+            for host in hosts:
+                for future in host.futures:
+                    future.cancel()
+            sweep.finish()
+            PingService._sweeps.set(sweep.id, sweep)
+            PingService._running.pop(sweep.id, None)
+
+    @staticmethod
+    async def _resolve(sweep: PingSweep, host: _PingTarget):
+        try:
+            host.ip = await AddressResolver.resolve_async(host.target)
+        except (OSError, UnicodeError) as e:
+            sweep.add_result(PingService._error(host, f"Could not resolve {host.target}: {e}"))
+
+    @staticmethod
+    async def _finish_host(sweep: PingSweep, host: _PingTarget):
+        estimator = RttEstimator.get_instance()
+        # A probe whose future failed counts as lost; it must not cost the host (or the sweep) its result
+        for reply in await asyncio.gather(*host.futures, return_exceptions=True):
+            if isinstance(reply, BaseException):
+                host.stats.add(None)
+            elif reply is not None and reply["type"] == ICMP_ECHO_REPLY:
+                host.stats.add(reply["rtt"])
+                estimator.observe(host.ip, reply["rtt"])
+            else:
+                host.stats.add(None)
+                if reply is not None and reply["type"] == ICMP_DESTINATION_UNREACHABLE:
+                    host.unreachable = IcmpHelperLibrary.convertIcmpMessage(reply["type"], reply["code"],
+                                                                            reply.get("family", 4))
+
+        result = {"target": host.target, "ip": host.ip, "success": host.stats.received > 0, "error": None}
+        result.update(host.stats.summary(settings.probe_percentiles))
+        if host.unreachable is not None:
+            result["unreachable"] = host.unreachable
+        sweep.add_result(result)
+
+    @staticmethod
+    def _error(host: _PingTarget, error: str) -> Dict:
+        return {"target": host.target, "ip": host.ip, "success": False, "error": error}
@@ -0,0 +1,118 @@
+import math
+from typing import Dict, Iterable, Optional
+
+_MIN_TRACKED_RTT = 1e-3  # Milliseconds; smaller RTTs share the sketch's zero bucket
+
+
+class RttSketch:
+    """
+    Fixed-size quantile sketch over RTTs with relative error (DDSketch-style logarithmic buckets).
+    Bucket i holds values in (gamma^(i-1), gamma^i]; once more than max_bins buckets are in use the two
+    lowest are merged, so memory stays bounded and the upper percentiles keep their accuracy. The
+    defaults (2%, 512 buckets) cover RTTs from microseconds to minutes without merging.
+    """
+
+    __slots__ = ("_log_gamma", "_gamma", "_bins", "_max_bins", "_zero", "count")
+
+    def __init__(self, relative_accuracy: float = 0.02, max_bins: int = 512):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._bins: Dict[int, int] = {}
+        self._max_bins = max_bins
+        self._zero = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= _MIN_TRACKED_RTT:
+            self._zero += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._bins[index] = self._bins.get(index, 0) + 1
+        if len(self._bins) > self._max_bins:
+            lowest, second = sorted(self._bins)[:2]
+            self._bins[second] += self._bins.pop(lowest)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated nearest-rank q-quantile (0..1), None when empty"""
+        if not self.count:
+            return None
+        rank = max(0, math.ceil(q * self.count) - 1)
+        seen = self._zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._bins):
+            seen += self._bins[index]
+            if rank < seen:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._bins) / (self._gamma + 1)
+
+
+class ProbeStats:
+    """
+    Streaming RTT statistics for a set of probes: min/max, Welford mean and variance, loss, and
+    optionally percentiles from an RttSketch. Constant work per probe, no samples kept.
+    """
+
+    __slots__ = ("sent", "received", "min", "max", "_mean", "_m2", "sketch")
+
+    def __init__(self, percentiles: bool = False):
+        self.sent = 0
+        self.received = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.sketch = RttSketch() if percentiles else None
+
+    @classmethod
+    def of(cls, times: Iterable[Optional[float]], percentiles: bool = False) -> "ProbeStats":
+        """Stats for a list of RTTs, None for a lost probe"""
+        stats = cls(percentiles)
+        for rtt in times:
+            stats.add(rtt)
+        return stats
+
+    def add(self, rtt: Optional[float]):
+        """Count one probe: its RTT in milliseconds, or None if it was lost"""
+        self.sent += 1
+        if rtt is None:
+            return
+        self.received += 1
+        delta = rtt - self._mean
+        self._mean += delta / self.received
+        self._m2 += delta * (rtt - self._mean)
+        self.min = rtt if self.min is None else min(self.min, rtt)
+        self.max = rtt if self.max is None else max(self.max, rtt)
+        if self.sketch is not None:
+            self.sketch.add(rtt)
+
+    @property
+    def loss(self) -> float:
+        """Lost probes in percent"""
+        return 100.0 * (self.sent - self.received) / self.sent if self.sent else 0.0
+
+    @property
+    def stddev(self) -> float:
+        """Sample standard deviation of the RTTs (the jitter)"""
+        return math.sqrt(self._m2 / (self.received - 1)) if self.received > 1 else 0.0
+
+    def summary(self, percentiles: Iterable[float] = ()) -> Dict:
+        """JSON-ready summary; percentiles (0..100) are reported as "p50", "p95", ... when a sketch is kept"""
+        received = self.received
+        summary = {
+            "sent": self.sent,
+            "received": received,
+            "loss": round(self.loss, 1),
+            "min": round(self.min, 3) if received else None,
+            "avg": round(self._mean, 3) if received else None,
+            "max": round(self.max, 3) if received else None,
+            "stddev": round(self.stddev, 3) if received else None
+        }
+        if self.sketch is not None:
+            quantiles = {}
+            for percentile in percentiles:
+                value = self.sketch.quantile(percentile / 100)
+                quantiles[f"p{percentile:g}"] = round(value, 3) if value is not None else None
+            summary["percentiles"] = quantiles
+        return summary
@@ -0,0 +1,116 @@
+import ipaddress
+import threading
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.cache import TTLCache
+
+# RFC 6298 smoothing factors and variance multiplier
+_ALPHA = 1 / 8
+_BETA = 1 / 4
+_K = 4
+_GRANULARITY_MS = 1.0
+_MIN_SAMPLES = 3  # Samples an estimate needs before it replaces the fixed timeout
+
+
+class RttEstimate:
+    """
+    TCP-style smoothed RTT and RTT variance (milliseconds) for one destination, prefix or trace.
+    """
+
+    __slots__ = ("srtt", "rttvar", "samples", "max_rtt")
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples = 0
+        self.max_rtt = 0.0
+
+    def update(self, rtt: float):
+        """Fold one RTT sample (ms) into the estimate"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - _BETA) * self.rttvar + _BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - _ALPHA) * self.srtt + _ALPHA * rtt
+        self.samples += 1
+        self.max_rtt = max(self.max_rtt, rtt)
+
+    def rto(self) -> float:
+        """Retransmission-style timeout in milliseconds: SRTT + max(G, 4 * RTTVAR)"""
+        return (self.srtt or 0.0) + max(_GRANULARITY_MS, _K * self.rttvar)
+
+
+class RttEstimator:
+    """
+    Process-wide RTT estimates per destination and per prefix (/24, /48 for IPv6), learned from every hop
+    the native engine hears back from. The estimates turn the fixed probe timeout into a per-destination
+    deadline; a destination never traced before borrows its prefix's estimate.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "RttEstimator":
+        """Return the shared estimator, creating it on first use"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(settings.rtt_estimator_size, settings.rtt_estimator_ttl)
+        return cls._instance
+
+    def __init__(self, maxsize: int, ttl: float):
+        # Paths change; estimates nobody refreshes expire
+        self._destinations = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._prefixes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prefix(ip_address: str) -> Optional[str]:
+        """The /24 (IPv4) or /48 (IPv6) network an address belongs to"""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        length = 24 if address.version == 4 else 48
+        return str(ipaddress.ip_network(f"{address}/{length}", strict=False))
+
+    def observe(self, destination: str, rtt: float):
+        """Record the RTT (ms) of a reply to a probe sent towards destination"""
+        prefix = RttEstimator.prefix(destination)
+        with self._lock:
+            for cache, key in ((self._destinations, destination), (self._prefixes, prefix)):
+                if key is None:
+                    continue
+                estimate = cache.get(key)
+                if estimate is None:
+                    estimate = RttEstimate()
+                estimate.update(rtt)
+                # Re-set to refresh the expiry
+                cache.set(key, estimate)
+
+    def estimate(self, destination: str) -> Optional[RttEstimate]:
+        """The destination's own estimate, else its prefix's, once either has enough samples"""
+        with self._lock:
+            for cache, key in ((self._destinations, destination), (self._prefixes, RttEstimator.prefix(destination))):
+                estimate = cache.peek(key) if key is not None else None
+                if estimate is not None and estimate.samples >= _MIN_SAMPLES:
+                    return estimate
+        return None
+
+    def timeout(self, destination: str, ceiling: float) -> float:
+        """
+        Probe deadline in seconds for destination: the estimated RTO clamped to
+        [adaptive_timeout_min, ceiling], or ceiling when nothing is known yet (or adaptive_timeout is off).
+        """
+        if not settings.adaptive_timeout:
+            return ceiling
+        estimate = self.estimate(destination)
+        if estimate is None:
+            return ceiling
+        return min(ceiling, max(settings.adaptive_timeout_min, estimate.rto() / 1000))
+
+    def stats(self) -> Dict:
+        """Number of destinations and prefixes with an estimate"""
+        return {"destinations": len(self._destinations), "prefixes": len(self._prefixes)}
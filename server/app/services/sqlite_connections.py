@@ -0,0 +1,42 @@
+import sqlite3
+import threading
+from typing import List
+
+
+class SqliteConnectionPool:
+    """
+    One SQLite connection per thread to a WAL-mode database file, shared by the persistent stores.
+    Every connection is tracked, so close() releases them all (and with them the WAL), whichever thread
+    opened them.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = str(path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Only the opening thread uses it, but close() may close it from another one
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """Close the connections of every thread; the last one out checkpoints the WAL"""
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            # Threads that use the pool again afterwards open fresh connections
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
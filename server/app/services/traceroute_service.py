@@ -1,97 +1,492 @@
+import asyncio
+import socket
 import subprocess
 import json
-from typing import List, Dict, Optional
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from app.core.config import settings
+from app.services.cache import TTLCache
 from app.services.geolocation_service import GeolocationService
+from app.services.hop_metrics_service import HopMetricsService
+from app.services.IcmpHelperLibrary import IcmpHelperLibrary
+from app.services.icmp_traceroute_service import IcmpTracerouteService
+from app.services.icmp_transport import IcmpTransport
+from app.services.probe_stats import ProbeStats
 
 class TracerouteService:
+    # Finished traces keyed by _trace_key, stored as (hops, completed_at)
+    _trace_cache = TTLCache(maxsize=settings.trace_cache_size, ttl=settings.trace_cache_ttl)
+    _inflight_traces: Dict[Tuple, asyncio.Task] = {}  # Running traces that identical requests attach to
+
     @staticmethod
     def run_traceroute(target: str, include_geolocation: bool = True) -> List[Dict]:
         """
-        Run traceroute command and return structured results with geolocation data
+        Run traceroute with the configured backend and return structured results with geolocation data
+        """
+        try:
+            hops = None
+
+            if settings.traceroute_backend == "icmp":
+                try:
+                    hops = IcmpTracerouteService.run_traceroute(target)
+                except PermissionError:
+                    # No probe socket mode is open to this process (or none for the target's family)
+                    print("Probe sockets unavailable, falling back to traceroute subprocess")
+
+            if hops is None:
+                hops = TracerouteService._run_subprocess_traceroute(target)
+
+            # If no hops were parsed, return an error
+            if not hops:
+                return [{"error": "No traceroute data received"}]
+
+            # Pass errors straight through
+            if len(hops) == 1 and "error" in hops[0]:
+                return hops
+
+            HopMetricsService.record(target, hops)
+            TracerouteService._add_geolocation(hops, include_geolocation)
+
+            return hops
+
+        except Exception as e:
+            return [{"error": f"Unexpected error: {str(e)}"}]
+
+    @staticmethod
+    async def run_traceroute_async(target: str, include_geolocation: bool = True) -> List[Dict]:
+        """
+        Async run_traceroute with the same result shape; never blocks the event loop
+        """
+        hops = await TracerouteService._collect_hops(target)
+
+        # Pass errors straight through
+        if len(hops) == 1 and "error" in hops[0]:
+            return hops
+
+        try:
+            await TracerouteService._add_geolocation_async(hops, include_geolocation)
+        except Exception as e:
+            return [{"error": f"Unexpected error: {str(e)}"}]
+
+        return hops
+
+    @staticmethod
+    async def run_traceroute_cached(target: str, include_geolocation: bool = True) -> Tuple[List[Dict], bool, float]:
+        """
+        run_traceroute_async through the trace cache. Returns (hops, cached, age): cached is True when the
+        hops come from a trace finished earlier, age is how many seconds ago that trace finished.
+        Identical requests arriving while a trace runs wait for it instead of starting their own.
+        """
+        key = await TracerouteService._trace_key(target)
+        if key is None or settings.trace_cache_ttl <= 0:
+            return await TracerouteService.run_traceroute_async(target, include_geolocation), False, 0.0
+
+        entry = TracerouteService._trace_cache.get(key)
+        cached = entry is not None
+        if not cached:
+            task = TracerouteService._inflight_traces.get(key)
+            if task is None:
+                task = asyncio.create_task(TracerouteService._run_shared_trace(key, target))
+                TracerouteService._inflight_traces[key] = task
+            # Shielded: a client disconnecting must not cancel the trace other requests are waiting on
+            entry = await asyncio.shield(task)
+
+        shared_hops, completed_at = entry
+        if len(shared_hops) == 1 and "error" in shared_hops[0]:
+            return [dict(shared_hops[0])], False, 0.0
+
+        # Every request gets its own copy; the shared trace always carries geolocation
+        hops = [dict(hop_data, times=list(hop_data["times"])) for hop_data in shared_hops]
+        if not include_geolocation:
+            for hop_data in hops:
+                if hop_data["ip"] != "*":
+                    for field in ("geolocation", "lat", "lng"):
+                        hop_data.pop(field, None)
+
+        return hops, cached, round(time.monotonic() - completed_at, 3) if cached else 0.0
+
+    @staticmethod
+    def cache_stats() -> Dict:
+        """Trace cache counters plus the number of traces currently shared by coalesced requests"""
+        stats = TracerouteService._trace_cache.stats()
+        stats["in_flight"] = len(TracerouteService._inflight_traces)
+        return stats
+
+    @staticmethod
+    async def _run_shared_trace(key: Tuple, target: str) -> Tuple[List[Dict], float]:
+        """
+        Run one geolocated trace on behalf of every request coalesced onto key, so its lookups also
+        happen once; successful results are cached.
+        """
+        try:
+            hops = await TracerouteService.run_traceroute_async(target, include_geolocation=True)
+            entry = (hops, time.monotonic())
+            if not (len(hops) == 1 and "error" in hops[0]):
+                TracerouteService._trace_cache.set(key, entry)
+            return entry
+        finally:
+            TracerouteService._inflight_traces.pop(key, None)
+
+    @staticmethod
+    async def _trace_key(target: str) -> Optional[Tuple]:
+        """
+        Cache key for a trace: the resolved destination, the backend and every setting in TRACE_SETTINGS.
+        None if the target does not resolve (the trace itself then reports the error).
+        """
+        try:
+            destination_ip = await IcmpTracerouteService.resolve_async(target)
+        except (socket.gaierror, UnicodeError, IndexError):
+            return None
+        return (destination_ip, settings.traceroute_backend) + IcmpTracerouteService.trace_settings()
+
+    @staticmethod
+    async def _collect_hops(target: str) -> List[Dict]:
+        """
+        Run a trace to completion and return its hops sorted by hop number, without geolocation
+        """
+        try:
+            hops = [hop_data async for hop_data in TracerouteService._stream_hops(target)]
+
+            # If no hops were parsed, return an error
+            if not hops:
+                return [{"error": "No traceroute data received"}]
+
+            # Pass errors straight through
+            errors = [hop_data for hop_data in hops if "error" in hop_data]
+            if errors:
+                return errors[:1]
+
+            hops.sort(key=lambda hop_data: hop_data["hop"])
+            return hops
+
+        except Exception as e:
+            return [{"error": f"Unexpected error: {str(e)}"}]
+
+    @staticmethod
+    async def stream_traceroute(target: str, include_geolocation: bool = True) -> AsyncIterator[Dict]:
+        """
+        Yield trace events as they happen: a "hop" event as soon as each hop is parsed, a "geolocation"
+        patch when that hop's location resolves (and another when a local-first answer is upgraded
+        from the API), and finally "done" (or "trace_error")
+        """
+        events = asyncio.Queue()
+        lookups = set()
+        unresolved = []
+
+        async def resolve_locations():
+            # Hops parsed within the batch window share one batched lookup
+            await asyncio.sleep(settings.geolocation_batch_window)
+            batch = unresolved[:]
+            unresolved.clear()
+
+            locations = await GeolocationService.get_locations_async([hop_data["ip"] for hop_data in batch])
+            for hop_data in batch:
+                patch = {"hop": hop_data["hop"], "ip": hop_data["ip"]}
+                TracerouteService._apply_geolocation(patch, locations[hop_data["ip"]])
+                await events.put({"event": "geolocation", "data": patch})
+
+            # Local-first answers came from the database; follow up when the API upgrade lands
+            enriching = [
+                hop_data for hop_data in batch
+                if locations[hop_data["ip"]].get("source") == "ip2location-database"
+            ]
+            if enriching:
+                await enrich_locations(enriching)
+
+        async def enrich_locations(batch):
+            pending = GeolocationService.pending_enrichment([hop_data["ip"] for hop_data in batch])
+            upgrades = {}
+            if pending:
+                ips = list(pending)
+                # Shielded: the futures are shared with every stream waiting on these IPs, and cancelling
+                # this lookup when its client goes away must not cancel them for the others
+                results = await asyncio.gather(*(asyncio.shield(asyncio.wrap_future(pending[ip])) for ip in ips))
+                upgrades.update((ip, location) for ip, location in zip(ips, results) if location)
+
+            for hop_data in batch:
+                # Enrichment may have finished before we asked; the cache then already holds the upgrade
+                location = upgrades.get(hop_data["ip"]) or GeolocationService.peek_location(hop_data["ip"])
+                if location and location.get("source") != "ip2location-database":
+                    patch = {"hop": hop_data["hop"], "ip": hop_data["ip"]}
+                    TracerouteService._apply_geolocation(patch, location)
+                    await events.put({"event": "geolocation", "data": patch})
+
+        async def produce():
+            hop_count = 0
+            try:
+                async for hop_data in TracerouteService._stream_hops(target):
+                    if "error" in hop_data:
+                        await events.put({"event": "trace_error", "data": {"error": hop_data["error"]}})
+                        return
+
+                    hop_count += 1
+                    if hop_data["ip"] == "*":
+                        TracerouteService._apply_no_response(hop_data)
+                    elif include_geolocation:
+                        # Cache hits go out with the hop, everything else follows as a patch
+                        cached = GeolocationService.peek_location(hop_data["ip"])
+                        if cached is not None:
+                            TracerouteService._apply_geolocation(hop_data, cached)
+                            if GeolocationService.pending_enrichment([hop_data["ip"]]):
+                                lookups.add(asyncio.create_task(enrich_locations([dict(hop_data)])))
+                        else:
+                            TracerouteService._apply_geolocation(hop_data, GeolocationService.empty_location("pending"))
+                            if not unresolved:
+                                lookups.add(asyncio.create_task(resolve_locations()))
+                            unresolved.append(dict(hop_data))
+
+                    await events.put({"event": "hop", "data": hop_data})
+
+                if lookups:
+                    await asyncio.gather(*lookups)
+
+                if hop_count == 0:
+                    await events.put({"event": "trace_error", "data": {"error": "No traceroute data received"}})
+                else:
+                    await events.put({"event": "done", "data": {"target": target, "hops": hop_count}})
+
+            except Exception as e:
+                await events.put({"event": "trace_error", "data": {"error": f"Unexpected error: {str(e)}"}})
+            finally:
+                await events.put(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            # Client went away mid-trace: stop probing and drop pending lookups
+            producer.cancel()
+            for lookup in lookups:
+                lookup.cancel()
+
+    @staticmethod
+    async def _stream_hops(target: str) -> AsyncIterator[Dict]:
+        """
+        Yield raw hop dicts from the configured backend as they are parsed
+        """
+        if settings.traceroute_backend == "icmp" and TracerouteService._icmp_available():
+            try:
+                async for hop_data in IcmpTracerouteService.stream_hops(target):
+                    HopMetricsService.record(target, [hop_data])
+                    yield hop_data
+                return
+            except PermissionError as e:
+                # Raised before the first hop, e.g. an IPv6 target on a host without ICMPv6 sockets
+                print(f"{e}, falling back to traceroute subprocess")
+
+        async for hop_data in TracerouteService._stream_subprocess_hops(target):
+            HopMetricsService.record(target, [hop_data])
+            yield hop_data
+
+    @staticmethod
+    def _icmp_available() -> bool:
+        """
+        Check that the shared probe transport can be opened in some socket mode
+        """
+        try:
+            IcmpTransport.get_instance()
+            return True
+        except PermissionError:
+            # Even UDP probes are refused (or probe_socket_mode forces a mode this process lacks)
+            print("Probe sockets unavailable, falling back to traceroute subprocess")
+            return False
+
+    @staticmethod
+    def _traceroute_command(target: str) -> List[str]:
+        """
+        Build the traceroute command line with optimized settings
+        """
+        return [
+            "traceroute",
+            "-n",  # Don't resolve hostnames
+            "-w", str(settings.timeout),  # Wait time per hop
+            "-m", str(settings.max_hops),  # Max hops
+            "-q", str(settings.probes_per_hop),  # Probes per hop (1 is fastest)
+            target
+        ]
+
+    @staticmethod
+    def _run_subprocess_traceroute(target: str) -> List[Dict]:
+        """
+        Run the system traceroute command and parse its output into hop dicts
         """
         try:
-            # Run traceroute command with optimized settings
             result = subprocess.run(
-                [
-                    "traceroute", 
-                    "-n",  # Don't resolve hostnames
-                    "-w", str(settings.timeout),  # Wait time per hop
-                    "-m", str(settings.max_hops),  # Max hops
-                    "-q", "1",  # Only 1 probe per hop (faster)
-                    target
-                ],
+                TracerouteService._traceroute_command(target),
                 capture_output=True,
                 text=True,
                 timeout=settings.command_timeout
             )
-            
+
             # Check if traceroute command exists and works
             if result.returncode != 0:
                 error_msg = result.stderr.strip() if result.stderr else "Unknown error"
                 return [{"error": f"Traceroute failed: {error_msg}"}]
-            
-            # Parse traceroute output
-            hops = []
-            lines = result.stdout.strip().split('\n')
-            
-            # Skip the first line (header)
-            for line in lines[1:]:
-                if line.strip():
-                    hop_data = TracerouteService._parse_hop_line(line)
-                    if hop_data:
-                        # Only add geolocation for valid IPs (not "*")
-                        if include_geolocation and hop_data.get("ip") != "*":
-                            geo_data = GeolocationService.get_location(hop_data["ip"])
-                            hop_data["geolocation"] = geo_data
-                            
-                            # Convert string coordinates to numbers
-                            lat = geo_data.get("latitude")
-                            lng = geo_data.get("longitude")
-                            
-                            if lat is not None and lng is not None:
-                                try:
-                                    hop_data["lat"] = float(lat)
-                                    hop_data["lng"] = float(lng)
-                                except (ValueError, TypeError):
-                                    hop_data["lat"] = None
-                                    hop_data["lng"] = None
-                            else:
-                                hop_data["lat"] = None
-                                hop_data["lng"] = None
-                                
-                        elif hop_data.get("ip") == "*":
-                            # Add empty geolocation for "*" hops
-                            hop_data["geolocation"] = {
-                                "latitude": None,
-                                "longitude": None,
-                                "country": None,
-                                "country_code": None,
-                                "city": None,
-                                "region": None,
-                                "postal_code": None,
-                                "timezone": None,
-                                "isp": None,
-                                "source": "no-response"
-                            }
-                            hop_data["lat"] = None
-                            hop_data["lng"] = None
-                        
-                        hops.append(hop_data)
-            
-            # If no hops were parsed, return an error
-            if not hops:
-                return [{"error": "No traceroute data received"}]
-            
-            return hops
-            
+
+            return TracerouteService._parse_traceroute_output(result.stdout)
+
         except subprocess.TimeoutExpired:
             return [{"error": "Traceroute command timed out"}]
         except FileNotFoundError:
             return [{"error": "traceroute command not found. Please install traceroute."}]
-        except Exception as e:
-            return [{"error": f"Unexpected error: {str(e)}"}]
-    
+
+    @staticmethod
+    async def _stream_subprocess_hops(target: str) -> AsyncIterator[Dict]:
+        """
+        Run the system traceroute command as an asyncio subprocess and yield each hop as its line arrives
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *TracerouteService._traceroute_command(target),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            yield {"error": "traceroute command not found. Please install traceroute."}
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.command_timeout
+        budget_deadline = loop.time() + settings.trace_time_budget if settings.trace_time_budget > 0 else deadline
+        silent_hops = 0
+
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(
+                        process.stdout.readline(),
+                        timeout=max(0, min(deadline, budget_deadline) - loop.time())
+                    )
+                except asyncio.TimeoutError:
+                    if budget_deadline < deadline:
+                        # Out of time budget: the trace ends with the hops it has
+                        return
+                    yield {"error": "Traceroute command timed out"}
+                    return
+
+                if not line:
+                    break
+
+                hop_data = TracerouteService._parse_hop_line(line.decode(errors="replace"))
+                if hop_data:
+                    yield hop_data
+
+                    # Stop the binary as soon as the path is unreachable or has gone dark
+                    silent_hops = silent_hops + 1 if hop_data["ip"] == "*" else 0
+                    if TracerouteService._path_ended(hop_data, silent_hops):
+                        return
+
+            stderr = await process.stderr.read()
+            await process.wait()
+
+            # Check if traceroute command exists and works
+            if process.returncode != 0:
+                error_msg = stderr.decode(errors="replace").strip() if stderr else "Unknown error"
+                yield {"error": f"Traceroute failed: {error_msg}"}
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    @staticmethod
+    def _parse_traceroute_output(output: str) -> List[Dict]:
+        """
+        Parse full traceroute output into hop dicts
+        """
+        hops = []
+        lines = output.strip().split('\n')
+
+        silent_hops = 0
+
+        # The "traceroute to ..." header (stdout or stderr depending on platform) fails to parse and is skipped
+        for line in lines:
+            if line.strip():
+                hop_data = TracerouteService._parse_hop_line(line)
+                if hop_data:
+                    hops.append(hop_data)
+                    silent_hops = silent_hops + 1 if hop_data["ip"] == "*" else 0
+                    if TracerouteService._path_ended(hop_data, silent_hops):
+                        break
+
+        return hops
+
+    @staticmethod
+    def _path_ended(hop_data: Dict, silent_hops: int) -> bool:
+        """
+        Stop conditions for parsed output: an unreachable hop, or trace_max_silent_hops "*" hops in a row
+        """
+        if "unreachable" in hop_data:
+            return True
+        return 0 < settings.trace_max_silent_hops <= silent_hops
+
+    @staticmethod
+    def _add_geolocation(hops: List[Dict], include_geolocation: bool) -> None:
+        """
+        Attach geolocation data and numeric coordinates to parsed hops with one bulk lookup
+        """
+        locations = {}
+        if include_geolocation:
+            locations = GeolocationService.get_locations([hop_data["ip"] for hop_data in hops if hop_data["ip"] != "*"])
+        TracerouteService._apply_locations(hops, locations)
+
+    @staticmethod
+    async def _add_geolocation_async(hops: List[Dict], include_geolocation: bool) -> None:
+        """
+        Async _add_geolocation; the bulk lookup runs off the event loop and is shared with concurrent traces
+        """
+        locations = {}
+        if include_geolocation:
+            locations = await GeolocationService.get_locations_shared(
+                [hop_data["ip"] for hop_data in hops if hop_data["ip"] != "*"]
+            )
+        TracerouteService._apply_locations(hops, locations)
+
+    @staticmethod
+    def _apply_locations(hops: List[Dict], locations: Dict[str, Dict]) -> None:
+        """
+        Apply looked-up locations to hops; "*" hops get an empty no-response record
+        """
+        for hop_data in hops:
+            if hop_data["ip"] == "*":
+                TracerouteService._apply_no_response(hop_data)
+            elif hop_data["ip"] in locations:
+                TracerouteService._apply_geolocation(hop_data, locations[hop_data["ip"]])
+
+    @staticmethod
+    def _apply_geolocation(hop_data: Dict, geo_data: Dict) -> None:
+        """
+        Store geolocation data on a hop and convert its coordinates to numbers
+        """
+        hop_data["geolocation"] = geo_data
+
+        # Convert string coordinates to numbers
+        lat = geo_data.get("latitude")
+        lng = geo_data.get("longitude")
+
+        if lat is not None and lng is not None:
+            try:
+                hop_data["lat"] = float(lat)
+                hop_data["lng"] = float(lng)
+            except (ValueError, TypeError):
+                hop_data["lat"] = None
+                hop_data["lng"] = None
+        else:
+            hop_data["lat"] = None
+            hop_data["lng"] = None
+
+    @staticmethod
+    def _apply_no_response(hop_data: Dict) -> None:
+        """
+        Add empty geolocation for "*" hops
+        """
+        hop_data["geolocation"] = GeolocationService.empty_location("no-response")
+        hop_data["lat"] = None
+        hop_data["lng"] = None
+
     @staticmethod
     def _parse_hop_line(line: str) -> Optional[Dict]:
         """
@@ -103,34 +498,51 @@ class TracerouteService:
                 return None
             
             hop_num = int(parts[0])
-            ip_address = parts[1]
             
-            # Handle cases where IP might be "*" (no response)
-            if ip_address == "*":
-                return {
-                    "hop": hop_num,
-                    "ip": "*",
-                    "times": [None],
-                    "hostname": None
-                }
-            
-            # Extract response times if available
+            # With several probes per hop the first ones may have timed out ("2  *  10.0.0.1  5.1 ms");
+            # the hop's IP is the first address on the line, "*" if none answered
+            ip_address = "*"
             times = []
-            for part in parts[2:]:
+            unreachable_code = None
+            for part in parts[1:]:
                 if part == '*':
                     times.append(None)
-                elif part.replace('.', '').isdigit():
+                elif part.count('.') <= 1 and part.replace('.', '').isdigit():
                     times.append(float(part))
+                elif part.startswith('!'):
+                    unreachable_code = TracerouteService._unreachable_code(part)
+                elif ip_address == "*" and part != "ms":
+                    ip_address = part
             
             # If no times found, add a default
             if not times:
                 times = [None]
             
-            return {
+            hop_data = {
                 "hop": hop_num,
                 "ip": ip_address,
                 "times": times,
                 "hostname": None
             }
+            if unreachable_code is not None:
+                hop_data["unreachable"] = IcmpHelperLibrary.convertIcmpMessage(3, unreachable_code)
+            if settings.probes_per_hop > 1:
+                hop_data["stats"] = ProbeStats.of(hop_data["times"], bool(settings.probe_percentiles)).summary(
+                    settings.probe_percentiles
+                )
+            return hop_data
         except (ValueError, IndexError):
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def _unreachable_code(annotation: str) -> Optional[int]:
+        """
+        ICMP destination unreachable code for a traceroute annotation such as "!H", "!X" or "!<code>"
+        """
+        flags = {"N": 0, "H": 1, "P": 2, "F": 4, "S": 5, "X": 13, "V": 14, "C": 15}
+        flag = annotation[1:]
+        if flag[:1] in flags:
+            return flags[flag[:1]]
+        if flag.isdigit():
+            return int(flag)
+        return None
@@ -0,0 +1,135 @@
+"""
+Microbenchmark: ICMP echo request building.
+
+Compares the original byte-pair checksum loop (reproduced below as the baseline) with
+internet_checksum, IcmpPacket.buildPacket_echoRequest, and EchoRequestBuilder, and the original
+per-field echo reply parsing with IcmpPacket_EchoReply.
+
+Run from server/:  python -m benchmarks.bench_icmp_packet [--count N]
+"""
+import argparse
+import struct
+import time
+import tracemalloc
+
+from app.services.IcmpHelperLibrary import IcmpHelperLibrary
+from app.services.icmp_packet_builder import EchoRequestBuilder, internet_checksum
+
+
+def legacy_checksum(packetAsByteData: bytes) -> int:
+    """The checksum loop IcmpPacket used before internet_checksum, without its debug prints"""
+    checksum = 0
+    countTo = (len(packetAsByteData) // 2) * 2
+    count = 0
+    while count < countTo:
+        thisVal = packetAsByteData[count + 1] * 256 + packetAsByteData[count]
+        checksum = checksum + thisVal
+        checksum = checksum & 0xffffffff
+        count = count + 2
+    if countTo < len(packetAsByteData):
+        checksum = checksum + packetAsByteData[len(packetAsByteData) - 1]
+        checksum = checksum & 0xffffffff
+    checksum = (checksum >> 16) + (checksum & 0xffff)
+    checksum = (checksum >> 16) + checksum
+    answer = ~checksum & 0xffff
+    return answer >> 8 | (answer << 8 & 0xff00)
+
+
+def legacy_build(identifier: int, sequence: int) -> bytes:
+    """Pack header, encode data, checksum, pack header again, concatenate: the original build path"""
+    data = struct.pack("d", time.time()) + b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    header = struct.pack("!BBHHH", 8, 0, 0, identifier, sequence)
+    checksum = legacy_checksum(header + data)
+    header = struct.pack("!BBHHH", 8, 0, checksum, identifier, sequence)
+    return header + data
+
+
+def legacy_parse_reply(recvPacket: bytes) -> tuple:
+    """Every IcmpPacket_EchoReply getter used to calcsize + slice + unpack its field on each call"""
+    def unpackByFormatAndPosition(formatCode, basePosition):
+        numberOfbytes = struct.calcsize(formatCode)
+        return struct.unpack("!" + formatCode, recvPacket[basePosition:basePosition + numberOfbytes])[0]
+
+    return (unpackByFormatAndPosition("B", 20), unpackByFormatAndPosition("B", 21),
+            unpackByFormatAndPosition("H", 22), unpackByFormatAndPosition("H", 24),
+            unpackByFormatAndPosition("H", 26), unpackByFormatAndPosition("d", 28))
+
+
+def parse_reply(recvPacket: bytes) -> tuple:
+    reply = IcmpHelperLibrary.IcmpPacket_EchoReply(recvPacket)
+    return (reply.getIcmpType(), reply.getIcmpCode(), reply.getIcmpHeaderChecksum(),
+            reply.getIcmpIdentifier(), reply.getIcmpSequenceNumber(), reply.getDateTimeSent())
+
+
+def allocated_bytes(function, count: int) -> float:
+    """Average bytes still allocated per object when count of them are kept alive"""
+    tracemalloc.start()
+    objects = [function(sequence & 0xFFFF) for sequence in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def measure(name: str, function, count: int) -> dict:
+    start = time.perf_counter()
+    for sequence in range(count):
+        function(sequence & 0xFFFF)
+    elapsed = time.perf_counter() - start
+    return {"name": name, "count": count, "per_second": count / elapsed, "us_per_op": elapsed / count * 1e6}
+
+
+def run_cases(count: int) -> list:
+    """Time every checksum, build and parse case over count packets"""
+    builder = EchoRequestBuilder(0x1234)
+    sample = builder.build(1)
+    assert legacy_checksum(sample[:2] + b"\0\0" + sample[4:]) == internet_checksum(sample[:2] + b"\0\0" + sample[4:])
+    assert legacy_build(0x1234, 7)[:2] == builder.build(7)[:2]
+
+    # An echo reply as received on the raw socket: 20 byte IP header, then the echoed request
+    reply_packet = bytes([0x45]) + bytes(19) + b"\0" + sample[1:]
+
+    def build_packet(sequence):
+        packet = IcmpHelperLibrary.IcmpPacket()
+        packet.buildPacket_echoRequest(0x1234, sequence)
+        return packet.getPacketBytes()
+
+    return [
+        measure("legacy checksum", lambda sequence: legacy_checksum(sample), count),
+        measure("internet_checksum", lambda sequence: internet_checksum(sample), count),
+        measure("legacy build", lambda sequence: legacy_build(0x1234, sequence), count),
+        measure("IcmpPacket.buildPacket_echoRequest", build_packet, count),
+        measure("EchoRequestBuilder.build", builder.build, count),
+        measure("EchoRequestBuilder.build_into", builder.build_into, count),
+        measure("legacy reply parse", lambda sequence: legacy_parse_reply(reply_packet), count),
+        measure("IcmpPacket_EchoReply parse", lambda sequence: parse_reply(reply_packet), count),
+    ]
+
+
+def packet_bytes() -> float:
+    """Memory kept alive per built IcmpPacket"""
+    def new_packet(sequence):
+        packet = IcmpHelperLibrary.IcmpPacket()
+        packet.buildPacket_echoRequest(0x1234, sequence)
+        return packet
+
+    return allocated_bytes(new_packet, 10000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="packets per case")
+    args = parser.parse_args()
+
+    results = run_cases(args.count)
+
+    print(f'{"case":40} {"packets/s":>12} {"us/packet":>10}')
+    for result in results:
+        print(f'{result["name"]:40} {result["per_second"]:12,.0f} {result["us_per_op"]:10.2f}')
+
+    print(f'\n{"retained memory":40} {"bytes/object":>12}')
+    print(f'{"IcmpPacket":40} {packet_bytes():12,.0f}')
+
+
+if __name__ == "__main__":
+    main()
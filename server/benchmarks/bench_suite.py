@@ -0,0 +1,378 @@
+"""
+Offline benchmark suite: trace latency, probe throughput, packet cost, cache hit paths and ASGI throughput.
+
+Everything runs in-process against a simulated network: FakeHopResponder answers the probes,
+IpApiStub stands in for ip-api.com and a synthetic IP2Location BIN backs the local database, so
+no network access or privileges are needed. Results are JSON, so runs can be compared between commits.
+
+Run from server/:  python -m benchmarks.bench_suite [--quick] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from app.core.config import settings
+from app.services.address_resolver import AddressResolver
+from app.services.geolocation_client import GeolocationClient
+from app.services.geolocation_service import GeolocationService
+from app.services.icmp_traceroute_service import IcmpTracerouteService
+from app.services.ping_service import PingService
+from app.services.traceroute_service import TracerouteService
+from benchmarks.bench_icmp_packet import packet_bytes, run_cases
+from benchmarks.ip_api_stub import IpApiStub
+from benchmarks.simulated_network import FakeHopResponder, public_addresses
+
+
+def summarize(samples: List[float]) -> Dict:
+    """count, mean and nearest-rank p50/p95/max of samples (milliseconds)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def rank(q: float) -> float:
+        return ordered[max(0, min(len(ordered) - 1, int(q * len(ordered) + 0.5) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(rank(0.50), 3),
+        "p95": round(rank(0.95), 3),
+        "max": round(ordered[-1], 3)
+    }
+
+
+def per_op(elapsed: float, count: int) -> Dict:
+    return {"count": count, "us_per_op": round(elapsed / count * 1e6, 3), "per_second": round(count / elapsed, 1)}
+
+
+def timed(function, count: int, repeat: int) -> Dict:
+    """Call function(i) count times, repeat rounds; the fastest round counts"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for index in range(count):
+            function(index)
+        best = min(best, time.perf_counter() - start)
+    return per_op(best, count)
+
+
+async def timed_async(function, count: int, repeat: int = 1) -> Dict:
+    """Await function(i) count times, one after the other, repeat rounds; the fastest round counts"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for index in range(count):
+            await function(index)
+        best = min(best, time.perf_counter() - start)
+    return per_op(best, count)
+
+
+def bench_packets(count: int, repeat: int) -> Dict:
+    """Checksum, echo request build and reply parse cost (see bench_icmp_packet), fastest of repeat rounds"""
+    best = {}
+    for _ in range(repeat):
+        for result in run_cases(count):
+            best[result["name"]] = min(best.get(result["name"], float("inf")), result["us_per_op"])
+    results = {name: per_op(us_per_op * count / 1e6, count) for name, us_per_op in best.items()}
+    results["IcmpPacket retained bytes"] = round(packet_bytes(), 1)
+    return results
+
+
+async def bench_traces(responder: FakeHopResponder, count: int) -> Dict:
+    """
+    Cold geolocated traces one after the other through TracerouteService.stream_traceroute:
+    wall time to "done" and time to the first hop event
+    """
+    walls, first_hops, hop_counts, path_rtts = [], [], [], []
+    for destination in responder.destinations(count, seed=1):
+        start = time.perf_counter()
+        first_hop = None
+        async for event in TracerouteService.stream_traceroute(destination):
+            if event["event"] == "hop" and first_hop is None:
+                first_hop = time.perf_counter() - start
+            elif event["event"] == "done":
+                hop_counts.append(event["data"]["hops"])
+            elif event["event"] == "trace_error":
+                raise RuntimeError(f"Trace to {destination} failed: {event['data']['error']}")
+        walls.append((time.perf_counter() - start) * 1000)
+        first_hops.append(first_hop * 1000)
+        path_rtts.append(len(responder.path(destination)) * responder.hop_latency_ms)
+
+    return {
+        "wall_ms": summarize(walls),
+        "first_hop_ms": summarize(first_hops),
+        "simulated_path_rtt_ms": summarize(path_rtts),
+        "hops_per_trace": round(sum(hop_counts) / len(hop_counts), 2)
+    }
+
+
+async def bench_probe_throughput(responder: FakeHopResponder, traces: int, concurrency: int,
+                                 ping_hosts: int) -> Dict:
+    """
+    Probes per second the native engine sustains with concurrency traces in flight, and the rate a
+    ping sweep achieves against its pps cap (over the whole sweep, waits for the last replies included)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def trace(destination: str):
+        async with semaphore:
+            hops = await IcmpTracerouteService.run_traceroute_async(destination)
+        if len(hops) == 1 and "error" in hops[0]:
+            raise RuntimeError(f"Trace to {destination} failed: {hops[0]['error']}")
+
+    probes = responder.probes
+    start = time.perf_counter()
+    await asyncio.gather(*(trace(destination) for destination in responder.destinations(traces, seed=2)))
+    elapsed = time.perf_counter() - start
+    engine = {
+        "traces": traces,
+        "concurrency": concurrency,
+        "probes": responder.probes - probes,
+        "probes_per_second": round((responder.probes - probes) / elapsed, 1),
+        "traces_per_second": round(traces / elapsed, 1)
+    }
+
+    sweep = PingService.start_sweep(responder.destinations(ping_hosts, seed=3), count=1, pps=settings.ping_max_pps)
+    await sweep.task
+    ping = {
+        "hosts": ping_hosts,
+        "requested_pps": sweep.pps,
+        "achieved_pps": round(sweep.probes_sent / (sweep.finished_at - sweep.created_at), 1),
+        "reachable": sum(1 for result in sweep.results if result["success"])
+    }
+    return {"engine": engine, "ping_sweep": ping}
+
+
+async def bench_caches(responder: FakeHopResponder, count: int, miss_count: int, repeat: int) -> Dict:
+    """Cost of each cache hit path (fastest of repeat rounds), and of the lookups behind a miss"""
+    results = {}
+
+    destination = responder.destinations(1, seed=4)[0]
+    await TracerouteService.run_traceroute_cached(destination)
+    results["trace_cache_hit"] = await timed_async(
+        lambda index: TracerouteService.run_traceroute_cached(destination), count, repeat
+    )
+
+    AddressResolver.resolve("localhost")
+    results["dns_cache_hit"] = timed(lambda index: AddressResolver.resolve("localhost"), count, repeat)
+
+    cached_ip = public_addresses(1, seed="cached")[0]
+    GeolocationService.get_location(cached_ip)
+    results["geolocation_memory_hit"] = timed(
+        lambda index: GeolocationService.get_location(cached_ip), count, repeat
+    )
+
+    lookups = public_addresses(1000, seed="lookups")
+    results["geolocation_index_lookup"] = timed(
+        lambda index: GeolocationService._get_location_from_database(lookups[index % len(lookups)]), count, repeat
+    )
+    results["geolocation_library_lookup"] = timed(
+        lambda index: GeolocationService._database.get_all(lookups[index % len(lookups)]), count, repeat
+    )
+
+    # Every miss is a new address, so these run once: a second round would hit the cache
+    misses = public_addresses(miss_count, seed="misses")
+    results["geolocation_api_miss"] = timed(
+        lambda index: GeolocationService.get_location(misses[index]), miss_count, 1
+    )
+
+    batches = public_addresses(100 * max(1, miss_count // 10), seed="batches")
+    results["geolocation_batch_miss_100"] = await timed_async(
+        lambda index: GeolocationService.get_locations_async(batches[index * 100:(index + 1) * 100]),
+        len(batches) // 100
+    )
+    return results
+
+
+async def bench_asgi(app, responder: FakeHopResponder, requests: int, concurrency: int) -> Dict:
+    """Requests per second and latency through the ASGI app with concurrency clients"""
+    async def load(name: str, send, count: int) -> Dict:
+        latencies = []
+        queue = asyncio.Queue()
+        for index in range(count):
+            queue.put_nowait(index)
+
+        async def client_loop():
+            while not queue.empty():
+                index = queue.get_nowait()
+                start = time.perf_counter()
+                response = await send(index)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {
+            "requests": count,
+            "concurrency": concurrency,
+            "requests_per_second": round(count / elapsed, 1),
+            "latency_ms": summarize(latencies)
+        }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        cached_target = responder.destinations(1, seed=9)[0]
+        await client.post("/api/v1/traceroute/", json={"target": cached_target})
+        cold_targets = responder.destinations(requests, seed=10)
+
+        return {
+            "health": await load("health", lambda index: client.get("/health"), requests),
+            "trace_cached": await load(
+                "trace_cached",
+                lambda index: client.post("/api/v1/traceroute/", json={"target": cached_target}),
+                requests
+            ),
+            "trace_cold": await load(
+                "trace_cold",
+                lambda index: client.post("/api/v1/traceroute/", json={"target": cold_targets[index]}),
+                requests
+            )
+        }
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """Dotted metric name -> number for every numeric leaf"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: Dict, current: Dict, out=sys.stderr):
+    """Print every metric both runs have with its relative change (sample counts left out)"""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    names = [name for name in old.keys() & new.keys() if not name.endswith(".count")]
+    print(f'{"metric":70} {"baseline":>12} {"current":>12} {"change":>8}', file=out)
+    for name in sorted(names):
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else "-"
+        print(f"{name:70} {old[name]:12,.3f} {new[name]:12,.3f} {change:>8}", file=out)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run_suite(args, workdir: Path) -> Dict:
+    settings.traceroute_backend = "icmp"
+
+    from main import app  # Imported here: main initializes the services we reconfigure below
+    from benchmarks.synthetic_ip2location import write_bin
+
+    bin_path = write_bin(workdir / "SYNTHETIC-DB5.BIN", rows=args.bin_rows, seed=args.seed)
+    GeolocationService.initialize(str(bin_path))
+
+    stub = IpApiStub(latency_ms=args.api_latency).start()
+    # The free tier's rate limits would make the benchmarks measure the token buckets
+    GeolocationService._api_client = GeolocationClient(
+        stub.url, requests_per_minute=1e9, batch_requests_per_minute=1e9,
+        max_concurrency=settings.geolocation_api_max_concurrency
+    )
+
+    responder = FakeHopResponder(hop_latency_ms=args.hop_latency, silent_fraction=args.silent_fraction,
+                                 seed=args.seed)
+    responder.install()
+    try:
+        results = {"packets": bench_packets(args.micro_count, args.repeat)}
+        results["caches"] = await bench_caches(responder, args.micro_count // 10, args.miss_count, args.repeat)
+        results["traces"] = await bench_traces(responder, args.traces)
+
+        # Throughput is measured on a path without silent routers, so probe timeouts do not dominate
+        responder.uninstall()
+        fast_responder = FakeHopResponder(hop_latency_ms=args.hop_latency, silent_fraction=0, seed=args.seed)
+        fast_responder.install()
+        try:
+            results["probe_throughput"] = await bench_probe_throughput(
+                fast_responder, args.throughput_traces, args.concurrency, args.ping_hosts
+            )
+        finally:
+            fast_responder.uninstall()
+
+        responder = FakeHopResponder(hop_latency_ms=args.hop_latency, silent_fraction=args.silent_fraction,
+                                     seed=args.seed)
+        responder.install()
+        results["asgi"] = await bench_asgi(app, responder, args.requests, args.concurrency)
+        results["ip_api_stub"] = {"requests": stub.requests, "batch_requests": stub.batch_requests}
+    finally:
+        responder.uninstall()
+        await GeolocationService.aclose()
+        stub.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="small counts, for a smoke run")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to print changes against")
+    parser.add_argument("--traces", type=int, default=30, help="sequential end-to-end traces")
+    parser.add_argument("--throughput-traces", type=int, default=300, help="traces in the throughput run")
+    parser.add_argument("--concurrency", type=int, default=50, help="traces / ASGI clients in flight")
+    parser.add_argument("--requests", type=int, default=300, help="requests per ASGI scenario")
+    parser.add_argument("--ping-hosts", type=int, default=5000, help="hosts in the ping sweep")
+    parser.add_argument("--micro-count", type=int, default=100000, help="iterations per microbenchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="rounds per microbenchmark, the fastest counts")
+    parser.add_argument("--miss-count", type=int, default=200, help="geolocation lookups that miss every cache")
+    parser.add_argument("--bin-rows", type=int, default=100000, help="IPv4 ranges in the synthetic BIN")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="ms the ip-api stub waits per request")
+    parser.add_argument("--hop-latency", type=float, default=1.0, help="simulated RTT added per hop (ms)")
+    parser.add_argument("--silent-fraction", type=float, default=0.1, help="share of routers that never answer")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.quick:
+        args.traces, args.throughput_traces, args.requests = 5, 50, 50
+        args.ping_hosts, args.micro_count, args.miss_count = 500, 10000, 20
+
+    started = time.time()
+    with tempfile.TemporaryDirectory(prefix="pktpath-bench-") as workdir:
+        # Service start-up messages go to stderr, stdout is reserved for the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = asyncio.run(run_suite(args, Path(workdir)))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": started,
+            "duration": round(time.time() - started, 1),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parameters": vars(args)
+        },
+        "results": results
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
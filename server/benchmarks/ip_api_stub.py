@@ -0,0 +1,114 @@
+"""
+Local stand-in for ip-api.com: GET /json/{ip} and POST /batch answered from a deterministic record
+per IP, with an optional delay per request to mimic the round trip to the real service.
+Failures can be injected per IP (a "fail" record) or per batch (an HTTP 500 for any batch holding an IP).
+"""
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable
+
+_COUNTRIES = [("US", "United States"), ("DE", "Germany"), ("JP", "Japan"), ("BR", "Brazil"),
+              ("AU", "Australia"), ("ZA", "South Africa"), ("IN", "India"), ("GB", "United Kingdom")]
+
+
+def location_for(ip_address: str) -> Dict:
+    """The record the stub returns for ip_address, in ip-api.com's field names"""
+    seed = zlib.crc32(ip_address.encode())
+    country_code, country = _COUNTRIES[seed % len(_COUNTRIES)]
+    return {
+        "status": "success",
+        "query": ip_address,
+        "country": country,
+        "countryCode": country_code,
+        "regionName": f"Region {seed % 50}",
+        "city": f"City {seed % 1000}",
+        "zip": f"{seed % 100000:05d}",
+        "lat": (seed % 18000) / 100 - 90,
+        "lon": (seed // 18000 % 36000) / 100 - 180,
+        "timezone": "UTC",
+        "isp": f"ISP {seed % 200}"
+    }
+
+
+class IpApiStub:
+    """
+    ThreadingHTTPServer on a free loopback port; point GeolocationClient at url.
+    Keep-alive is supported, so pooled clients reuse their connections as they would with ip-api.com.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, unknown: Iterable[str] = (), broken: Iterable[str] = ()):
+        self.latency = latency_ms / 1000
+        self.unknown = set(unknown)  # IPs answered with ip-api.com's "fail" record
+        self.broken = set(broken)  # IPs whose whole batch is answered with an HTTP 500
+        self.requests = 0
+        self.batch_requests = 0
+        self.batches = []  # IPs of every batch request received, in arrival order
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, each response stalls on a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if not self.path.startswith("/json/"):
+                    self._reply(404, {"status": "fail", "message": "invalid query"})
+                    return
+                stub.requests += 1
+                self._reply(200, self._record(self.path[len("/json/"):].split("?", 1)[0]))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.split("?", 1)[0] != "/batch":
+                    self._reply(404, {"status": "fail", "message": "invalid query"})
+                    return
+                ip_addresses = json.loads(body)
+                stub.batch_requests += 1
+                stub.batches.append(ip_addresses)
+                if stub.broken.intersection(ip_addresses):
+                    self._reply(500, {"status": "fail", "message": "internal error"})
+                    return
+                self._reply(200, [self._record(ip_address) for ip_address in ip_addresses])
+
+            def _record(self, ip_address: str) -> Dict:
+                if ip_address in stub.unknown:
+                    return {"status": "fail", "message": "reserved range", "query": ip_address}
+                return location_for(ip_address)
+
+            def _reply(self, status: int, data):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                # Never tell the client to pause: the benchmarks measure our code, not ip-api.com's quota
+                self.send_header("X-Rl", "1000")
+                self.send_header("X-Ttl", "60")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        # A short poll interval keeps stop() quick for tests that start a stub each
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        name="ip-api-stub", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "IpApiStub":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
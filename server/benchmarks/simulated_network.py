@@ -0,0 +1,189 @@
+"""
+Simulated network for the benchmarks: a fake hop responder standing in for the shared probe transport.
+
+Every destination gets a deterministic path (seeded by the destination address): a few access routers
+shared by all paths, then routers of its own, some of them silent. A probe with TTL t is answered
+after hop t's RTT with a time exceeded from that router, or with an echo reply once t reaches the
+destination; probes to silent routers resolve to None at their deadline, like the real transport.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, List, Optional, Tuple
+
+from app.services.icmp_transport import IcmpTransport, ICMP_ECHO_REPLY, ICMP_TIME_EXCEEDED
+
+_SHARED_HOPS = 2  # Access routers every simulated path starts with
+# First octets with no special-purpose ranges (private, CGNAT, loopback, link-local, documentation,
+# benchmarking), so every address drawn under them is global and geolocation really looks it up
+_PUBLIC_FIRST_OCTETS = [octet for octet in range(1, 224) if octet not in (10, 100, 127, 169, 172, 192, 198, 203)]
+
+
+def public_address(random_source: random.Random) -> str:
+    """A random global unicast IPv4 address (geolocation skips private ones without a lookup)"""
+    return f"{random_source.choice(_PUBLIC_FIRST_OCTETS)}.{random_source.randrange(256)}." \
+           f"{random_source.randrange(256)}.{random_source.randrange(1, 255)}"
+
+
+def public_addresses(count: int, seed) -> List[str]:
+    """count distinct public addresses, the same ones for the same seed"""
+    random_source = random.Random(f"addresses:{seed}")
+    addresses = {}
+    while len(addresses) < count:
+        addresses[public_address(random_source)] = None
+    return list(addresses)
+
+
+class SimulatedPath:
+    """Router per TTL (None for a silent one), ending at the destination"""
+
+    __slots__ = ("destination", "routers")
+
+    def __init__(self, destination: str, routers: List[Optional[str]]):
+        self.destination = destination
+        self.routers = routers
+
+    def __len__(self) -> int:
+        return len(self.routers) + 1
+
+
+class FakeHopResponder:
+    """
+    In-process replacement for IcmpTransport: send_probe() schedules the simulated reply and a timer
+    thread resolves the future when it is due. install() makes it the shared transport, so the trace
+    engines, monitors and ping sweeps probe it unchanged.
+    """
+
+    mode = "simulated"
+
+    def __init__(self, path_length: Tuple[int, int] = (8, 16), hop_latency_ms: float = 1.0,
+                 jitter_ms: float = 0.2, silent_fraction: float = 0.1, seed: int = 0):
+        self.path_length = path_length
+        self.hop_latency_ms = hop_latency_ms
+        self.jitter_ms = jitter_ms
+        self.silent_fraction = silent_fraction
+        self.seed = seed
+        self.probes = 0
+        self.replies = 0
+
+        random_source = random.Random(seed)
+        self._shared_routers = [public_address(random_source) for _ in range(_SHARED_HOPS)]
+        self._paths: Dict[str, SimulatedPath] = {}
+        self._jitter = random.Random(seed + 1)
+        self._next_identifier = 0
+        self._order = itertools.count()
+        self._due = []  # (due time, order, future, reply or None, sent time)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._previous = None
+        self._timer = threading.Thread(target=self._timer_loop, name="fake-hop-responder", daemon=True)
+        self._timer.start()
+
+    def destinations(self, count: int, seed: int = 0) -> List[str]:
+        """count distinct destinations to trace; their paths are built now, not while probes are timed"""
+        destinations = public_addresses(count, f"destinations:{self.seed}:{seed}")
+        for destination in destinations:
+            self.path(destination)
+        return destinations
+
+    def path(self, destination: str) -> SimulatedPath:
+        """The (deterministic) path to destination"""
+        path = self._paths.get(destination)
+        if path is None:
+            random_source = random.Random(f"{self.seed}:{destination}")
+            length = random_source.randint(*self.path_length)
+            routers = list(self._shared_routers[:length - 1])
+            while len(routers) < length - 1:
+                silent = random_source.random() < self.silent_fraction
+                address = public_address(random_source)
+                routers.append(None if silent else address)
+            path = self._paths[destination] = SimulatedPath(destination, routers)
+        return path
+
+    def install(self):
+        """Make this the shared transport"""
+        self._previous = IcmpTransport._instance
+        IcmpTransport._instance = self
+
+    def uninstall(self):
+        """Restore the shared transport that was set before install()"""
+        IcmpTransport._instance = self._previous
+        self.close()
+
+    def allocate_identifier(self) -> int:
+        with self._condition:
+            self._next_identifier = (self._next_identifier + 1) & 0xffff
+            return self._next_identifier
+
+    def supports_ipv6(self) -> bool:
+        return False
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._due)
+
+    def send_probe(self, destination: str, packet: bytes, identifier: int, sequence: int,
+                   ttl: int, timeout: float) -> Future:
+        future = Future()
+        path = self.path(destination)
+        sent = time.time()
+
+        if ttl >= len(path):
+            reply = {"type": ICMP_ECHO_REPLY, "code": 0, "addr": destination}
+            ttl = len(path)
+        else:
+            router = path.routers[ttl - 1]
+            reply = {"type": ICMP_TIME_EXCEEDED, "code": 0, "addr": router} if router is not None else None
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Fake hop responder is closed")
+            self.probes += 1
+            if reply is None:
+                due = sent + timeout
+            else:
+                due = sent + (ttl * self.hop_latency_ms + self._jitter.uniform(0, self.jitter_ms)) / 1000
+            heapq.heappush(self._due, (due, next(self._order), future, reply, sent))
+            if self._due[0][2] is future:
+                self._condition.notify()
+        return future
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._timer.join(timeout=1)
+
+    def _timer_loop(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._due or self._due[0][0] > time.time()):
+                    self._condition.wait(self._due[0][0] - time.time() if self._due else None)
+                if self._closed:
+                    due = self._due
+                    self._due = []
+                else:
+                    now = time.time()
+                    due = []
+                    while self._due and self._due[0][0] <= now:
+                        due.append(heapq.heappop(self._due))
+
+            for _, _, future, reply, sent in due:
+                if reply is not None and not self._closed:
+                    received = time.time()
+                    reply = dict(reply, rtt=(received - sent) * 1000, time_received=received, family=4)
+                    self.replies += 1
+                else:
+                    reply = None
+                try:
+                    if not future.done():
+                        future.set_result(reply)
+                except InvalidStateError:
+                    # Cancelled by the engine between the check and the set
+                    pass
+
+            if self._closed:
+                return
@@ -0,0 +1,60 @@
+"""
+Synthetic IP2Location DB5 (country, region, city, latitude, longitude) BIN file for the benchmarks.
+
+The IPv4 space is cut into equal ranges with deterministic records, written in the layout the
+IP2Location library and IpRangeIndex.build read: a 64-byte header, fixed-width rows sorted by range
+start (the last one a 255.255.255.255 terminator), then length-prefixed ISO-8859-1 strings the rows
+point at. No IPv6 section and no /16 index, so the library binary-searches every IPv4 lookup.
+"""
+import random
+import struct
+from pathlib import Path
+
+_DB5 = 5
+_DB5_COLUMNS = 6  # Range start, country, region, city, latitude, longitude
+_HEADER = struct.Struct("<BBBBBIIIIIIBBB")
+_HEADER_SIZE = 64
+_ROW = struct.Struct("<IIIIff")
+_MAX_IPV4 = 0xFFFFFFFF
+
+_COUNTRIES = [("US", "United States"), ("DE", "Germany"), ("JP", "Japan"), ("BR", "Brazil"),
+              ("AU", "Australia"), ("ZA", "South Africa"), ("IN", "India"), ("GB", "United Kingdom"),
+              ("FR", "France"), ("CA", "Canada"), ("SG", "Singapore"), ("NL", "Netherlands")]
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode("iso-8859-1")
+    return bytes([len(encoded)]) + encoded
+
+
+def write_bin(path, rows: int = 100000, seed: int = 0, cities: int = 5000) -> Path:
+    """Write a DB5 BIN with rows IPv4 ranges to path and return the path"""
+    path = Path(path)
+    random_source = random.Random(seed)
+    # Rows, the terminator and two rows of padding the library may read past the terminator
+    strings_offset = _HEADER_SIZE + (rows + 3) * _ROW.size
+    strings = bytearray()
+
+    def add(data: bytes) -> int:
+        pointer = strings_offset + len(strings)
+        strings.extend(data)
+        return pointer
+
+    # A country entry is its code followed directly by its name; rows point at the code
+    countries = [add(_string(code) + _string(name)) for code, name in _COUNTRIES]
+    regions = [add(_string(f"Region {index}")) for index in range(max(1, cities // 20))]
+    city_names = [add(_string(f"City {index}")) for index in range(cities)]
+
+    body = bytearray()
+    step = (_MAX_IPV4 + 1) // rows
+    for row in range(rows):
+        body += _ROW.pack(row * step, random_source.choice(countries), random_source.choice(regions),
+                          random_source.choice(city_names), random_source.uniform(-90, 90),
+                          random_source.uniform(-180, 180))
+    for _ in range(3):
+        body += _ROW.pack(_MAX_IPV4, countries[0], regions[0], city_names[0], 0.0, 0.0)
+
+    # Product code 1 (IP2Location), dated 2024-01-01; base addresses are 1-based
+    header = _HEADER.pack(_DB5, _DB5_COLUMNS, 24, 1, 1, rows + 1, _HEADER_SIZE + 1, 0, 0, 0, 0, 1, 1, 0)
+    path.write_bytes(header.ljust(_HEADER_SIZE, b"\0") + bytes(body) + bytes(strings))
+    return path
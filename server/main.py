@@ -1,8 +1,10 @@
 # Entry point for the server/FastAPI application
 
 from app.core.app import app
-from app.api.routes import traceroute
+from app.api.routes import traceroute, monitor, metrics, ping
+from app.core.config import settings
 from app.services.geolocation_service import GeolocationService
+from app.services.hop_metrics_service import HopMetricsService
 
 # Initialize geolocation service
 try:
@@ -11,8 +13,15 @@ try:
 except Exception as e:
     print(f"Failed to initialize geolocation service: {e}")
 
+# Hop RTT history (opt-in)
+if settings.hop_metrics_enabled:
+    HopMetricsService.initialize()
+
 # Include routers
 app.include_router(traceroute.router, prefix="/api/v1")
+app.include_router(monitor.router, prefix="/api/v1")
+app.include_router(metrics.router, prefix="/api/v1")
+app.include_router(ping.router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
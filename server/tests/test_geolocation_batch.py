@@ -0,0 +1,136 @@
+"""
+Batched ip-api.com resolution (GeolocationService.get_locations / get_locations_async) against the
+loopback IpApiStub: chunking at 100 IPs, partial failures and private-IP filtering.
+
+Run from server/:  python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.cache import TTLCache
+from app.services.geolocation_client import GeolocationClient
+from app.services.geolocation_service import GeolocationService
+from benchmarks.ip_api_stub import IpApiStub, location_for
+from benchmarks.simulated_network import public_addresses
+
+PRIVATE_IPS = ["10.1.2.3", "192.168.0.1", "172.16.5.4", "127.0.0.1", "169.254.1.1", "fe80::1",
+               "fd00::1", "::ffff:10.0.0.1"]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """A running IpApiStub behind a fresh cache, with the database and persistent tier switched off"""
+    stub = IpApiStub().start()
+    client = GeolocationClient(stub.url, requests_per_minute=60000, batch_requests_per_minute=60000,
+                               max_concurrency=4)
+    monkeypatch.setattr(GeolocationService, "_api_client", client)
+    monkeypatch.setattr(GeolocationService, "_cache", TTLCache(maxsize=10000, ttl=60))
+    monkeypatch.setattr(GeolocationService, "_database", None)
+    monkeypatch.setattr(GeolocationService, "_index", None)
+    monkeypatch.setattr(GeolocationService, "_store", None)
+    monkeypatch.setattr(settings, "geolocation_policy", "api-first")
+    yield stub
+    client.close()
+    stub.stop()
+
+
+def get_locations(ip_addresses, use_async):
+    if use_async:
+        return asyncio.run(GeolocationService.get_locations_async(ip_addresses))
+    return GeolocationService.get_locations(ip_addresses)
+
+
+def assert_from_api(location, ip_address):
+    expected = location_for(ip_address)
+    assert location["source"] == "ip-api"
+    assert location["city"] == expected["city"]
+    assert location["country_code"] == expected["countryCode"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("count, sizes", [(1, [1]), (100, [100]), (101, [100, 1]), (250, [100, 100, 50])])
+def test_misses_are_chunked_at_100_ips(stub, use_async, count, sizes):
+    ip_addresses = public_addresses(count, seed="chunking")
+
+    locations = get_locations(ip_addresses, use_async)
+
+    assert sorted(len(batch) for batch in stub.batches) == sorted(sizes)
+    assert sorted(ip for batch in stub.batches for ip in batch) == sorted(ip_addresses)
+    assert stub.requests == 0
+    for ip_address in ip_addresses:
+        assert_from_api(locations[ip_address], ip_address)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_duplicates_and_cache_hits_are_not_requested(stub, use_async):
+    ip_addresses = public_addresses(20, seed="duplicates")
+    get_locations(ip_addresses[:10], use_async)
+
+    locations = get_locations(ip_addresses + ip_addresses, use_async)
+
+    assert [len(batch) for batch in stub.batches] == [10, 10]
+    assert sorted(stub.batches[1]) == sorted(ip_addresses[10:])
+    assert len(locations) == 20
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_ips_the_api_cannot_locate_fail_alone(stub, use_async):
+    ip_addresses = public_addresses(150, seed="unknown")
+    stub.unknown.update(ip_addresses[::7])
+
+    locations = get_locations(ip_addresses, use_async)
+
+    for ip_address in ip_addresses:
+        if ip_address in stub.unknown:
+            assert locations[ip_address]["source"] == "both-sources-failed"
+        else:
+            assert_from_api(locations[ip_address], ip_address)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_failed_batch_does_not_affect_the_others(stub, use_async):
+    ip_addresses = public_addresses(250, seed="broken")
+    stub.broken.add(ip_addresses[150])
+
+    locations = get_locations(ip_addresses, use_async)
+
+    assert len(stub.batches) == 3
+    for index, ip_address in enumerate(ip_addresses):
+        if 100 <= index < 200:
+            assert locations[ip_address]["source"] == "both-sources-failed"
+        else:
+            assert_from_api(locations[ip_address], ip_address)
+
+
+def test_failed_lookups_are_cached_briefly(stub):
+    ip_addresses = public_addresses(3, seed="negative")
+    stub.unknown.add(ip_addresses[0])
+
+    GeolocationService.get_locations(ip_addresses)
+
+    cache = GeolocationService._cache
+    assert cache.ttl_for(GeolocationService.peek_location(ip_addresses[0])) == cache.negative_ttl
+    assert cache.ttl_for(GeolocationService.peek_location(ip_addresses[1])) == cache.ttl
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_private_ips_are_never_sent(stub, use_async):
+    public = public_addresses(5, seed="private")
+
+    locations = get_locations(PRIVATE_IPS + public, use_async)
+
+    assert [sorted(batch) for batch in stub.batches] == [sorted(public)]
+    for ip_address in PRIVATE_IPS:
+        assert locations[ip_address]["source"] == "private-ip"
+    for ip_address in public:
+        assert_from_api(locations[ip_address], ip_address)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_only_private_ips_make_no_request(stub, use_async):
+    locations = get_locations(PRIVATE_IPS, use_async)
+
+    assert stub.batches == []
+    assert set(locations) == set(PRIVATE_IPS)